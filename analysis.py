@@ -1,59 +1,106 @@
 #imports
 
-import pandas as pd
-from scipy.stats import ttest_rel, ttest_ind
-from sklearn.linear_model import LinearRegression
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
-import data
+# scipy, sklearn and matplotlib are imported inside the functions that need them,
+# so loading data or running the numeric analyses doesn't pay for them
 
-def correlateDietToWorkout(workout_data, dietary_data):
-    combined_data = pd.merge(workout_data, dietary_data, on='Date', how='inner')
-    correlation_matrix = combined_data[['Total Volume', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']].corr()
+import pandas as pd
+import numpy as np
+import visualization
+import regression
+import loadmetrics
+import changepoint
+import inference
+from memo import memoize
+from profiling import instrument
+from dataset import CombinedDataset, combine
+from ratios import STRENGTH_RATIOS, UNKNOWN_POLICIES, RatioRegistry, default_registry, standardize_weights
+
+CORRELATION_COLUMNS = ['Total Volume', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+
+
+@instrument
+@memoize
+def correlateDietToWorkout(workout_data, dietary_data=None, load_features=False):
+    # workout_data can also be a CombinedDataset, then dietary_data isn't needed
+    # load_features=True adds the rolling 7/28 day volume, ACWR and e1RM from loadmetrics
+    combined_data = combine(workout_data, dietary_data)
+    columns = CORRELATION_COLUMNS
+    if load_features:
+        workout = workout_data.workout if isinstance(workout_data, CombinedDataset) else workout_data
+        combined_data = loadmetrics.addLoadFeatures(combined_data, workout)
+        columns = columns + loadmetrics.LOAD_FEATURES
+    correlation_matrix = combined_data[columns].corr()
 
     return correlation_matrix
 
 
-def predictPerformance(workout_data, dietary_data):
-    # merge data along date
-    combined_data = pd.merge(workout_data, dietary_data, on='Date', how='inner')
+@instrument
+@memoize
+def correlationInference(workout_data, dietary_data=None, resamples=2000, permutations=2000, alpha=0.05, seed=0, workers=None):
+    # the correlateDietToWorkout pairs with bootstrap confidence intervals and permutation p-values
+    combined_data = combine(workout_data, dietary_data)
+    return inference.bootstrapCorrelation(combined_data[CORRELATION_COLUMNS], resamples, permutations, alpha, seed, workers)
 
 
+@instrument
+@memoize
+def performanceModel(workout_data, dietary_data=None, alpha=0.05):
+    # fits total volume against calories and returns the numbers, no plotting
+    # merge data along date
+    combined_data = combine(workout_data, dietary_data)
+
     X = combined_data[['Calories']].values.reshape(-1, 1)  # Features
     y = combined_data['Total Volume']                      # Target
 
-    model = LinearRegression()
-    model.fit(X, y)
-    predictions = model.predict(X)
+    fit = regression.fitOLS(X, y)
 
     # extend the calorie range by simulating a month of future data
     max_calories = combined_data['Calories'].max()
-    future_calories = pd.DataFrame({'Calories': range(int(max_calories + 1), int(max_calories + 1000), 50)})
-    future_predictions = model.predict(future_calories)
-
-
-    plt.figure(figsize=(10, 6))
-    plt.scatter(X, y, color='blue', label='Actual data')
-    plt.plot(X, predictions, color='red', label='Prediction')
-
-    # give future predictions
-    plt.plot(future_calories, future_predictions, color='red', linestyle='--', label='Future Predictions')
+    future_calories = np.arange(int(max_calories + 1), int(max_calories + 1000), 50).reshape(-1, 1)
+    future_predictions, lower, upper = fit.interval(future_calories, alpha)
+
+    return {
+        'model': fit,
+        'Intercept': fit.intercept[0],
+        'Calories Coefficient': fit.coef[0, 0],
+        'Calories SE': fit.stderr[0, 0],
+        'Score': fit.r2[0],
+        'Calories': X.ravel(),
+        'Total Volume': y.to_numpy(),
+        'Predictions': fit.predict(X)[0],
+        'Future Calories': future_calories.ravel(),
+        'Future Predictions': future_predictions[0],
+        'Future Lower': lower[0],
+        'Future Upper': upper[0],
+    }
 
 
+@instrument
+def predictPerformance(workout_data, dietary_data=None):
+    import matplotlib.pyplot as plt
+    from sklearn.linear_model import LinearRegression
+    performance = performanceModel(workout_data, dietary_data)
 
-    plt.title('Linear Regression to Predict Total Volume from Calories')
-    plt.xlabel('Calories')
-    plt.ylabel('Total Volume')
-    plt.legend()
-    plt.grid(True)
+    fig = plt.figure(figsize=visualization.FIGSIZES['performance'])
+    visualization.drawPerformance(fig, performance)
     plt.show()
 
-    # return the model for later 
+    # return the model for later, as a fitted sklearn LinearRegression so old callers keep working
+    fit = performance['model']
+    model = LinearRegression()
+    model.coef_ = fit.coef[0]
+    model.intercept_ = fit.intercept[0]
+    model.n_features_in_ = fit.coef.shape[1]
     return model
 
 
+@instrument
+@memoize
 def dietEffectiveness(before_data, after_data):
+    # a CombinedDataset and an intervention date work too, the split is a binary search on the dates
+    if isinstance(before_data, CombinedDataset):
+        before_data, after_data = before_data.split(pd.to_datetime(after_data))
+
     # drops the NA values which became an issue
     before_data = before_data['Total Volume'].dropna()
     after_data = after_data['Total Volume'].dropna()
@@ -63,11 +110,35 @@ def dietEffectiveness(before_data, after_data):
         return {'T-statistic': 'N/A', 'P-value': 'N/A'}
 
     # perform statistic tests
+    from scipy.stats import ttest_ind
     t_stat, p_value = ttest_ind(after_data, before_data, equal_var=False)  # unequal variances
 
     return {'T-statistic': t_stat, 'P-value': p_value}
-def AlignDataforNutrition(dietary_data, workout_data):
+
+
+@instrument
+@memoize
+def dietEffectivenessScan(workout_data, dietary_data=None, candidates='all', correction='holm', alpha=0.05, min_size=5):
+    # dietEffectiveness at every candidate intervention date at once, ranked by corrected p-value
+    # candidates is 'all' (every training day), 'changepoints' (where calories shift) or a list of dates
+    combined_data = combine(workout_data, dietary_data)
+    if isinstance(candidates, str):
+        if candidates == 'changepoints':
+            diet = workout_data.diet if isinstance(workout_data, CombinedDataset) else dietary_data
+            candidates = changepoint.changepoints(diet)['Date']
+        elif candidates == 'all':
+            candidates = None
+        else:
+            raise ValueError(f"candidates must be 'all', 'changepoints' or a list of dates, got {candidates!r}")
+    return changepoint.scanSplits(combined_data, 'Total Volume', candidates, min_size, correction, alpha)
+@instrument
+def AlignDataforNutrition(dietary_data, workout_data=None):
     #this aligns the workout data with the dietary data as having the nutrition the day previous to the workout
+    if isinstance(dietary_data, CombinedDataset):
+        return dietary_data.join(lag=1)
+    # shallow copies, the caller's frames don't get the parsed dates or Prev_Date
+    dietary_data = dietary_data.copy(deep=False)
+    workout_data = workout_data.copy(deep=False)
     dietary_data['Date'] = pd.to_datetime(dietary_data['Date'])
     workout_data['Date'] = pd.to_datetime(workout_data['Date'])
     dietary_data['Prev_Date'] = dietary_data['Date'] + pd.Timedelta(days=1)
@@ -76,40 +147,65 @@ def AlignDataforNutrition(dietary_data, workout_data):
     #this aligns the workout data with the dietary data as having the nutrition the day previous to the workout
 
 
-def standardize_weights(workout_data):
-    # Using standard ratios to ensure that effort is the same across lifts using the 3:4:5 rule
-    strength_ratios = {
-        'Bench Press': 3,  
-        'Squat': 4,       
-        'Deadlift': 4.5     
-    }
+NUTRITION_FEATURES = ['Protein (g)', 'Carbs (g)', 'Fats (g)', 'Calories']
+NUTRITION_RESULTS = ['Intercept', 'Protein Coefficient', 'Carbs Coefficient', 'Fats Coefficient', 'Calories Coefficient',
+                     'Score', 'Intercept SE', 'Protein SE', 'Carbs SE', 'Fats SE', 'Calories SE']
 
-    workout_data['Weight (kg)_std'] = 0  # create column
 
-    # apply ratios 
-    for index, row in workout_data.iterrows():
-        exercise = row['Exercise']
-        weight = row['Weight (kg)']
-        ratio = strength_ratios[exercise]
-        standardized_weight = weight / ratio
-        workout_data.at[index, 'Weight (kg)_std'] = standardized_weight
+def _nutrition_result(fit, group=0):
+    return { #dictionary of different values 
+        'Intercept': fit.intercept[group],
+        'Protein Coefficient': fit.coef[group, 0],
+        'Carbs Coefficient': fit.coef[group, 1],
+        'Fats Coefficient': fit.coef[group, 2],
+        'Calories Coefficient': fit.coef[group, 3],
+        'Score': fit.r2[group],
+        # standard errors are NaN when there are too few days for the four macros
+        'Intercept SE': fit.intercept_stderr[group],
+        'Protein SE': fit.stderr[group, 0],
+        'Carbs SE': fit.stderr[group, 1],
+        'Fats SE': fit.stderr[group, 2],
+        'Calories SE': fit.stderr[group, 3],
+    }
 
-    return workout_data
 
+@instrument
+@memoize
 def nutritionAnalysis(combined_data, exercise):
 #this relates the nutrition (macros) with the weight performed for an exercise
+    if isinstance(combined_data, CombinedDataset):
+        # nutrition from the day before, same as AlignDataforNutrition
+        combined_data = combined_data.join(lag=1)
     exercise_data = combined_data[combined_data['Exercise'] == exercise]
-    X = exercise_data[['Protein (g)', 'Carbs (g)', 'Fats (g)', 'Calories']]
+    X = exercise_data[NUTRITION_FEATURES]
     y = exercise_data['Weight (kg)_std']
-    model = LinearRegression()
-    model.fit(X, y)
-    return { #dictionary of different values 
-        'Intercept': model.intercept_,
-        'Protein Coefficient': model.coef_[0],
-        'Carbs Coefficient': model.coef_[1],
-        'Fats Coefficient': model.coef_[2],
-        'Calories Coefficient': model.coef_[3],
-        'Score': model.score(X, y)
-    }
+    return _nutrition_result(regression.fitOLS(X, y))
+
+
+@instrument
+@memoize
+def nutritionInference(combined_data, exercise, resamples=2000, permutations=2000, alpha=0.05, seed=0, workers=None):
+    # nutritionAnalysis coefficients with bootstrap intervals and permutation p-values, one row per term
+    if isinstance(combined_data, CombinedDataset):
+        combined_data = combined_data.join(lag=1)
+    exercise_data = combined_data[combined_data['Exercise'] == exercise]
+    names = [feature.replace(' (g)', '') for feature in NUTRITION_FEATURES]
+    return inference.bootstrapRegression(exercise_data[NUTRITION_FEATURES], exercise_data['Weight (kg)_std'], names,
+                                         resamples, permutations, alpha, seed, workers)
+
+
+@instrument
+@memoize
+def nutritionAnalysisAll(combined_data, min_rows=2):
+    # nutritionAnalysis for every exercise at once, one row per exercise from a single batched fit
+    if isinstance(combined_data, CombinedDataset):
+        combined_data = combined_data.join(lag=1)
+    counts = combined_data['Exercise'].value_counts()
+    enough = combined_data[combined_data['Exercise'].isin(counts.index[counts >= min_rows])]
+    if enough.empty:
+        return pd.DataFrame(columns=NUTRITION_RESULTS, index=pd.Index([], name='Exercise'))
+    exercises, fit = regression.fitGroups(enough, NUTRITION_FEATURES, 'Weight (kg)_std', 'Exercise')
+    rows = [_nutrition_result(fit, group) for group in range(len(exercises))]
+    return pd.DataFrame(rows, index=pd.Index(exercises, name='Exercise'))
 
 # def analyze_data(workout_data, dietary_data, selected_exercise):
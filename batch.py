@@ -0,0 +1,145 @@
+# batch runner: the load -> process -> analysis pipeline for many athletes across a process pool
+# one row per athlete in the results table, a failing athlete only fails its own row
+
+import os
+import re
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+import data
+import analysis
+from dataset import CombinedDataset
+
+# <athlete>_workout.xlsx / <athlete>_diet.xlsx, or workout.xlsx / diet.xlsx inside a folder named after the athlete
+FILE_PATTERN = re.compile(r'^(?:(?P<athlete>.+?)[_-])?(?P<kind>workout|dietary|diet)\.(?:xlsx|xls)$', re.IGNORECASE)
+MACROS = ['Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+
+
+def discoverAthletes(directory):
+    # pair up workout and diet files found under directory
+    pairs = {}
+    for folder, _, files in os.walk(directory):
+        for name in sorted(files):
+            match = FILE_PATTERN.match(name)
+            if not match:
+                continue
+            athlete = match.group('athlete') or os.path.basename(folder)
+            kind = 'Workout' if match.group('kind').lower() == 'workout' else 'Diet'
+            pairs.setdefault(athlete, {'Athlete': athlete})[kind] = os.path.join(folder, name)
+    return [job for _, job in sorted(pairs.items())]
+
+
+def readManifest(path):
+    # csv with Athlete, Workout and Diet columns and an optional Intervention Date
+    manifest = pd.read_csv(path)
+    missing = {'Athlete', 'Workout', 'Diet'} - set(manifest.columns)
+    if missing:
+        raise ValueError(f"manifest {path!r} is missing columns {sorted(missing)}")
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for job in manifest.to_dict('records'):
+        for kind in ('Workout', 'Diet'):
+            job[kind] = os.path.join(base, job[kind])
+        if pd.isna(job.get('Intervention Date')):
+            job.pop('Intervention Date', None)
+        jobs.append(job)
+    return jobs
+
+
+def collectJobs(source):
+    return discoverAthletes(source) if os.path.isdir(source) else readManifest(source)
+
+
+def analyzeAthlete(workout_data, dietary_data, intervention_date=None):
+    # flat dict of every analysis result for one athlete
+    dataset = CombinedDataset(workout_data, dietary_data)
+    result = {'Sessions': len(dataset.workout), 'Days Logged': len(dataset.diet),
+              'Matched Rows': len(dataset.combined)}
+
+    correlation = analysis.correlateDietToWorkout(dataset)
+    for macro in MACROS:
+        result[f'Volume vs {macro} r'] = correlation.loc['Total Volume', macro]
+
+    # every exercise is fit in one batched regression
+    nutrition = analysis.nutritionAnalysisAll(dataset)
+    for exercise, row in nutrition.iterrows():
+        for name, value in row.items():
+            result[f'{exercise} {name}'] = value
+
+    if intervention_date is not None:
+        effectiveness = analysis.dietEffectiveness(dataset, intervention_date)
+        result['Diet T-statistic'] = effectiveness['T-statistic']
+        result['Diet P-value'] = effectiveness['P-value']
+    return result
+
+
+def runAthlete(job):
+    # runs inside a worker, so every failure is caught and reported in the athlete's row
+    row = {'Athlete': job['Athlete']}
+    try:
+        if 'Workout' not in job or 'Diet' not in job:
+            raise FileNotFoundError('missing a workout or diet file')
+        # named, so a training store keeps every athlete's rows apart
+        workout_data = data.processWorkout(data.loadWorkout(job['Workout'], athlete=job['Athlete']))
+        dietary_data = data.processDietary(data.loadDietary(job['Diet'], athlete=job['Athlete']))
+        row.update(analyzeAthlete(workout_data, dietary_data, job.get('Intervention Date')))
+        row['Status'] = 'ok'
+    except Exception as error:
+        row['Status'] = 'error'
+        row['Error'] = f'{type(error).__name__}: {error}'
+        row['Traceback'] = traceback.format_exc()
+    return row
+
+
+def runBatch(jobs, workers=None, output=None):
+    # workers=1 runs everything in this process, handy for debugging
+    if workers == 1:
+        rows = [runAthlete(job) for job in jobs]
+    else:
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(runAthlete, job): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    rows.append(future.result())
+                except Exception as error:  # the worker itself died
+                    rows.append({'Athlete': futures[future]['Athlete'], 'Status': 'error',
+                                 'Error': f'{type(error).__name__}: {error}'})
+    results = pd.DataFrame(rows)
+    if not results.empty:
+        results = results.sort_values('Athlete', kind='stable', ignore_index=True)
+    if output:
+        writeResults(results, output)
+    return results
+
+
+def writeResults(results, output):
+    if output.lower().endswith(('.xlsx', '.xls')):
+        results.to_excel(output, index=False)
+    else:
+        results.to_csv(output, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the OptiLift analyses for many athletes.')
+    parser.add_argument('source', help='directory of athlete files or a manifest csv')
+    parser.add_argument('-o', '--output', default='optilift_results.csv', help='results table (.csv or .xlsx)')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: one per cpu)')
+    parser.add_argument('--export', help='also export every athlete\'s processed frames and analysis tables '
+                                         'here (.xlsx, or a directory for csv/parquet)')
+    parser.add_argument('--export-format', choices=['csv', 'parquet', 'xlsx'], help='default: from --export')
+    args = parser.parse_args(argv)
+
+    results = runBatch(collectJobs(args.source), workers=args.workers, output=args.output)
+    failed = int((results['Status'] == 'error').sum()) if not results.empty else 0
+    print(f'{len(results)} athletes, {failed} failed, results written to {args.output}')
+    if args.export:
+        import export
+        rows, _ = export.exportAthletes(collectJobs(args.source), args.export, args.export_format, args.workers)
+        print(', '.join(f'{sheet}: {count} rows' for sheet, count in rows.items()) + f' exported to {args.export}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
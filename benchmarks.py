@@ -0,0 +1,227 @@
+# performance benchmarks, kept out of unittests.py because they are slow and machine dependent
+# run with: python -m pytest benchmarks.py   (or python benchmarks.py for a quick printout)
+#
+# the pipeline benchmarks use pytest-benchmark and synthetic data (synthetic.py):
+#   save a baseline     python -m pytest benchmarks.py --benchmark-autosave
+#   compare against it  python -m pytest benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:20%
+# peak memory is tracked next to the timings in benchmark_memory.json:
+#   OPTILIFT_BENCH_SAVE_MEMORY=1 stores the peaks, later runs fail if one grows past MEMORY_TOLERANCE
+# sizes come from OPTILIFT_BENCH_SIZES, e.g. OPTILIFT_BENCH_SIZES=10000,1000000,10000000
+
+import os
+import sys
+import json
+import functools
+import importlib.util
+import tempfile
+import tracemalloc
+import subprocess
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# modules that must stay out of a plain data load or a non-plotting cli command
+HEAVY_MODULES = ['scipy', 'sklearn', 'matplotlib', 'seaborn']
+IMPORT_BUDGET_SECONDS = 1.0
+
+
+def import_time(statement, repeat=3):
+    # best of `repeat` fresh interpreters, so earlier imports can't hide the cost
+    script = (
+        'import sys, time, json\n'
+        't = time.perf_counter()\n'
+        f'{statement}\n'
+        'elapsed = time.perf_counter() - t\n'
+        f'print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n'
+    )
+    best, loaded = None, None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=HERE, capture_output=True, text=True, check=True)
+        elapsed, loaded = json.loads(output.stdout.strip().splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+    return best, loaded
+
+
+@pytest.mark.parametrize('statement', ['import data', 'import analysis', 'import optilift'])
+def test_import_time(statement):
+    elapsed, loaded = import_time(statement)
+    print(f'{statement}: {elapsed:.3f}s')
+    assert loaded == [], f'{statement} pulled in {loaded}'
+    assert elapsed < IMPORT_BUDGET_SECONDS, f'{statement} took {elapsed:.2f}s'
+
+
+def test_cli_startup():
+    # the whole `python -m optilift --help` round trip, interpreter start included
+    import time
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'optilift', '--help'], cwd=HERE, capture_output=True, check=True)
+    elapsed = time.perf_counter() - start
+    assert elapsed < IMPORT_BUDGET_SECONDS + 0.5, f'cli startup took {elapsed:.2f}s'
+
+
+# --- pipeline benchmarks ---
+
+needs_benchmark = pytest.mark.skipif(importlib.util.find_spec('pytest_benchmark') is None,
+                                     reason='pytest-benchmark is not installed')
+
+SIZES = [int(size) for size in os.environ.get('OPTILIFT_BENCH_SIZES', '10000,100000').split(',')]
+# writing and parsing excel is slow enough that the load benchmarks stop here
+EXCEL_SIZE_LIMIT = 20000
+MEMORY_BASELINE = os.path.join(HERE, 'benchmark_memory.json')
+MEMORY_TOLERANCE = 1.25
+
+
+@functools.lru_cache(maxsize=None)
+def pair(size):
+    import synthetic
+    return synthetic.generatePair(size, athletes=max(1, size // 100000), seed=size)
+
+
+@functools.lru_cache(maxsize=None)
+def processed(size):
+    import data
+    workout, dietary = pair(size)
+    return data.processWorkout(workout), data.processDietary(dietary)
+
+
+@functools.lru_cache(maxsize=None)
+def combined(size):
+    import pandas as pd
+    workout, dietary = processed(size)
+    return pd.merge(workout, dietary, on='Date', how='inner')
+
+
+@functools.lru_cache(maxsize=None)
+def rollups(size):
+    import downsample
+    workout, dietary = processed(size)
+    return downsample.Rollups().updateWorkout(workout).updateDietary(dietary)
+
+
+def midpoint(size):
+    workout, _ = processed(size)
+    return workout['Date'].min() + (workout['Date'].max() - workout['Date'].min()) / 2
+
+
+@functools.lru_cache(maxsize=None)
+def excel_files(size):
+    import synthetic
+    workout, dietary = pair(size)
+    directory = tempfile.mkdtemp(prefix='optilift-bench-')
+    return (synthetic.writeExcel(workout, os.path.join(directory, 'workout.xlsx')),
+            synthetic.writeExcel(dietary, os.path.join(directory, 'diet.xlsx')))
+
+
+def peak_memory(function, *args):
+    # peak python + numpy allocations for one call, in MB
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def check_memory(name, peak):
+    baselines = {}
+    if os.path.exists(MEMORY_BASELINE):
+        with open(MEMORY_BASELINE) as handle:
+            baselines = json.load(handle)
+    if os.environ.get('OPTILIFT_BENCH_SAVE_MEMORY'):
+        baselines[name] = peak
+        with open(MEMORY_BASELINE, 'w') as handle:
+            json.dump(baselines, handle, indent=2, sort_keys=True)
+    elif name in baselines:
+        assert peak <= baselines[name] * MEMORY_TOLERANCE, f'{name} peak memory {peak:.1f}MB, baseline {baselines[name]:.1f}MB'
+
+
+@pytest.fixture(autouse=True)
+def no_memo():
+    # the memoized analyses would otherwise time a cache lookup instead of the analysis
+    import memo
+    previous, memo.results = memo.results, None
+    yield
+    memo.results = previous
+
+
+def run(benchmark, name, function, *args):
+    # time with pytest-benchmark, then record the peak memory of a single extra call
+    benchmark.extra_info['peak_mb'] = peak = peak_memory(function, *args)
+    check_memory(f'{name}[{benchmark.extra_info["size"]}]', peak)
+    return benchmark.pedantic(function, args=args, rounds=3, iterations=1, warmup_rounds=0)
+
+
+def stage_call(name):
+    # (callable, args builder) for every public function, args are built from the cached synthetic data
+    # no stage modifies its input, so the cached inputs are passed straight in
+    import data
+    import analysis
+    import visualization
+    import downsample
+    from dataset import CombinedDataset
+
+    stages = {
+        'data.loadWorkout': (data.loadWorkout, lambda size: (excel_files(size)[0], False)),
+        'data.loadDietary': (data.loadDietary, lambda size: (excel_files(size)[1], False)),
+        'data.processWorkout': (data.processWorkout, lambda size: (pair(size)[0],)),
+        'data.processDietary': (data.processDietary, lambda size: (pair(size)[1],)),
+        'data.ProcessDietaryChange': (data.ProcessDietaryChange, lambda size: processed(size) + (midpoint(size),)),
+        'analysis.standardize_weights': (analysis.standardize_weights, lambda size: (pair(size)[0],)),
+        'analysis.correlateDietToWorkout': (analysis.correlateDietToWorkout, lambda size: processed(size)),
+        'analysis.performanceModel': (analysis.performanceModel, lambda size: processed(size)),
+        'analysis.dietEffectiveness': (analysis.dietEffectiveness, lambda size: data.ProcessDietaryChange(*processed(size), midpoint(size))),
+        'analysis.AlignDataforNutrition': (analysis.AlignDataforNutrition, lambda size: processed(size)[::-1]),
+        'analysis.nutritionAnalysis': (analysis.nutritionAnalysis, lambda size: (combined(size), 'Squat')),
+        'analysis.nutritionAnalysisAll': (analysis.nutritionAnalysisAll, lambda size: (combined(size),)),
+        'analysis.dietEffectivenessScan': (analysis.dietEffectivenessScan, lambda size: processed(size)),
+        # fewer resamples than the defaults keep the inference stages in step with the others
+        'analysis.correlationInference': (lambda workout, dietary: analysis.correlationInference(workout, dietary, 200, 200),
+                                          lambda size: processed(size)),
+        'analysis.nutritionInference': (lambda dataset, exercise: analysis.nutritionInference(dataset, exercise, 200, 200),
+                                        lambda size: (combined(size), 'Squat')),
+        'dataset.CombinedDataset': (lambda workout, dietary: CombinedDataset(workout, dietary).join(lag=1), lambda size: processed(size)),
+        'visualization.macroMeans': (visualization.macroMeans, lambda size: (combined(size),)),
+        'visualization.gainsSeries': (visualization.gainsSeries, lambda size: (processed(size)[0],)),
+        'visualization.currentLift': (visualization.currentLift, lambda size: (combined(size), 'Squat')),
+        'visualization.forecastSeries': (visualization.forecastSeries, lambda size: (combined(size), 'Squat', 5)),
+        'downsample.Rollups': (lambda workout, dietary: downsample.Rollups().updateWorkout(workout).updateDietary(dietary),
+                               lambda size: processed(size)),
+        # the gui's charts read the training log's rollups instead of the frames
+        'rollups.macroMeans': (visualization.macroMeans, lambda size: (rollups(size),)),
+        'rollups.gainsSeries': (visualization.gainsSeries, lambda size: (rollups(size),)),
+        'rollups.currentLift': (visualization.currentLift, lambda size: (rollups(size), 'Squat')),
+    }
+    return stages[name]
+
+
+STAGES = [
+    'data.loadWorkout', 'data.loadDietary', 'data.processWorkout', 'data.processDietary', 'data.ProcessDietaryChange',
+    'analysis.standardize_weights', 'analysis.correlateDietToWorkout', 'analysis.performanceModel',
+    'analysis.dietEffectiveness', 'analysis.AlignDataforNutrition', 'analysis.nutritionAnalysis',
+    'analysis.nutritionAnalysisAll', 'analysis.dietEffectivenessScan', 'analysis.correlationInference',
+    'analysis.nutritionInference', 'dataset.CombinedDataset', 'visualization.macroMeans',
+    'visualization.gainsSeries', 'visualization.currentLift', 'visualization.forecastSeries', 'downsample.Rollups',
+    'rollups.macroMeans', 'rollups.gainsSeries', 'rollups.currentLift',
+]
+
+
+@needs_benchmark
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('stage', STAGES)
+def test_pipeline(benchmark, stage, size):
+    if stage.startswith('data.load') and size > EXCEL_SIZE_LIMIT:
+        pytest.skip('excel round trip is limited to small sizes')
+    function, build_args = stage_call(stage)
+    args = build_args(size)
+    benchmark.group = stage
+    benchmark.extra_info['size'] = size
+    run(benchmark, stage, function, *args)
+
+
+if __name__ == '__main__':
+    for statement in ['import data', 'import analysis', 'import visualization', 'import optilift', 'import gui']:
+        try:
+            elapsed, loaded = import_time(statement)
+            print(f'{statement:25s} {elapsed:6.3f}s  heavy: {", ".join(loaded) or "-"}')
+        except subprocess.CalledProcessError as error:
+            print(f'{statement:25s} failed: {error.stderr.strip().splitlines()[-1]}')
@@ -0,0 +1,146 @@
+# on-disk cache of parsed workout/dietary frames so excel only gets parsed once
+# entries are keyed by the source path and checked against its mtime, size and content hash
+
+import os
+import json
+import hashlib
+import importlib.util
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# bump when the cached frames change shape (e.g. a new schema) so old entries are reparsed
+CACHE_VERSION = 2
+
+# feather needs pyarrow, which is only imported once a cached frame is actually read
+FORMAT = 'feather' if importlib.util.find_spec('pyarrow') is not None else 'pickle'
+
+
+def file_hash(path, block_size=1 << 20):
+    # hash the raw bytes, a lot cheaper than parsing the workbook
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FrameCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, path, kind):
+        name = hashlib.blake2b(f'{kind}:{os.path.abspath(path)}'.encode(), digest_size=16).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + '.' + FORMAT, base + '.json'
+
+    def _read_meta(self, meta_path):
+        try:
+            with open(meta_path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _is_fresh(self, path, meta_path, meta):
+        # mtime and size first, only hash the file when they changed
+        stat = os.stat(path)
+        if meta['mtime'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+            return True
+        if meta['size'] != stat.st_size or meta['hash'] != file_hash(path):
+            return False
+        # touched but not changed, so remember the new mtime
+        meta['mtime'] = stat.st_mtime_ns
+        with open(meta_path, 'w') as handle:
+            json.dump(meta, handle)
+        return True
+
+    def get(self, path, kind):
+        data_path, meta_path = self._entry(path, kind)
+        meta = self._read_meta(meta_path)
+        if meta is None or meta.get('format') != FORMAT or meta.get('version') != CACHE_VERSION \
+                or not os.path.exists(data_path):
+            return None
+        if not self._is_fresh(path, meta_path, meta):
+            return None
+        os.utime(data_path)  # mark as recently used for eviction
+        if FORMAT == 'feather':
+            # uncompressed feather maps straight from disk
+            from pyarrow import feather
+            return feather.read_table(data_path, memory_map=True).to_pandas()
+        return pd.read_pickle(data_path)
+
+    def put(self, path, kind, frame):
+        data_path, meta_path = self._entry(path, kind)
+        stat = os.stat(path)
+        if FORMAT == 'feather':
+            frame.reset_index(drop=True).to_feather(data_path, compression='uncompressed')
+        else:
+            frame.to_pickle(data_path)
+        meta = {'source': os.path.abspath(path), 'kind': kind, 'format': FORMAT, 'version': CACHE_VERSION,
+                'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': file_hash(path)}
+        with open(meta_path, 'w') as handle:
+            json.dump(meta, handle)
+        self.evict()
+
+    def load(self, path, kind, loader, refresh=False):
+        # return the cached frame or build it with loader(path) and store it
+        if not refresh:
+            frame = self.get(path, kind)
+            if frame is not None:
+                return frame
+        frame = loader(path)
+        self.put(path, kind, frame)
+        return frame
+
+    def entries(self):
+        # (last used, size, data path) for every cached frame
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.' + FORMAT):
+                data_path = os.path.join(self.directory, name)
+                stat = os.stat(data_path)
+                found.append((stat.st_mtime, stat.st_size, data_path))
+        return found
+
+    def evict(self):
+        # drop the least recently used entries until the cache fits in max_bytes
+        found = sorted(self.entries())
+        total = sum(size for _, size, _ in found)
+        for _, size, data_path in found:
+            if total <= self.max_bytes:
+                break
+            self._remove(data_path)
+            total -= size
+
+    def invalidate(self, path=None):
+        # forget one source file, or everything when no path is given
+        if path is not None:
+            for kind in ('workout', 'dietary'):
+                data_path, _ = self._entry(path, kind)
+                self._remove(data_path)
+            return
+        for _, _, data_path in self.entries():
+            self._remove(data_path)
+
+    def _remove(self, data_path):
+        base = os.path.splitext(data_path)[0]
+        for leftover in (data_path, base + '.json'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+# the cache used by data.loadWorkout/loadDietary, off unless configured or OPTILIFT_CACHE_DIR is set
+default_cache = None
+
+
+def configure(directory, max_bytes=DEFAULT_MAX_BYTES):
+    global default_cache
+    default_cache = FrameCache(directory, max_bytes) if directory else None
+    return default_cache
+
+
+def get_default_cache():
+    if default_cache is None and os.environ.get('OPTILIFT_CACHE_DIR'):
+        configure(os.environ['OPTILIFT_CACHE_DIR'])
+    return default_cache
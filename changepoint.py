@@ -0,0 +1,127 @@
+# welch t-tests for every possible split of a date-ordered series in one pass
+# before/after means and variances come from cumulative sums and sums of squares, so scanning
+# every candidate intervention date costs about the same as a single test
+
+import numpy as np
+import pandas as pd
+
+CORRECTIONS = ('holm', 'bonferroni', 'fdr_bh', 'none')
+
+
+def welchSplits(values, splits):
+    # welch t-test of values[k:] against values[:k] for every k in splits
+    # returns (t, dof, p, before mean, after mean), the same numbers ttest_ind(after, before, equal_var=False) gives
+    from scipy.stats import t as t_dist
+    values = np.asarray(values, dtype='float64')
+    splits = np.asarray(splits, dtype='int64')
+    n = len(values)
+    # shifting by the overall mean keeps the sums of squares from cancelling out
+    shifted = values - values.mean() if n else values
+    total = np.concatenate([[0.0], np.cumsum(shifted)])
+    squares = np.concatenate([[0.0], np.cumsum(shifted ** 2)])
+
+    n1 = splits.astype('float64')
+    n2 = n - n1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean1 = total[splits] / n1
+        mean2 = (total[-1] - total[splits]) / n2
+        var1 = (squares[splits] - n1 * mean1 ** 2) / (n1 - 1)
+        var2 = (squares[-1] - squares[splits] - n2 * mean2 ** 2) / (n2 - 1)
+        # rounding can leave a tiny negative variance for constant stretches
+        var1, var2 = np.clip(var1, 0, None), np.clip(var2, 0, None)
+        se1, se2 = var1 / n1, var2 / n2
+        t_stat = (mean2 - mean1) / np.sqrt(se1 + se2)
+        dof = (se1 + se2) ** 2 / (se1 ** 2 / (n1 - 1) + se2 ** 2 / (n2 - 1))
+        p_value = 2 * t_dist.sf(np.abs(t_stat), dof)
+    offset = values.mean() if n else 0.0
+    return t_stat, dof, p_value, mean1 + offset, mean2 + offset
+
+
+def adjustPValues(p_values, method='holm'):
+    # multiple comparison correction, NaN p-values are left out of the count and stay NaN
+    if method not in CORRECTIONS:
+        raise ValueError(f"correction must be one of {CORRECTIONS}, got {method!r}")
+    p_values = np.asarray(p_values, dtype='float64')
+    adjusted = np.full_like(p_values, np.nan)
+    valid = np.flatnonzero(~np.isnan(p_values))
+    m = len(valid)
+    if m == 0 or method == 'none':
+        adjusted[valid] = p_values[valid]
+        return adjusted
+    order = valid[np.argsort(p_values[valid], kind='stable')]
+    ranked = p_values[order]
+    if method == 'bonferroni':
+        values = ranked * m
+    elif method == 'holm':
+        values = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    else:
+        # benjamini-hochberg false discovery rate
+        values = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    adjusted[order] = np.minimum(values, 1.0)
+    return adjusted
+
+
+def _date_splits(dates, candidates, min_size):
+    # index of the first row on/after each candidate date, keeping splits with min_size rows either side
+    dates = pd.DatetimeIndex(dates)
+    candidates = pd.DatetimeIndex(candidates).unique().sort_values()
+    splits = dates.searchsorted(candidates, side='left')
+    keep = (splits >= min_size) & (len(dates) - splits >= min_size)
+    return candidates[keep], splits[keep]
+
+
+def scanSplits(frame, column='Total Volume', candidates=None, min_size=5, correction='holm', alpha=0.05):
+    # ranked table of welch tests of `column` after vs before every candidate date (default: every date in frame)
+    frame = frame[frame[column].notna()]
+    if not frame['Date'].is_monotonic_increasing:
+        frame = frame.sort_values('Date', kind='stable')
+    dates = frame['Date']
+    candidates = dates.unique() if candidates is None else pd.to_datetime(candidates)
+    candidates, splits = _date_splits(dates, candidates, min_size)
+    t_stat, dof, p_value, before, after = welchSplits(frame[column].to_numpy(), splits)
+    adjusted = adjustPValues(p_value, correction)
+    table = pd.DataFrame({
+        'Date': candidates,
+        'Before N': splits,
+        'After N': len(frame) - splits,
+        'Before Mean': before,
+        'After Mean': after,
+        'T-statistic': t_stat,
+        'DoF': dof,
+        'P-value': p_value,
+        'Adjusted P-value': adjusted,
+        'Significant': adjusted < alpha,
+    })
+    table = table.sort_values(['Adjusted P-value', 'P-value', 'Date'], kind='stable', ignore_index=True)
+    table.index = pd.RangeIndex(1, len(table) + 1, name='Rank')
+    return table
+
+
+def changepoints(frame, column='Calories', min_size=7, alpha=0.05, max_changepoints=5):
+    # dates where the mean of `column` shifts, by binary segmentation on the welch statistic
+    # each segment is split at its largest |t| if that split survives a bonferroni correction over the
+    # segment's candidate splits, then both halves are searched again
+    frame = frame[frame[column].notna()].sort_values('Date', kind='stable', ignore_index=True)
+    values = frame[column].to_numpy('float64')
+    found = []
+    segments = [(0, len(values))]
+    while segments and len(found) < max_changepoints:
+        lo, hi = segments.pop()
+        splits = np.arange(min_size, hi - lo - min_size + 1)
+        if len(splits) == 0:
+            continue
+        t_stat, _, p_value, before, after = welchSplits(values[lo:hi], splits)
+        if np.all(np.isnan(t_stat)):
+            continue
+        best = int(np.nanargmax(np.abs(t_stat)))
+        if p_value[best] * len(splits) >= alpha:
+            continue
+        split = lo + int(splits[best])
+        found.append((frame['Date'].iloc[split], before[best], after[best], t_stat[best],
+                      min(p_value[best] * len(splits), 1.0)))
+        segments += [(lo, split), (split, hi)]
+    table = pd.DataFrame(found, columns=['Date', 'Before Mean', 'After Mean', 'T-statistic', 'Adjusted P-value'])
+    # typed even when nothing was found, so empty and non-empty results stack into one schema
+    table = table.astype({'Date': 'datetime64[ns]', 'Before Mean': 'float64', 'After Mean': 'float64',
+                          'T-statistic': 'float64', 'Adjusted P-value': 'float64'})
+    return table.sort_values('Date', ignore_index=True)
@@ -1,32 +1,96 @@
 
 # imports
+import os
 import pandas as pd
 import numpy as np
-from analysis import standardize_weights
+from ratios import standardize_weights
+from cache import get_default_cache
+from store import get_default_store
+from dataset import CombinedDataset, combine
+from schema import applyWorkoutSchema, applyDietarySchema
+from profiling import instrument, stage
  
 #Data is mostly manually processed when put into excel sheet beforehand
 
-def loadWorkout(file):
+@instrument
+def readWorkout(file):
     #open file and read it 
     #turn data into dataframe and return that
-    workout_data = pd.read_excel(file)
+    with stage('read_excel'):
+        workout_data = pd.read_excel(file)
     workout_data["Date"] = pd.to_datetime(workout_data['Date'], format = '%m/%d/%Y')
-    return workout_data
+    # categoricals, small ints and float32 instead of strings and 64 bit numbers
+    return applyWorkoutSchema(workout_data)
 
 
-def loadDietary(file):
+@instrument
+def readDietary(file):
     #open file and read it 
     #turn data into dataframe and return that
-    dietary_data = pd.read_excel(file)
+    with stage('read_excel'):
+        dietary_data = pd.read_excel(file)
     dietary_data["Date"] = pd.to_datetime(dietary_data['Date'], format = '%m/%d/%Y')
-    return dietary_data
+    return applyDietarySchema(dietary_data)
+
+
+def _cached_load(file, kind, reader, cache, refresh):
+    # only real files on disk can be cached, uploads of file objects go straight to excel
+    cache = get_default_cache() if cache is None else cache
+    if not cache or not isinstance(file, (str, os.PathLike)):
+        return reader(file)
+    return cache.load(file, kind, reader, refresh=refresh)
+
+
+def _stored_load(file, kind, reader, cache, refresh, store, athlete):
+    # with a training store the file only gets read once, later loads query the rows it held
+    # the store checks those rows are still exactly the file's, for this athlete, before handing them back
+    store = get_default_store() if store is None else store
+    if not store or not isinstance(file, (str, os.PathLike)):
+        return _cached_load(file, kind, reader, cache, refresh)
+    loaded = None if refresh else store.loadedFile(file, kind, athlete)
+    if loaded is not None:
+        return loaded
+    frame = _cached_load(file, kind, reader, cache, refresh)
+    if athlete is None and 'Athlete' not in frame.columns:
+        # nobody to file the rows under, they'd only mix with other unnamed files
+        return frame
+    if kind == 'workout':
+        store.insertWorkout(frame, athlete, replace=True)
+    else:
+        store.insertDietary(frame, athlete)
+    if not frame.empty:
+        store.recordFile(file, kind, frame, athlete)
+    return frame if athlete is None else frame.assign(Athlete=str(athlete))
+
+
+@instrument
+def loadWorkout(file, cache=None, refresh=False, store=None, athlete=None):
+    # cache=False skips the cache, refresh=True forces a re-parse of the excel file
+    # store=False skips the training store, athlete names the athlete the file belongs to in the store
+    return _stored_load(file, 'workout', readWorkout, cache, refresh, store, athlete)
+
+
+@instrument
+def loadDietary(file, cache=None, refresh=False, store=None, athlete=None):
+    return _stored_load(file, 'dietary', readDietary, cache, refresh, store, athlete)
+
+# processing never writes to the frame it was given: each step returns a new frame that shares the
+# input's columns (a shallow copy) and only allocates the rows it filters and the columns it adds
 
+@instrument
 def processWorkout(workout_data):
-    # filter our zero weights
-    workout_data = workout_data[workout_data['Weight (kg)'] != 0]
-    workout_data = standardize_weights(workout_data)
+    # filter our zero weights, take() gives a frame of its own so there's no chained assignment below
+    keep = (workout_data['Weight (kg)'] != 0).to_numpy()
+    if keep.all():
+        workout_data = workout_data.copy(deep=False)
+    else:
+        workout_data = workout_data.take(np.flatnonzero(keep))
+    # this is where the standardized weight is made, so always from the current weights
+    workout_data = standardize_weights(workout_data, inplace=True, force=True)
     # total volume = sets by reps by weight (std)
-    workout_data['Total Volume'] = workout_data['Sets'] * workout_data['Reps'] * workout_data['Weight (kg)_std']
+    # sets and reps can be uint8, so widen before multiplying or 20 x 20 would overflow
+    sets = workout_data['Sets'].astype(np.promote_types(workout_data['Sets'].dtype, np.uint16))
+    workout_data['Total Volume'] = sets * workout_data['Reps'] * workout_data['Weight (kg)_std']
     # categorize intensities based off volume
     workout_data['Intensity Category'] = pd.cut(workout_data['Total Volume'], 
                                                  bins=[0, 5000, 10000, 9999999999], 
@@ -34,21 +98,26 @@ def processWorkout(workout_data):
 
     return workout_data
 
+@instrument
 def processDietary(dietary_data):
     # ratios for later use possibly
     # dietary_data['Protein to Carb Ratio'] = dietary_data['Protein (g)'] / dietary_data['Carbs (g)']
     # dietary_data['Fat to Carb Ratio'] = dietary_data['Fats (g)'] / dietary_data['Carbs (g)']
+    dietary_data = dietary_data.copy(deep=False)
 
     # categorize calorie days (more cals equal more energy)
     dietary_data['Calorie Category'] = pd.cut(dietary_data['Calories'], bins=[0, 2000, 3000, 99999999], labels=['Low', 'Medium', 'High'])
 
     return dietary_data
 
+@instrument
 def ProcessDietaryChange(workout_data, dietary_data, intervention_date):
     #get two sets of data, one for before a dietary change was made and one for after
     intervention_datetime = pd.to_datetime(intervention_date)
+    if isinstance(workout_data, CombinedDataset):
+        return workout_data.split(intervention_datetime)
 
-    combined_data = pd.merge(workout_data, dietary_data, on='Date', how='inner')
+    combined_data = combine(workout_data, dietary_data)
 
     before_data = combined_data[combined_data['Date'] < intervention_datetime]
     after_data = combined_data[combined_data['Date'] >= intervention_datetime]
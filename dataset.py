@@ -0,0 +1,130 @@
+# shared workout + diet join so analyses don't each redo pd.merge on Date
+# both frames are sorted by date once and every aligned view is built with merge_asof and memoized
+
+import weakref
+import pandas as pd
+from profiling import instrument, stage
+
+# id of every frame a dataset hands out -> (weak reference to the dataset, which frame it is)
+# nothing writes to these frames, so memo can fingerprint one by its dataset instead of hashing its rows
+_owned = {}
+
+
+def _own(frame, dataset, key):
+    _owned[id(frame)] = (weakref.ref(dataset), key)
+    weakref.finalize(frame, _owned.pop, id(frame), None)
+    return frame
+
+
+def owner(frame):
+    # (dataset, key) for a frame a CombinedDataset built, None for any other frame
+    found = _owned.get(id(frame))
+    if found is None or found[0]() is None:
+        return None
+    return found[0](), found[1]
+
+
+def joinKeys(workout_data, dietary_data):
+    # files loaded for a named athlete carry an Athlete column, their rows only join with that athlete's diet
+    if 'Athlete' in workout_data.columns and 'Athlete' in dietary_data.columns:
+        return ['Athlete', 'Date']
+    return ['Date']
+
+
+def _matching_athletes(workout_data, dietary_data):
+    # the diet's Athlete column in the workout's dtype, categoricals only join when their categories agree
+    dtype = workout_data['Athlete'].dtype
+    if dietary_data['Athlete'].dtype == dtype:
+        return dietary_data
+    return dietary_data.assign(Athlete=dietary_data['Athlete'].astype(object).astype(dtype))
+
+
+class CombinedDataset:
+    def __init__(self, workout_data, dietary_data, joined=None):
+        # joined is the same-day join when the caller already has it (a TrainingLog merges as it appends)
+        self.workout = _own(self._sorted(workout_data), self, 'workout')
+        self.diet = _own(self._sorted(dietary_data), self, 'diet')
+        self._views = {}
+        if joined is not None:
+            self._views[(0, None)] = _own(joined.reset_index(drop=True), self, (0, None))
+
+    @staticmethod
+    def _sorted(frame):
+        # shares the caller's columns when the dates are already parsed and in order (processed frames usually
+        # are), otherwise one sorted copy. the input itself is never changed
+        frame = frame.copy(deep=False)
+        if not pd.api.types.is_datetime64_any_dtype(frame['Date']):
+            frame['Date'] = pd.to_datetime(frame['Date'])
+        if not frame['Date'].is_monotonic_increasing:
+            return frame.sort_values('Date', kind='stable', ignore_index=True)
+        frame.index = pd.RangeIndex(len(frame))
+        return frame
+
+    def join(self, lag=0, window=None):
+        # workout rows joined with the diet from `lag` days earlier
+        # lag=0 is the same-day join, lag=1 is what AlignDataforNutrition does with Prev_Date and
+        # window=N averages the numeric diet columns over the N days ending on that diet day
+        # diet dates are expected to be unique, the last entry wins if a day is logged twice
+        key = (lag, window)
+        if key not in self._views:
+            with stage('dataset.join', rows=len(self.workout)) as timing:
+                self._views[key] = _own(self._build(lag, window), self, key)
+                if timing is not None:
+                    timing.rows_out = len(self._views[key])
+        return self._views[key]
+
+    @property
+    def combined(self):
+        return self.join()
+
+    def _build(self, lag, window):
+        diet = self.diet
+        by = 'Athlete' if joinKeys(self.workout, diet)[0] == 'Athlete' else None
+        if window is not None:
+            numeric = diet.set_index('Date').select_dtypes('number')
+            if by is None:
+                diet = numeric.rolling(f'{window}D').mean().reset_index()
+            else:
+                # each athlete's own rolling mean, back in date order for merge_asof
+                rolled = numeric.groupby(diet[by].to_numpy(), sort=False).rolling(f'{window}D').mean()
+                diet = rolled.rename_axis([by, 'Date']).reset_index().sort_values('Date', kind='stable', ignore_index=True)
+        if by is not None:
+            diet = _matching_athletes(self.workout, diet)
+        right = diet.rename(columns={'Date': 'Diet Date'})
+        right['Date'] = right['Diet Date'] + pd.Timedelta(days=lag)
+        # tolerance 0 turns the asof join into an exact-date join, unmatched rows are dropped like an inner merge
+        joined = pd.merge_asof(self.workout, right, on='Date', by=by, direction='backward',
+                               tolerance=pd.Timedelta(0))
+        joined = joined[joined['Diet Date'].notna()].reset_index(drop=True)
+        # unmatched rows made the diet columns nullable, give them back their own dtypes
+        restore = {column: dtype for column, dtype in right.dtypes.items()
+                   if column in joined.columns and joined[column].dtype != dtype}
+        joined = joined.astype(restore)
+        if lag == 0 and window is None:
+            joined = joined.drop(columns='Diet Date')
+        return joined
+
+    def between(self, start=None, end=None, lag=0, window=None):
+        # rows of a joined view dated in [start, end), found by binary search on the sorted dates
+        view = self.join(lag, window)
+        dates = view['Date']
+        lo = 0 if start is None else dates.searchsorted(pd.to_datetime(start), side='left')
+        hi = len(view) if end is None else dates.searchsorted(pd.to_datetime(end), side='left')
+        return view.iloc[lo:hi]
+
+    def split(self, date, lag=0, window=None):
+        # rows before and on/after the date, e.g. around a dietary intervention
+        return self.between(end=date, lag=lag, window=window), self.between(start=date, lag=lag, window=window)
+
+
+@instrument
+def combine(workout_data, dietary_data=None, lag=0, window=None):
+    # joined frame from either a CombinedDataset or a plain workout/diet pair
+    if isinstance(workout_data, CombinedDataset):
+        return workout_data.join(lag, window)
+    if lag == 0 and window is None:
+        keys = joinKeys(workout_data, dietary_data)
+        if len(keys) > 1:
+            dietary_data = _matching_athletes(workout_data, dietary_data)
+        return pd.merge(workout_data, dietary_data, on=keys, how='inner')
+    return CombinedDataset(workout_data, dietary_data).join(lag, window)
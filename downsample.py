@@ -0,0 +1,271 @@
+# pre-aggregated chart data and line decimation for long training histories
+# Rollups keeps per day, week and month summaries (best and last weight, volume per lift, macro sums) that are
+# updated as sessions arrive, so a chart reads a few hundred summary rows instead of rescanning every set.
+# lines longer than the plot is wide are thinned with LTTB (largest triangle three buckets) or min/max
+# decimation, which keeps the peaks and dips, so drawing time doesn't grow with the length of the history
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ('day', 'week', 'month')
+MACROS = ['Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+LIFT_ROLLUP = {'Max Weight (kg)': 'max', 'Last Weight (kg)': 'last', 'Total Volume': 'sum', 'Rows': 'sum'}
+DEFAULT_DPI = 100
+# screen pixels per plotted point, two keeps neighbouring points apart
+PIXELS_PER_POINT = 2
+
+
+def _keys(frame):
+    return ['Athlete'] if 'Athlete' in frame.columns else []
+
+
+def periodStart(dates, level):
+    # first day of the day, week (weeks start on Monday) or month each date falls in
+    dates = pd.to_datetime(pd.Series(dates)).dt.normalize()
+    if level == 'day':
+        return dates
+    if level == 'week':
+        return dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')
+    if level == 'month':
+        return dates.dt.to_period('M').dt.start_time
+    raise ValueError(f'level must be one of {LEVELS}, got {level!r}')
+
+
+def pointsFor(figsize, dpi=DEFAULT_DPI):
+    # how many points a line on a figure this wide can show
+    return max(int(figsize[0] * dpi / PIXELS_PER_POINT), 3)
+
+
+def _aggregate(frame, by, how):
+    grouped = frame.groupby(by, observed=True, sort=True)
+    return pd.DataFrame({column: getattr(grouped[column], func)() for column, func in how.items()}).reset_index()
+
+
+def liftRollup(workout_data, level='day'):
+    # per period and lift (and athlete): best and last weight, volume and number of rows
+    # tables are ordered by date first, so appending later periods keeps them sorted
+    by = ['Date'] + _keys(workout_data) + ['Exercise']
+    frame = workout_data[by[1:]].assign(Date=periodStart(workout_data['Date'], level).to_numpy())
+    weights = workout_data['Weight (kg)'].to_numpy('float64')
+    volume = workout_data['Total Volume'].to_numpy('float64') if 'Total Volume' in workout_data else np.nan
+    frame = frame.assign(**{'Max Weight (kg)': weights, 'Last Weight (kg)': weights, 'Total Volume': volume, 'Rows': 1})
+    return _aggregate(frame, by, LIFT_ROLLUP)
+
+
+def macroRollup(dietary_data, level='day'):
+    # per period macro sums and counts, so means over any span add up exactly
+    present = [macro for macro in MACROS if macro in dietary_data.columns]
+    values = dietary_data[present].astype('float64')
+    grouped = values.groupby(periodStart(dietary_data['Date'], level).to_numpy(), sort=True)
+    sums = grouped.sum().add_suffix(' Sum')
+    counts = grouped.count().add_suffix(' Count')
+    return pd.concat([sums, counts], axis=1).rename_axis('Date').reset_index()
+
+
+def _reroll(table, level, by, how):
+    # a finer rollup regrouped into coarser periods
+    return _aggregate(table.assign(Date=periodStart(table['Date'], level).to_numpy()), by, how)
+
+
+def _update(stored, new, start, by, how):
+    # periods before start are kept as they are, the rest are regrouped together with the new rows
+    # stored comes before new so 'last' is the later batch
+    if stored is None or stored.empty:
+        return new
+    split = np.searchsorted(stored['Date'].to_numpy(), np.datetime64(start), side='left')
+    head, tail = stored.iloc[:split], stored.iloc[split:]
+    if not tail.empty:
+        new = _aggregate(pd.concat([tail, new], ignore_index=True), by, how)
+    return pd.concat([head, new], ignore_index=True)
+
+
+def _update_levels(tables, new_daily, by, how):
+    # the daily table absorbs the new rows, coarser levels are only rebuilt from the first touched period on
+    first = new_daily['Date'].min()
+    tables['day'] = _update(tables.get('day'), new_daily, first, by, how)
+    for level in LEVELS[1:]:
+        start = periodStart([first], level).iloc[0]
+        daily = tables['day']
+        tail = _reroll(daily.iloc[np.searchsorted(daily['Date'].to_numpy(), np.datetime64(start)):], level, by, how)
+        stored = tables.get(level)
+        tables[level] = tail if stored is None else \
+            pd.concat([stored.iloc[:np.searchsorted(stored['Date'].to_numpy(), np.datetime64(start))], tail],
+                      ignore_index=True)
+    return tables
+
+
+class Rollups:
+    # chart summaries kept up to date as processed workout and diet rows are appended
+    def __init__(self):
+        self.lifts = {}
+        self.macros = {}
+
+    def clearWorkout(self):
+        self.lifts = {}
+
+    def clearDietary(self):
+        self.macros = {}
+
+    def updateWorkout(self, processed):
+        if processed.empty:
+            return self
+        new = liftRollup(processed)
+        by = ['Date'] + _keys(new) + ['Exercise']
+        _update_levels(self.lifts, new, by, LIFT_ROLLUP)
+        return self
+
+    def updateDietary(self, processed):
+        if processed.empty:
+            return self
+        new = macroRollup(processed)
+        how = {column: 'sum' for column in new.columns if column != 'Date'}
+        _update_levels(self.macros, new, ['Date'], how)
+        return self
+
+    def liftTable(self, level='day'):
+        return self.lifts.get(level)
+
+    def macroTable(self, level='day'):
+        # macro means per period
+        table = self.macros.get(level)
+        if table is None:
+            return None
+        present = [macro for macro in MACROS if f'{macro} Sum' in table.columns]
+        means = {macro: table[f'{macro} Sum'] / table[f'{macro} Count'].where(table[f'{macro} Count'] > 0)
+                 for macro in present}
+        return pd.DataFrame({'Date': table['Date'], **means})
+
+    def _joined_days(self):
+        # workout rows per day on the days that also have a diet entry, what an inner merge on Date would keep
+        lifts, macros = self.lifts.get('day'), self.macros.get('day')
+        if lifts is None or macros is None:
+            return None, None
+        rows = lifts.groupby('Date')['Rows'].sum()
+        macros = macros.set_index('Date')
+        days = rows.index.intersection(macros.index)
+        return rows.reindex(days).to_numpy('float64'), macros.loc[days]
+
+    def macroMeans(self, joined=True):
+        # joined=True weights each day by its workout rows, the same means as the combined frame gives
+        # joined=False is the plain mean over the logged diet days
+        if joined:
+            rows, macros = self._joined_days()
+            if rows is None:
+                return pd.Series(np.nan, index=MACROS)
+        else:
+            macros = self.macros.get('day')
+            if macros is None:
+                return pd.Series(np.nan, index=MACROS)
+            rows = np.ones(len(macros))
+        present = [macro for macro in MACROS if f'{macro} Sum' in macros.columns]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.Series({macro: (rows * macros[f'{macro} Sum'].to_numpy()).sum() /
+                              (rows * macros[f'{macro} Count'].to_numpy()).sum() for macro in present})
+
+    def currentLift(self, exercise, joined=True):
+        # the last weight logged for a lift, only counting days with a diet entry when joined like the combined frame
+        lifts = self.lifts.get('day')
+        if lifts is None:
+            return 0
+        days = lifts[lifts['Exercise'] == exercise]
+        if joined:
+            macros = self.macros.get('day')
+            days = days[days['Date'].isin(macros['Date'])] if macros is not None else days.iloc[:0]
+        if days.empty:
+            return 0
+        return days.sort_values('Date', kind='stable')['Last Weight (kg)'].iloc[-1]
+
+
+def lttb(x, y, points):
+    # indices of `points` samples that keep the visual shape of the line, first and last always included
+    # one pass over the buckets: each keeps the point making the largest triangle with the previous pick and
+    # the next bucket's average, so the loop is over points and the work inside it is vectorized
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1][:max(points, 0)])
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    every = (n - 2) / (points - 2)
+    edges = np.append((np.arange(points - 1) * every).astype(np.intp) + 1, n)
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_lo, next_hi = edges[bucket + 1], edges[bucket + 2]
+        next_x, next_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        ax, ay = x[previous], y[previous]
+        area = np.abs((ax - next_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y - ay))
+        previous = lo + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minMax(x, y, points):
+    # indices of the lowest and highest sample in each of points // 2 equal slices, in order
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+    buckets = max(points // 2, 1)
+    y = np.asarray(y, dtype='float64')
+    bucket = (np.arange(n) * buckets) // n
+    order = np.lexsort((y, bucket))
+    ends = np.searchsorted(bucket[order], np.arange(buckets), side='right')
+    starts = np.concatenate([[0], ends[:-1]])
+    return np.unique(np.concatenate([order[starts], order[ends - 1], [0, n - 1]]))
+
+
+METHODS = {'lttb': lttb, 'minmax': minMax}
+
+
+def decimate(frame, x, y, points, method='lttb'):
+    # rows of frame thinned to about `points`, rows with a missing y are left out
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {sorted(METHODS)}, got {method!r}')
+    frame = frame[frame[y].notna()]
+    if len(frame) <= points:
+        return frame
+    xs = frame[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xs = xs.astype('int64')
+    return frame.iloc[METHODS[method](xs.to_numpy(), frame[y].to_numpy(), points)]
+
+
+def levelFor(first, last, points):
+    # the finest rollup whose number of periods fits in `points`
+    days = (pd.Timestamp(last) - pd.Timestamp(first)).days + 1
+    if days <= points:
+        return 'day'
+    if days / 7 <= points:
+        return 'week'
+    return 'month'
+
+
+def liftSeries(data, exercises, points, value='Max Weight (kg)', method='lttb'):
+    # {exercise: Date / Weight (kg) frame} at a level of detail that fits `points`
+    # data is a Rollups or a processed workout frame, which is rolled up on the spot
+    if isinstance(data, Rollups):
+        daily = data.liftTable('day')
+        tables = data.lifts
+    else:
+        daily = liftRollup(data[data['Exercise'].isin(exercises)]) if len(data) else None
+        tables = {'day': daily}
+    series = {}
+    for exercise in exercises:
+        if daily is None or daily.empty:
+            series[exercise] = pd.DataFrame({'Date': pd.Series(dtype='datetime64[ns]'), 'Weight (kg)': pd.Series(dtype='float64')})
+            continue
+        days = daily[daily['Exercise'] == exercise]
+        level = levelFor(days['Date'].min(), days['Date'].max(), points) if len(days) else 'day'
+        if level not in tables:
+            tables[level] = _reroll(daily, level, ['Date'] + _keys(daily) + ['Exercise'], LIFT_ROLLUP)
+        rows = tables[level]
+        rows = rows[rows['Exercise'] == exercise]
+        if _keys(rows):
+            # several athletes on one chart: the best of them per period
+            rows = rows.groupby('Date', sort=True)[value].agg(LIFT_ROLLUP[value]).reset_index()
+        rows = decimate(rows[['Date', value]].rename(columns={value: 'Weight (kg)'}), 'Date', 'Weight (kg)', points, method)
+        series[exercise] = rows.reset_index(drop=True)
+    return series
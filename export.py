@@ -0,0 +1,251 @@
+# bulk export of processed data and analysis results to csv, parquet or multi-sheet xlsx
+# every table ("sheet") is written in chunks as it arrives: csv appends to one file per sheet, parquet keeps a
+# ParquetWriter per sheet and xlsx uses openpyxl's write-only workbook, so exporting many athletes only holds
+# one athlete's tables in memory at a time
+
+import os
+import numpy as np
+import pandas as pd
+import data
+import analysis
+import forecast
+from dataset import CombinedDataset
+
+FORMATS = ('csv', 'parquet', 'xlsx')
+DEFAULT_CHUNKSIZE = 50000
+# excel stops at 1,048,576 rows, longer sheets continue on "<sheet> (2)" and so on
+EXCEL_MAX_ROWS = 1048575
+SHEETS = ['Workout', 'Combined', 'Correlations', 'Nutrition', 'T-tests', 'Forecasts']
+
+
+def _format(path, fmt):
+    if fmt is None:
+        extension = os.path.splitext(str(path))[1].lower().lstrip('.')
+        fmt = {'xls': 'xlsx', 'pq': 'parquet'}.get(extension, extension) or 'csv'
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    return fmt
+
+
+def _excel_value(value):
+    # openpyxl wants plain python values, blanks instead of NaN/NaT
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value
+
+
+class Exporter:
+    # write(sheet, frame) any number of times per sheet, then close()
+    # csv and parquet write a directory with one file per sheet, xlsx a single workbook
+    def __init__(self, path, fmt=None, chunksize=DEFAULT_CHUNKSIZE):
+        self.path = str(path)
+        self.fmt = _format(path, fmt)
+        self.chunksize = chunksize
+        self.rows = {}
+        self._writers = {}
+        self._columns = {}
+        # parquet sheets that have only seen empty chunks so far
+        self._empty = {}
+        if self.fmt == 'xlsx':
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _file(self, sheet, extension):
+        name = ''.join(char if char.isalnum() or char in ' -_' else '_' for char in sheet)
+        return os.path.join(self.path, f'{name}.{extension}')
+
+    def write(self, sheet, frame):
+        if frame is None or frame.empty and sheet in self._columns:
+            return
+        # later chunks are lined up with the first one's columns so every file has a single layout
+        if sheet in self._columns:
+            frame = frame.reindex(columns=self._columns[sheet])
+        else:
+            self._columns[sheet] = list(frame.columns)
+        for start in range(0, max(len(frame), 1), self.chunksize):
+            chunk = frame.iloc[start:start + self.chunksize]
+            getattr(self, f'_write_{self.fmt}')(sheet, chunk)
+            self.rows[sheet] = self.rows.get(sheet, 0) + len(chunk)
+
+    def _write_csv(self, sheet, chunk):
+        first = sheet not in self._writers
+        if first:
+            self._writers[sheet] = open(self._file(sheet, 'csv'), 'w', newline='')
+        chunk.to_csv(self._writers[sheet], header=first, index=False, date_format='%Y-%m-%d')
+
+    def _write_parquet(self, sheet, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        # categoricals become plain strings so chunks with different categories share one schema
+        chunk = chunk.astype({column: 'object' for column, dtype in chunk.dtypes.items()
+                              if isinstance(dtype, pd.CategoricalDtype)})
+        if sheet not in self._writers:
+            if chunk.empty:
+                # an empty chunk can't tell what type an object column holds, so the file's schema waits
+                # for the first rows (close() writes the empty table if none come)
+                self._empty[sheet] = chunk
+                return
+            schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+            # a column that is all missing in the first rows would be typed null, later text couldn't go in
+            for index, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(index, field.with_type(pa.string()))
+            self._writers[sheet] = pq.ParquetWriter(self._file(sheet, 'parquet'), schema)
+            self._empty.pop(sheet, None)
+        writer = self._writers[sheet]
+        writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+
+    def _write_xlsx(self, sheet, chunk):
+        state = self._writers.get(sheet)
+        if state is None or state[1] >= EXCEL_MAX_ROWS:
+            part = 1 if state is None else state[2] + 1
+            worksheet = self._workbook.create_sheet(sheet[:31] if part == 1 else f'{sheet[:25]} ({part})')
+            worksheet.append([str(column) for column in chunk.columns])
+            state = self._writers[sheet] = [worksheet, 0, part]
+        worksheet = state[0]
+        for row in chunk.itertuples(index=False, name=None):
+            if state[1] >= EXCEL_MAX_ROWS:
+                self._write_xlsx(sheet, chunk.iloc[0:0])
+                state = self._writers[sheet]
+                worksheet = state[0]
+            worksheet.append([_excel_value(value) for value in row])
+            state[1] += 1
+
+    def close(self):
+        if self.fmt == 'xlsx':
+            if not self._writers:
+                self._workbook.create_sheet('Empty')
+            self._workbook.save(self.path)
+        else:
+            for writer in self._writers.values():
+                writer.close()
+            if self._empty:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                for sheet, chunk in self._empty.items():
+                    pq.write_table(pa.Table.from_pandas(chunk, preserve_index=False), self._file(sheet, 'parquet'))
+        self._writers = {}
+        self._empty = {}
+
+
+def _with_athlete(frame, athlete):
+    if athlete is None or frame is None:
+        return frame
+    frame = frame.drop(columns='Athlete', errors='ignore')
+    frame.insert(0, 'Athlete', athlete)
+    return frame
+
+
+def analysisTables(dataset, intervention_date=None, future_sessions=5):
+    # every analysis result for one athlete as tidy tables, same columns for every athlete
+    correlation = analysis.correlateDietToWorkout(dataset)
+    pairs = correlation.stack().rename('Correlation').rename_axis(['Variable', 'With']).reset_index()
+    pairs = pairs[pairs['Variable'] < pairs['With']].reset_index(drop=True)
+
+    nutrition = analysis.nutritionAnalysisAll(dataset).reset_index()
+
+    if intervention_date is not None:
+        single = analysis.dietEffectiveness(dataset, intervention_date)
+        ttests = pd.DataFrame({'Date': [pd.to_datetime(intervention_date)], 'Method': 'intervention',
+                               'T-statistic': [pd.to_numeric(single['T-statistic'], errors='coerce')],
+                               'P-value': [pd.to_numeric(single['P-value'], errors='coerce')],
+                               'Adjusted P-value': [np.nan]})
+    else:
+        scan = analysis.dietEffectivenessScan(dataset, candidates='changepoints')
+        ttests = scan[['Date', 'T-statistic', 'P-value', 'Adjusted P-value']].assign(Method='changepoint')
+        ttests = ttests[['Date', 'Method', 'T-statistic', 'P-value', 'Adjusted P-value']].reset_index(drop=True)
+
+    # every exercise in one batched fit, with prediction intervals
+    forecasts = forecast.forecastLifts(dataset.combined, future_sessions, by=['Exercise'])
+    forecasts = forecasts[['Exercise', 'Session', 'Date', 'Predicted', 'Lower', 'Upper', 'Model']]
+
+    return {'Correlations': pairs, 'Nutrition': nutrition, 'T-tests': ttests, 'Forecasts': forecasts}
+
+
+def athleteTables(workout_data, dietary_data, athlete=None, intervention_date=None, frames=True):
+    # processed frames plus analysis tables for one athlete, all with a leading Athlete column
+    dataset = CombinedDataset(workout_data, dietary_data)
+    tables = {}
+    if frames:
+        tables['Workout'] = dataset.workout
+        tables['Combined'] = dataset.combined
+    tables.update(analysisTables(dataset, intervention_date))
+    return {sheet: _with_athlete(frame, athlete) for sheet, frame in tables.items()}
+
+
+def exportAthlete(path, workout_data, dietary_data, athlete=None, intervention_date=None, fmt=None, frames=True):
+    with Exporter(path, fmt) as exporter:
+        for sheet, frame in athleteTables(workout_data, dietary_data, athlete, intervention_date, frames).items():
+            exporter.write(sheet, frame)
+    return exporter.rows
+
+
+def _job_tables(job):
+    # worker side of exportAthletes: load, process and analyze one athlete from its files
+    try:
+        workout_data = data.processWorkout(data.loadWorkout(job['Workout'], athlete=job['Athlete']))
+        dietary_data = data.processDietary(data.loadDietary(job['Diet'], athlete=job['Athlete']))
+        return job['Athlete'], athleteTables(workout_data, dietary_data, job['Athlete'],
+                                             job.get('Intervention Date'), job.get('Frames', True)), None
+    except Exception as error:
+        return job['Athlete'], None, f'{type(error).__name__}: {error}'
+
+
+def _finished_tables(jobs, workers):
+    # (athlete, tables, error) in the order athletes finish, with at most `workers` jobs submitted at a time
+    # so finished results never pile up waiting to be written
+    if workers == 1:
+        yield from map(_job_tables, jobs)
+        return
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    workers = workers or os.cpu_count() or 1
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        while True:
+            for job in jobs:
+                running.add(pool.submit(_job_tables, job))
+                if len(running) >= workers:
+                    break
+            if not running:
+                return
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def exportAthletes(jobs, path, fmt=None, workers=None, frames=True):
+    # batch.collectJobs style jobs -> one export with every athlete stacked in each sheet
+    # each athlete is written as soon as it finishes, so at most `workers` athletes are held in memory
+    # an athlete whose tables fail to load or to write is reported in errors and the rest carry on
+    jobs = [dict(job, Frames=frames) for job in jobs]
+    errors = {}
+    with Exporter(path, fmt) as exporter:
+        for athlete, tables, error in _finished_tables(jobs, workers):
+            if error is None:
+                try:
+                    for sheet in SHEETS:
+                        if sheet in tables:
+                            exporter.write(sheet, tables[sheet])
+                except Exception as write_error:
+                    error = f'{type(write_error).__name__}: {write_error}'
+            if error is not None:
+                errors[athlete] = error
+    return exporter.rows, errors
+
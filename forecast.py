@@ -0,0 +1,174 @@
+# progress forecasts for every lift (and athlete) at once
+# the regressor is the number of days since the group's first session, so gaps in training count as time,
+# and future sessions are spaced by each group's median gap between sessions
+# models: linear (weight keeps climbing at the same rate), log (gains slow down) and saturating
+# (weight levels off towards a ceiling). log and saturating have a time constant tau that is picked per group
+# from TAU_GRID, groups of similar length and every tau go through one batched least squares fit in regression.fitBatch
+
+import numpy as np
+import pandas as pd
+import regression
+from memo import memoize
+from profiling import instrument
+
+MODELS = ('linear', 'log', 'saturating', 'auto')
+# time constants in days tried for the log and saturating models, two weeks to four years
+TAU_GRID = np.geomspace(14, 1460, 16)
+# parameters counted for the aic in 'auto', tau counts as one
+PARAMETERS = {'linear': 2, 'log': 3, 'saturating': 3}
+# fewer rows than this and 'auto' keeps the straight line
+MIN_CURVE_ROWS = 5
+DEFAULT_CADENCE = 7
+# most padded cells (groups x longest history x taus) in one batched fit. groups are batched with others of
+# about the same length, so one long history doesn't pad every short one up to its size
+MAX_BATCH_CELLS = 4_000_000
+FORECAST_COLUMNS = ['Session', 'Date', 'Days', 'Predicted', 'Lower', 'Upper', 'Model', 'Tau', 'Intercept', 'Slope',
+                    'R2', 'Sessions', 'Cadence (days)']
+_FIT_FIELDS = ('coef', 'intercept', 'r2', 'stderr', 'intercept_stderr', 'sigma2', 'dof', 'n', 'xmean', 'cov')
+
+
+def _transform(days, model, tau):
+    if model == 'log':
+        return np.log1p(days / tau)
+    if model == 'saturating':
+        return -np.expm1(-days / tau)
+    return days
+
+
+def _design(days, models, tau):
+    # days is (g, m), models and tau hold each group's model and time constant
+    out = np.array(days, dtype='float64')
+    for model in ('log', 'saturating'):
+        rows = models == model
+        out[rows] = _transform(out[rows], model, tau[rows, None])
+    return out
+
+
+def _take(fits, choice):
+    # one OLSFit out of several fits of the same groups, group i comes from fits[choice[i]]
+    groups = np.arange(len(choice))
+    return regression.OLSFit(*(np.stack([getattr(fit, field) for fit in fits])[choice, groups]
+                               for field in _FIT_FIELDS))
+
+
+def _rss(fit, X, y, mask):
+    return (((y - fit.predict(X)) * mask) ** 2).sum(axis=1)
+
+
+def _fit_model(X, y, mask, model):
+    # best fit of one model family for every group: (fit, tau, rss), tau is NaN for the straight line
+    groups = len(y)
+    if model == 'linear':
+        fit = regression.fitBatch(X, y, mask)
+        return fit, np.full(groups, np.nan), _rss(fit, X, y, mask)
+    # every tau for every group in one batch, (taus * groups, n, 1)
+    taus = len(TAU_GRID)
+    Xk = _transform(X[None], model, TAU_GRID[:, None, None, None]).reshape((-1,) + X.shape[1:])
+    yk = np.broadcast_to(y, (taus,) + y.shape).reshape(-1, y.shape[1])
+    maskk = np.broadcast_to(mask, (taus,) + mask.shape).reshape(-1, mask.shape[1])
+    fit = regression.fitBatch(Xk, yk, maskk)
+    rss = _rss(fit, Xk, yk, maskk).reshape(taus, groups)
+    best = np.argmin(rss, axis=0)
+    chosen = regression.OLSFit(*(getattr(fit, field)[best * groups + np.arange(groups)] for field in _FIT_FIELDS))
+    return chosen, TAU_GRID[best], rss[best, np.arange(groups)]
+
+
+def _fit(X, y, mask, model):
+    # (fit, model per group, tau per group)
+    if model != 'auto':
+        fit, tau, _ = _fit_model(X, y, mask, model)
+        return fit, np.full(len(y), model, dtype=object), tau
+    families = ('linear', 'log', 'saturating')
+    results = [_fit_model(X, y, mask, family) for family in families]
+    n = mask.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        aic = np.stack([n * np.log(rss / n) + 2 * PARAMETERS[family]
+                        for family, (_, _, rss) in zip(families, results)])
+    choice = np.where(n >= MIN_CURVE_ROWS, np.argmin(aic, axis=0), 0)
+    tau = np.stack([tau for _, tau, _ in results])[choice, np.arange(len(y))]
+    return _take([fit for fit, _, _ in results], choice), np.array(families, dtype=object)[choice], tau
+
+
+def _buckets(sizes):
+    # group numbers in batches of similar length (at most double the shortest), each under MAX_BATCH_CELLS
+    order = np.argsort(sizes, kind='stable')
+    buckets, start = [], 0
+    for end in range(1, len(order) + 1):
+        if end == len(order) or sizes[order[end]] > 2 * sizes[order[start]] or \
+                (end - start + 1) * sizes[order[end]] * len(TAU_GRID) > MAX_BATCH_CELLS:
+            buckets.append(np.sort(order[start:end]))
+            start = end
+    return buckets
+
+
+def _fit_groups(stacked, target, sizes, model):
+    # _fit over the length buckets, put back together in group order
+    fits, models, taus = [], [], []
+    codes = stacked['Group'].to_numpy()
+    buckets = _buckets(sizes)
+    for bucket in buckets:
+        _, X, y, mask = regression.stackGroups(stacked[np.isin(codes, bucket)], ['Days'], target, 'Group')
+        fit, chosen, tau = _fit(X, y, mask, model)
+        fits.append(fit)
+        models.append(chosen)
+        taus.append(tau)
+    order = np.argsort(np.concatenate(buckets), kind='stable')
+    fit = regression.OLSFit(*(np.concatenate([getattr(fit, field) for fit in fits])[order] for field in _FIT_FIELDS))
+    return fit, np.concatenate(models)[order], np.concatenate(taus)[order]
+
+
+def _cadence(frame, by, groups):
+    # median days between sessions per group, whole days and at least one
+    sessions = frame[by + ['Date']].drop_duplicates().sort_values(by + ['Date'], kind='stable')
+    gaps = sessions.groupby(by, observed=True, sort=True)['Date'].diff().dt.days
+    median = gaps.groupby([sessions[column] for column in by], observed=True, sort=True).median()
+    cadence = median.reindex(pd.MultiIndex.from_frame(groups[by]) if len(by) > 1 else groups[by[0]]).to_numpy('float64')
+    fallback = np.nanmedian(cadence) if np.isfinite(cadence).any() else DEFAULT_CADENCE
+    return np.maximum(np.round(np.where(np.isfinite(cadence), cadence, fallback)), 1)
+
+
+@instrument
+@memoize
+def forecastLifts(combined_data, future_sessions=5, model='auto', alpha=0.05, target='Weight (kg)', by=None,
+                  exercises=None, cadence=None):
+    # one row per group and future session with the prediction and its (1 - alpha) prediction interval
+    # by defaults to Athlete and Exercise when there's an Athlete column, cadence=None uses each group's median gap
+    # the interval treats the chosen tau as known, so it's a little narrow for the curved models
+    if model not in MODELS:
+        raise ValueError(f'model must be one of {MODELS}, got {model!r}')
+    if by is None:
+        by = ['Athlete', 'Exercise'] if 'Athlete' in combined_data.columns else ['Exercise']
+    by = [by] if isinstance(by, str) else list(by)
+    frame = combined_data[by + ['Date', target]].dropna()
+    if exercises is not None:
+        frame = frame[frame['Exercise'].isin([exercises] if isinstance(exercises, str) else exercises)]
+    if frame.empty or future_sessions < 1:
+        return pd.DataFrame(columns=by + FORECAST_COLUMNS)
+
+    grouped = frame.groupby(by, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    groups = grouped['Date'].agg(['min', 'max', 'size']).reset_index()
+    first = groups['min'].to_numpy()[codes]
+    days = ((frame['Date'].to_numpy() - first) / np.timedelta64(1, 'D')).astype('float64')
+    stacked = pd.DataFrame({'Group': codes, 'Days': days, target: frame[target].to_numpy('float64')})
+    fit, models, tau = _fit_groups(stacked, target, groups['size'].to_numpy(), model)
+
+    gap = _cadence(frame, by, groups) if cadence is None else np.full(len(groups), float(cadence))
+    last = ((groups['max'] - groups['min']) / pd.Timedelta(days=1)).to_numpy('float64')
+    steps = np.arange(1, future_sessions + 1)
+    future_days = last[:, None] + gap[:, None] * steps
+    predicted, lower, upper = fit.interval(_design(future_days, models, tau)[..., None], alpha)
+
+    count = len(groups)
+    table = groups.loc[np.repeat(np.arange(count), future_sessions), by].reset_index(drop=True)
+    table['Session'] = np.tile(steps, count)
+    table['Date'] = np.repeat(groups['max'].to_numpy(), future_sessions) + \
+        pd.to_timedelta((gap[:, None] * steps).ravel(), unit='D')
+    table['Days'] = future_days.ravel()
+    table['Predicted'] = predicted.ravel()
+    table['Lower'] = lower.ravel()
+    table['Upper'] = upper.ravel()
+    for column, values in [('Model', models), ('Tau', tau), ('Intercept', fit.intercept), ('Slope', fit.coef[:, 0]),
+                           ('R2', fit.r2), ('Sessions', groups['size'].to_numpy()), ('Cadence (days)', gap)]:
+        table[column] = np.repeat(values, future_sessions)
+    return table
@@ -1,12 +1,25 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, simpledialog
-import pandas as pd
 import data
 import analysis
 import visualization
+import cache
+import incremental
+import memo
+import export
+import profiling
+import store
+from batch import FILE_PATTERN
+from tasks import TaskRunner
+import os
 from ttkthemes import ThemedTk
 
-data_storage = {} #global variable
+data_storage = memo.DataStorage() #global variable, updating it drops the memoized analysis results
+training_log = incremental.TrainingLog() # processed data that new uploads get appended to
+uploaded_files = {} # last file uploaded for each data type
+loaded_athlete = None # whose data is in the training log, uploads are stored under this name
+task_runner = None # runs loading and analysis off the Tk thread
+busy_widgets = [] # buttons disabled while a job is running
 
 def launch_main_window():
     #used a theme to make the GUI more aesthetic
@@ -24,6 +37,14 @@ def launch_main_window():
     title_label = ttk.Label(root, text="OptiLift Fitness Tracker", font=("Georgia", 24))
     title_label.pack(pady=20)
 
+    # the athlete the uploads belong to, so the training store keeps each athlete's sessions apart
+    global athlete_name
+    athlete_name = tk.StringVar(root)
+    athlete_frame = ttk.Frame(root)
+    athlete_frame.pack(pady=5)
+    ttk.Label(athlete_frame, text="Athlete:").pack(side=tk.LEFT, padx=5)
+    ttk.Entry(athlete_frame, textvariable=athlete_name, width=30).pack(side=tk.LEFT)
+
     # upload work datta
     upload_workout_button = ttk.Button(root, text="Upload Workout Data", command=lambda: upload_data('workout'))
     upload_workout_button.pack(pady=10)
@@ -56,86 +77,316 @@ def launch_main_window():
                                           command=lambda: run_visualization(visualization_options.get()))
     run_visualization_button.pack(pady=10)
 
+    # processed data and every analysis table to csv, parquet or one xlsx workbook
+    export_button = ttk.Button(root, text="Export Results", command=lambda: export_results())
+    export_button.pack(pady=10)
+
+    # progress of the background job and a way to stop it
+    global status_label, progress_bar, task_runner
+    status_label = ttk.Label(root, text="Ready")
+    status_label.pack(pady=10)
+    progress_bar = ttk.Progressbar(root, length=400, maximum=1.0)
+    progress_bar.pack(pady=5)
+    cancel_button = ttk.Button(root, text="Cancel", command=lambda: task_runner.cancel_all())
+    cancel_button.pack(pady=10)
+
+    # timings of the last job, recorded only while the box is ticked
+    global timings_text
+    profile_enabled = tk.BooleanVar(root, value=profiling.enabled)
+    profile_check = ttk.Checkbutton(root, text="Record timings", variable=profile_enabled,
+                                    command=lambda: profiling.enable() if profile_enabled.get() else profiling.disable())
+    profile_check.pack(pady=5)
+    timings_text = tk.Text(root, height=12, width=100, font=("Courier", 10), state='disabled')
+    timings_text.pack(pady=5)
+
+    busy_widgets.extend([upload_workout_button, upload_diet_button, run_analysis_button, run_visualization_button,
+                         export_button])
+    task_runner = TaskRunner(root)
+    root.protocol("WM_DELETE_WINDOW", lambda: (task_runner.shutdown(), root.destroy()))
+
     return root
 
+def show_timings(run):
+    # fill the "last run timings" panel
+    if run is None:
+        return
+    timings_text.configure(state='normal')
+    timings_text.delete('1.0', tk.END)
+    timings_text.insert(tk.END, run.table())
+    timings_text.configure(state='disabled')
+
+def run_in_background(job, *args, on_done, name):
+    # run job(task, *args) on the worker thread, show its progress and hand the result to on_done here
+    # with timings on, the worker's stages (and the chart drawn from them in show_figure) make up one profiling run
+    current_run = []
+
+    def profiled(task, *job_args):
+        with profiling.run(name) as run:
+            current_run.append(run)
+            return job(task, *job_args)
+
+    def on_progress(fraction, message):
+        progress_bar['value'] = fraction
+        status_label.configure(text=message)
+
+    def finished(message):
+        progress_bar['value'] = 0
+        status_label.configure(text=message)
+
+    def done(result):
+        finished("Ready")
+        show_timings(current_run[0] if current_run else None)
+        on_done(result)
+
+    def failed(error):
+        finished("Failed")
+        messagebox.showerror("Error", f"{name} failed: {error}")
+
+    status_label.configure(text=f"{name}...")
+    task_runner.submit(profiled, *args, on_done=done, on_error=failed, on_progress=on_progress,
+                       on_cancel=lambda: finished(f"{name} cancelled"), widgets=busy_widgets, name=name)
+
 def upload_data(data_type):
     # ask for an excel file
     file_path = filedialog.askopenfilename(filetypes=[("Excel files", "*.xlsx *.xls")])
     # check if a file was selected
     if file_path:
-        # if the data type is 'workout', load and process workout data
-        if data_type == 'workout':
-            dataframe = data.loadWorkout(file_path)
-            processed_data = data.processWorkout(dataframe)
-            data_storage[data_type] = processed_data
-        # if the data type is 'diet', load dietary data
-        elif data_type == 'diet':
-            dataframe = data.loadDietary(file_path)
-            data_storage[data_type] = dataframe
-        
-        # check if both workout and diet data are available and combine them
-        if 'workout' in data_storage and 'diet' in data_storage:
-            data_storage['combined'] = pd.merge(data_storage['workout'], data_storage['diet'], on='Date', how='inner')
-        
-        # display a success message
-        messagebox.showinfo("Success", f"{data_type.capitalize()} data uploaded successfully.")
+        athlete = upload_athlete(file_path)
+        if not athlete:
+            return
+        run_in_background(load_data, data_type, file_path, athlete, on_done=lambda _: upload_finished(data_type),
+                          name=f"Loading {data_type} data")
+
+def upload_athlete(file_path):
+    # the name in the Athlete box, else the one in an <athlete>_workout.xlsx style file name, else ask
+    athlete = athlete_name.get().strip()
+    if not athlete:
+        match = FILE_PATTERN.match(os.path.basename(file_path))
+        athlete = match.group('athlete') if match and match.group('athlete') else None
+    if not athlete:
+        athlete = simpledialog.askstring("Input", "Whose data is this? Enter the athlete's name:", parent=main_window)
+        athlete = athlete.strip() if athlete else None
+    if athlete:
+        athlete_name.set(athlete)
+    return athlete
+
+def switch_athlete(athlete):
+    # a different athlete starts from an empty log instead of mixing with the previous one's data
+    global training_log, loaded_athlete
+    if athlete != loaded_athlete:
+        training_log = incremental.TrainingLog()
+        data_storage.clear()
+        uploaded_files.clear()
+        loaded_athlete = athlete
+
+def load_data(task, data_type, file_path, athlete):
+    # worker thread: parse and process the file, nothing here touches Tk
+    task.report(0.1, "Reading file")
+    switch_athlete(athlete)
+    # the same file uploaded again only adds its new sessions, a different file replaces the old data
+    same_file = uploaded_files.get(data_type) == file_path
+    # if the data type is 'workout', load and process workout data
+    if data_type == 'workout':
+        dataframe = data.loadWorkout(file_path, athlete=athlete)
+        # last chance to cancel, after this the stored data gets updated
+        task.report(0.5, "Processing workouts")
+        if same_file:
+            training_log.appendWorkout(dataframe)
+        else:
+            training_log.setWorkout(dataframe)
+    # if the data type is 'diet', load dietary data
+    elif data_type == 'diet':
+        dataframe = data.loadDietary(file_path, athlete=athlete)
+        task.report(0.5, "Processing diet")
+        if same_file:
+            training_log.appendDietary(dataframe)
+        else:
+            training_log.setDietary(dataframe)
+    uploaded_files[data_type] = file_path
+    combine_storage(data_type)
+
+def combine_storage(*data_types):
+    # the log's frames are only put together when an analysis first reads them, so an upload costs
+    # the new rows and not the whole history. the dataset reuses the log's same-day merge
+    log = training_log
+    loaders = {'workout': lambda: log.workout, 'diet': lambda: log.diet}
+    for data_type in data_types:
+        data_storage.setLazy(data_type, loaders[data_type])
+    if 'workout' in data_storage and 'diet' in data_storage:
+        data_storage.setLazy('combined', lambda: log.combined)
+        data_storage.setLazy('dataset', lambda: log.dataset)
+
+def loaded_rollups(data_type):
+    # the log's per day/week/month summaries, charts read these instead of the full frames
+    # checked on the Tk thread before a chart job starts, None once the user's been told what to upload
+    if data_type not in data_storage:
+        needed = "workout and dietary data" if data_type == 'combined' else f"{data_type} data"
+        messagebox.showerror("Error", f"Upload {needed} first.")
+        return None
+    return training_log.rollups
+
+def restore_data(task):
+    # worker thread: the last athlete's history comes back from the training store instead of excel
+    training_store = store.get_default_store()
+    athlete = training_store.lastAthlete()
+    if athlete is None:
+        return None, []
+    switch_athlete(athlete)
+    task.report(0.2, "Reading saved workouts")
+    workout = training_store.workout(athlete)
+    task.report(0.5, "Reading saved diet")
+    diet = training_store.dietary(athlete)
+    if not workout.empty:
+        training_log.setWorkout(workout)
+    if not diet.empty:
+        training_log.setDietary(diet)
+    combine_storage(*[data_type for data_type, frame in (('workout', workout), ('diet', diet)) if not frame.empty])
+    return athlete, sorted(key for key in ('workout', 'diet') if key in data_storage)
+
+def restore_finished(result):
+    athlete, restored = result
+    if restored:
+        athlete_name.set(athlete)
+        status_label.configure(text=f"Restored {athlete}'s saved {' and '.join(restored)} data")
+
+def upload_finished(data_type):
+    # display a success message
+    messagebox.showinfo("Success", f"{data_type.capitalize()} data uploaded successfully.")
+
+def show_figure(draw, *args, size):
+    # charts are drawn on the Tk thread from results the worker computed
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=visualization.FIGSIZES[size])
+    with profiling.run('draw', into=profiling.last_run) as run:
+        draw(fig, *args)
+    show_timings(run)
+    plt.show()
 
 def run_analysis(option):
     # based on user selection will do a certain analysis function as prev written
+    # the dialogs run here, the number crunching runs in the background
     if option == "Correlate Diet to Workout":
-        correlation_matrix = analysis.correlateDietToWorkout(data_storage['workout'], data_storage['diet'])
-        result = visualization.heatmap(correlation_matrix)
-        messagebox.showinfo("Analysis Result", str(result))
+        def show(correlation_matrix):
+            show_figure(visualization.drawHeatmap, correlation_matrix, size='heatmap')
+            messagebox.showinfo("Analysis Result", str(correlation_matrix))
+        run_in_background(lambda task: analysis.correlateDietToWorkout(data_storage['dataset']),
+                          on_done=show, name=option)
 
     elif option == "Predict Performance":
-        result = analysis.predictPerformance(data_storage['workout'], data_storage['diet'])
-        messagebox.showinfo("Analysis Result", str(result))
+        def show(performance):
+            show_figure(visualization.drawPerformance, performance, size='performance')
+            messagebox.showinfo("Analysis Result", str(performance['model']))
+        run_in_background(lambda task: analysis.performanceModel(data_storage['dataset']),
+                          on_done=show, name=option)
 
     elif option == "Diet Effectiveness":
-        # prompt user to enter the date of dietary intervention
-        intervention_date = simpledialog.askstring("Input", "Enter the intervention date (YYYY-MM-DD):", parent=main_window)
-        # process data before and after the intervention
-        before_data, after_data = data.ProcessDietaryChange(data_storage['workout'], data_storage['diet'], intervention_date)
-        result = analysis.dietEffectiveness(before_data, after_data)
-        messagebox.showinfo("Diet Effectiveness Result", f"T-statistic: {result['T-statistic']}, P-value: {result['P-value']}")
+        # prompt user to enter the date of dietary intervention, left blank every date gets tested
+        intervention_date = simpledialog.askstring("Input", "Enter the intervention date (YYYY-MM-DD),\nor leave blank to scan every date:", parent=main_window)
+        if intervention_date is None:
+            return
+        if not intervention_date.strip():
+            def diet_scan(task):
+                task.report(0.2, "Finding calorie changes")
+                changes = analysis.dietEffectivenessScan(data_storage['dataset'], candidates='changepoints')
+                task.report(0.6, "Testing every date")
+                return changes, analysis.dietEffectivenessScan(data_storage['dataset'])
+            def show_scan(result):
+                changes, ranked = result
+                columns = ['Date', 'T-statistic', 'P-value', 'Adjusted P-value']
+                text = "Calorie changepoints:\n" + (changes[columns].to_string() if len(changes) else "none found")
+                text += "\n\nBest intervention dates (Holm corrected):\n" + ranked[columns].head(5).to_string()
+                messagebox.showinfo("Diet Effectiveness Scan", text)
+            run_in_background(diet_scan, on_done=show_scan, name=option)
+            return
+        def diet_effectiveness(task):
+            # process data before and after the intervention
+            before_data, after_data = data.ProcessDietaryChange(data_storage['dataset'], None, intervention_date)
+            task.report(0.5, "Running t-test")
+            return analysis.dietEffectiveness(before_data, after_data)
+        def show(result):
+            messagebox.showinfo("Diet Effectiveness Result", f"T-statistic: {result['T-statistic']}, P-value: {result['P-value']}")
+        run_in_background(diet_effectiveness, on_done=show, name=option)
 
     elif option == "Nutrition Analysis":
         # prompt user to select an exercise for analysis
         exercise = simpledialog.askstring("Input", "Enter the exercise name (Bench Press, Squat, or Deadlift):", parent=main_window)
-        combined_data = analysis.AlignDataforNutrition(data_storage['diet'], data_storage['workout'])
-        # standardize weights for consistent analysis
-        combined_data = analysis.standardize_weights(combined_data)
-        nutrition_results = analysis.nutritionAnalysis(combined_data, exercise)
-        # show the analysis results in a message box
-        results_message = (
-            f"Intercept: {nutrition_results['Intercept']}\n"
-            f"Protein Coefficient: {nutrition_results['Protein Coefficient']}\n"
-            f"Carbs Coefficient: {nutrition_results['Carbs Coefficient']}\n"
-            f"Fats Coefficient: {nutrition_results['Fats Coefficient']}\n"
-            f"Calories Coefficient: {nutrition_results['Calories Coefficient']}\n"
-            f"Score: {nutrition_results['Score']}")
-        messagebox.showinfo("Nutrition Analysis Results", results_message)
+        def nutrition_analysis(task):
+            # the weights were standardized when the workout was processed, the lag 1 view already has them
+            combined_data = analysis.AlignDataforNutrition(data_storage['dataset'])
+            task.report(0.5, "Fitting model")
+            return analysis.nutritionAnalysis(combined_data, exercise)
+        def show(nutrition_results):
+            # show the analysis results in a message box
+            results_message = (
+                f"Intercept: {nutrition_results['Intercept']}\n"
+                f"Protein Coefficient: {nutrition_results['Protein Coefficient']}\n"
+                f"Carbs Coefficient: {nutrition_results['Carbs Coefficient']}\n"
+                f"Fats Coefficient: {nutrition_results['Fats Coefficient']}\n"
+                f"Calories Coefficient: {nutrition_results['Calories Coefficient']}\n"
+                f"Score: {nutrition_results['Score']}")
+            messagebox.showinfo("Nutrition Analysis Results", results_message)
+        run_in_background(nutrition_analysis, on_done=show, name=option)
 
 def run_visualization(option):
     # visual based on user selection
     if option == "Macro Distribution":
-        visualization.MacroDist(data_storage['combined'])
+        rollups = loaded_rollups('combined')
+        if rollups is None:
+            return
+        run_in_background(lambda task: visualization.macroMeans(rollups),
+                          on_done=lambda means: show_figure(visualization.drawMacroDist, means, size='macros'), name=option)
 
     elif option == "Performance Gains":
-        visualization.gains(data_storage['workout'])
+        rollups = loaded_rollups('workout')
+        if rollups is None:
+            return
+        run_in_background(lambda task: visualization.gainsSeries(rollups),
+                          on_done=lambda series: show_figure(visualization.drawGains, series, size='gains'), name=option)
 
     elif option == "Exercise Progress":
+        rollups = loaded_rollups('combined')
+        if rollups is None:
+            return
         # prompt user to enter exercise name and goal weight
         exercise = simpledialog.askstring("Input", "Enter the exercise name:", parent=main_window)
         goal_value = simpledialog.askinteger("Input", "Enter your goal weight (kg):", parent=main_window)
-        visualization.exerciseProgress(data_storage['combined'], exercise, goal_value)
+        run_in_background(lambda task: visualization.currentLift(rollups, exercise),
+                          on_done=lambda current: show_figure(visualization.drawProgress, exercise, current, goal_value, size='progress'),
+                          name=option)
 
     elif option == "Forecast Specific Lift":
-        # prompt user to enter exercise name and number of future sessions (in months)
+        # prompt user to enter exercise name and number of future sessions (spaced like their past sessions)
         exercise = simpledialog.askstring("Input", "Enter the exercise name:", parent=main_window)
         future_sessions = simpledialog.askinteger("Input", "Enter the number of future sessions:", parent=main_window)
-        visualization.forecastLift(data_storage['combined'], exercise, future_sessions)
+        run_in_background(lambda task: visualization.forecastSeries(data_storage['dataset'].combined, exercise, future_sessions),
+                          on_done=lambda forecast: show_figure(visualization.drawForecast, forecast, size='forecast'), name=option)
+
+def export_results():
+    if 'dataset' not in data_storage:
+        messagebox.showerror("Error", "Upload workout and dietary data first.")
+        return
+    # an .xlsx name gives one workbook, .csv or .parquet a folder of that name with one file per table
+    path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel workbook", "*.xlsx"),
+                                        ("CSV files (folder)", "*.csv"), ("Parquet files (folder)", "*.parquet")])
+    if not path:
+        return
+    root, extension = os.path.splitext(path)
+    fmt = extension.lower().lstrip('.') or 'xlsx'
+    output = path if fmt == 'xlsx' else root
+    run_in_background(lambda task: export.exportAthlete(output, data_storage['workout'], data_storage['diet'], fmt=fmt),
+                      on_done=lambda rows: messagebox.showinfo("Exported", f"Results written to {output}"),
+                      name="Export")
 
 if __name__ == "__main__":
+    # keep parsed uploads around between sessions unless a cache dir was set in the environment
+    if cache.get_default_cache() is None:
+        cache.configure(os.path.join(os.path.expanduser('~'), '.optilift', 'cache'))
+    # repeated analyses on the same data come from memory, or from disk after a restart
+    memo.configure(directory=os.path.join(os.path.expanduser('~'), '.optilift', 'results'))
+    # uploads are written through to a local database and read back on the next start
+    if store.get_default_store() is None:
+        store.configure(os.path.join(os.path.expanduser('~'), '.optilift', 'optilift.db'))
     main_window = launch_main_window()
+    if any(store.get_default_store().counts()[table] for table in ('lifts', 'nutrition')):
+        run_in_background(restore_data, on_done=restore_finished, name="Restoring saved data")
     main_window.mainloop()
\ No newline at end of file
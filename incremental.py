@@ -0,0 +1,182 @@
+# incremental append mode: only newly added sessions get processed and merged
+# stored frames are kept as date-sorted parts so an append touches the new rows plus the last stored day
+
+import pandas as pd
+import data
+from ingest import WorkoutAggregates, DietAggregates
+from loadmetrics import LoadTracker
+from downsample import Rollups
+from dataset import CombinedDataset, combine
+
+WORKOUT_KEYS = ['Date', 'Exercise', 'Sets', 'Reps', 'Weight (kg)']
+DIETARY_KEYS = ['Date', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+POLICIES = ('newer', 'dedup')
+
+
+class _Parts:
+    # a frame stored as appended pieces, concatenated only when someone reads it
+    def __init__(self):
+        self.parts = []
+        self.sorted = True
+        self._frame = None
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    @property
+    def last_date(self):
+        if not self.parts:
+            return None
+        if self.sorted:
+            return self.parts[-1]['Date'].iloc[-1]
+        return max(part['Date'].max() for part in self.parts)
+
+    def append(self, frame):
+        if frame.empty:
+            return
+        frame = frame.sort_values('Date', kind='stable')
+        last_date = self.last_date
+        if last_date is not None and frame['Date'].iloc[0] < last_date:
+            self.sorted = False
+        self.parts.append(frame)
+        self._frame = None
+
+    def since(self, start, end=None):
+        # stored rows dated in [start, end], binary searched while the parts are in date order
+        found = []
+        for part in reversed(self.parts):
+            dates = part['Date']
+            if self.sorted:
+                lo = dates.searchsorted(start, side='left')
+                hi = len(dates) if end is None else dates.searchsorted(end, side='right')
+                if hi > lo:
+                    found.append(part.iloc[lo:hi])
+                if lo > 0:
+                    break
+            else:
+                mask = dates >= start if end is None else dates.between(start, end)
+                if mask.any():
+                    found.append(part[mask])
+        return pd.concat(found[::-1]) if found else None
+
+    @property
+    def frame(self):
+        if self._frame is None and self.parts:
+            frame = pd.concat(self.parts, ignore_index=True)
+            if not self.sorted:
+                frame = frame.sort_values('Date', kind='stable', ignore_index=True)
+            # collapse into one part so the next read is free
+            self.parts, self.sorted, self._frame = [frame], True, frame
+        return self._frame
+
+
+def _unseen(rows, stored, keys):
+    # rows that are not already stored, counting repeats so a second identical set on a day still counts
+    if stored is None or stored.empty:
+        return rows
+    keys = [key for key in keys if key in rows.columns and key in stored.columns]
+    left = rows[keys].assign(_seen=rows.groupby(keys, observed=True).cumcount().to_numpy())
+    right = stored[keys].assign(_seen=stored.groupby(keys, observed=True).cumcount().to_numpy())
+    right = right.drop_duplicates()
+    matched = left.merge(right, on=keys + ['_seen'], how='left', indicator=True)['_merge'].to_numpy()
+    return rows[matched == 'left_only']
+
+
+def _new_rows(rows, stored, keys, policy):
+    if policy not in POLICIES:
+        raise ValueError(f"policy must be one of {POLICIES}, got {policy!r}")
+    last_date = stored.last_date
+    if last_date is None:
+        return rows
+    if policy == 'newer':
+        # everything before the last stored day is assumed seen, that day itself gets deduped
+        rows = rows[rows['Date'] >= last_date]
+        fresh = rows[rows['Date'] > last_date]
+        overlap = rows[rows['Date'] == last_date]
+        if overlap.empty:
+            return fresh
+        return pd.concat([_unseen(overlap, stored.since(last_date), keys), fresh])
+    start, end = rows['Date'].min(), rows['Date'].max()
+    return _unseen(rows, stored.since(start, end), keys)
+
+
+class TrainingLog:
+    # processed workout, diet and their same-day merge, plus running aggregates, all updated in place
+    def __init__(self):
+        self._workout = _Parts()
+        self._diet = _Parts()
+        self._combined = _Parts()
+        self.workout_aggregates = WorkoutAggregates()
+        self.diet_aggregates = DietAggregates()
+        self.load_metrics = LoadTracker()
+        self.rollups = Rollups()
+        self._dataset = None
+
+    @property
+    def workout(self):
+        return self._workout.frame
+
+    @property
+    def diet(self):
+        return self._diet.frame
+
+    @property
+    def combined(self):
+        if self._combined.parts or self.workout is None or self.diet is None:
+            return self._combined.frame
+        # no shared dates yet, still hand back the merged columns
+        return combine(self.workout.iloc[:0], self.diet.iloc[:0])
+
+    @property
+    def dataset(self):
+        # CombinedDataset for the analyses, kept until the next append. its same-day join is the combined
+        # parts merged as they arrived, so reading it never merges the whole history again
+        if self._dataset is None and self.workout is not None and self.diet is not None:
+            self._dataset = CombinedDataset(self.workout, self.diet, joined=self.combined)
+        return self._dataset
+
+    def appendWorkout(self, rows, policy='newer'):
+        # returns the newly processed rows
+        new_rows = _new_rows(rows, self._workout, WORKOUT_KEYS, policy)
+        processed = data.processWorkout(new_rows)
+        if processed.empty:
+            return processed
+        self._workout.append(processed)
+        self._dataset = None
+        self.workout_aggregates.update(processed)
+        self.load_metrics.update(processed)
+        self.rollups.updateWorkout(processed)
+        diet = self._diet.since(processed['Date'].min(), processed['Date'].max())
+        if diet is not None:
+            self._combined.append(combine(processed, diet))
+        return processed
+
+    def appendDietary(self, rows, policy='newer'):
+        new_rows = _new_rows(rows, self._diet, DIETARY_KEYS, policy)
+        processed = data.processDietary(new_rows)
+        if processed.empty:
+            return processed
+        self._diet.append(processed)
+        self._dataset = None
+        self.diet_aggregates.update(processed)
+        self.rollups.updateDietary(processed)
+        workout = self._workout.since(processed['Date'].min(), processed['Date'].max())
+        if workout is not None:
+            self._combined.append(combine(workout, processed))
+        return processed
+
+    def setWorkout(self, rows):
+        # replace the workout history, e.g. when a different athlete's file is uploaded
+        self._workout, self._combined = _Parts(), _Parts()
+        self._dataset = None
+        self.workout_aggregates = WorkoutAggregates()
+        self.load_metrics = LoadTracker()
+        self.rollups.clearWorkout()
+        self.appendWorkout(rows)
+
+    def setDietary(self, rows):
+        self._diet, self._combined = _Parts(), _Parts()
+        self._dataset = None
+        self.diet_aggregates = DietAggregates()
+        self.rollups.clearDietary()
+        self.appendDietary(rows)
@@ -0,0 +1,170 @@
+# bootstrap confidence intervals and permutation p-values for correlations and regression coefficients
+# resamples are drawn as (batch, n) index arrays and evaluated in one vectorized call per batch,
+# batches can go to a process pool and every batch has its own child of one SeedSequence, so the
+# result for a seed is the same however many workers run it
+# sampling stops early once the intervals (or p-values) move less than `tol` between batches
+
+import numpy as np
+import pandas as pd
+import regression
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_BATCH = 250
+DEFAULT_TOL = 0.005
+
+
+def _permuted(rng, shape, n):
+    # independent permutations of range(n) along the last axis
+    return rng.permuted(np.broadcast_to(np.arange(n), shape + (n,)), axis=-1)
+
+
+def _correlations(samples):
+    # pearson matrices for a (b, n, p) stack, constant columns give NaN like DataFrame.corr
+    centered = samples - samples.mean(axis=1, keepdims=True)
+    cov = np.einsum('bnp,bnq->bpq', centered, centered)
+    scale = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / (scale[:, :, None] * scale[:, None, :])
+
+
+def _correlation_batch(arrays, rng, size, kind):
+    (data,) = arrays
+    n, p = data.shape
+    if kind == 'bootstrap':
+        return _correlations(data[rng.integers(0, n, (size, n))])
+    # every column gets its own shuffle, which breaks all the pairings at once
+    rows = _permuted(rng, (size, p), n)
+    return _correlations(data[rows, np.arange(p)[None, :, None]].transpose(0, 2, 1))
+
+
+def _regression_batch(arrays, rng, size, kind):
+    X, y = arrays
+    n = len(y)
+    if kind == 'bootstrap':
+        rows = rng.integers(0, n, (size, n))
+        fit = regression.fitBatch(X[rows], y[rows])
+        return np.column_stack([fit.intercept, fit.coef])
+    # shuffled targets, compared on t statistics so coefficients with different scales are treated alike
+    rows = _permuted(rng, (size,), n)
+    fit = regression.fitBatch(np.broadcast_to(X, (size,) + X.shape), y[rows])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return fit.coef / fit.stderr
+
+
+def _run_batch(job):
+    statistic, arrays, seed, size, kind = job
+    return statistic(arrays, np.random.default_rng(seed), size, kind)
+
+
+def resample(statistic, arrays, kind, resamples, summarize, batch=DEFAULT_BATCH, seed=0, workers=None, tol=DEFAULT_TOL):
+    # stacked statistics of up to `resamples` bootstrap or permutation draws
+    # summarize(samples) is what early stopping watches, it should be in units where tol makes sense
+    if kind not in ('bootstrap', 'permutation'):
+        raise ValueError(f"kind must be 'bootstrap' or 'permutation', got {kind!r}")
+    sizes = [min(batch, resamples - start) for start in range(0, resamples, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(statistic, arrays, child, size, kind) for child, size in zip(seeds, sizes)]
+
+    executor = None
+    if workers and workers > 1 and len(jobs) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+    step = workers if executor else 1
+    done, previous = [], None
+    try:
+        for start in range(0, len(jobs), step):
+            batches = executor.map(_run_batch, jobs[start:start + step]) if executor else map(_run_batch, jobs[start:start + step])
+            # batches are checked in order, so stopping doesn't depend on how many ran in parallel
+            for samples in batches:
+                done.append(samples)
+                if not tol:
+                    continue
+                current = summarize(np.concatenate(done))
+                if previous is not None and np.nanmax(np.abs(current - previous), initial=0) <= tol:
+                    return np.concatenate(done)
+                previous = current
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return np.concatenate(done)
+
+
+def percentileInterval(samples, alpha=0.05):
+    # (lower, upper) percentile bootstrap interval along the first axis, ignoring NaN draws
+    with np.errstate(invalid='ignore'):
+        lower, upper = np.nanquantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+    return lower, upper
+
+
+def permutationPValue(null, observed):
+    # two sided, with the +1 so a p-value is never exactly 0
+    valid = ~np.isnan(null)
+    extreme = (np.abs(null) >= np.abs(observed) - 1e-12) & valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p_value = (extreme.sum(axis=0) + 1) / (valid.sum(axis=0) + 1)
+    return np.where(np.isnan(observed), np.nan, p_value)
+
+
+def bootstrapCorrelation(frame, resamples=DEFAULT_RESAMPLES, permutations=DEFAULT_RESAMPLES, alpha=0.05, seed=0,
+                         workers=None, batch=DEFAULT_BATCH, tol=DEFAULT_TOL):
+    # one row per pair of columns: pearson r, bootstrap interval and permutation p-value
+    frame = frame.dropna()
+    columns = list(frame.columns)
+    data = frame.to_numpy(dtype='float64')
+    observed = _correlations(data[None])[0]
+    options = dict(batch=batch, workers=workers, tol=tol)
+
+    boot = resample(_correlation_batch, (data,), 'bootstrap', resamples,
+                    lambda samples: np.stack(percentileInterval(samples, alpha)), seed=seed, **options)
+    null = resample(_correlation_batch, (data,), 'permutation', permutations,
+                    lambda samples: permutationPValue(samples, observed), seed=[seed, 1], **options)
+    lower, upper = percentileInterval(boot, alpha)
+    p_value = permutationPValue(null, observed)
+
+    first, second = np.triu_indices(len(columns), k=1)
+    table = pd.DataFrame({
+        'Correlation': observed[first, second],
+        'Lower': lower[first, second],
+        'Upper': upper[first, second],
+        'P-value': p_value[first, second],
+    }, index=pd.MultiIndex.from_arrays([np.array(columns)[first], np.array(columns)[second]],
+                                       names=['Variable', 'With']))
+    table.attrs.update(resamples=len(boot), permutations=len(null), alpha=alpha)
+    return table
+
+
+def bootstrapRegression(X, y, names=None, resamples=DEFAULT_RESAMPLES, permutations=DEFAULT_RESAMPLES, alpha=0.05, seed=0,
+                        workers=None, batch=DEFAULT_BATCH, tol=DEFAULT_TOL):
+    # ols coefficients with pairs-bootstrap intervals and permutation p-values (the intercept has no p-value)
+    X = np.asarray(X, dtype='float64')
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    y = np.asarray(y, dtype='float64')
+    keep = ~(np.isnan(X).any(axis=1) | np.isnan(y))
+    X, y = X[keep], y[keep]
+    names = [f'x{i}' for i in range(X.shape[1])] if names is None else list(names)
+
+    fit = regression.fitOLS(X, y)
+    estimate = np.concatenate([fit.intercept, fit.coef[0]])
+    stderr = np.concatenate([fit.intercept_stderr, fit.stderr[0]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        observed_t = fit.coef[0] / fit.stderr[0]
+    # intervals are compared in standard errors so tol doesn't depend on the units of each feature
+    scale = np.where(np.isfinite(stderr) & (stderr > 0), stderr, 1.0)
+    options = dict(batch=batch, workers=workers, tol=tol)
+
+    boot = resample(_regression_batch, (X, y), 'bootstrap', resamples,
+                    lambda samples: np.stack(percentileInterval(samples, alpha)) / scale, seed=seed, **options)
+    null = resample(_regression_batch, (X, y), 'permutation', permutations,
+                    lambda samples: permutationPValue(samples, observed_t), seed=[seed, 1], **options)
+    lower, upper = percentileInterval(boot, alpha)
+
+    table = pd.DataFrame({
+        'Estimate': estimate,
+        'SE': stderr,
+        'Lower': lower,
+        'Upper': upper,
+        'P-value': np.concatenate([[np.nan], permutationPValue(null, observed_t)]),
+    }, index=pd.Index(['Intercept'] + names, name='Term'))
+    table.attrs.update(resamples=len(boot), permutations=len(null), alpha=alpha)
+    return table
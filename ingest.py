@@ -0,0 +1,125 @@
+# streaming ingestion for training logs too big to load in one go
+# chunks go through the same steps as processWorkout/processDietary and only running aggregates are kept
+
+import os
+import pandas as pd
+import data
+from schema import applyWorkoutSchema, applyDietarySchema
+
+DEFAULT_CHUNKSIZE = 50000
+MACROS = ['Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+
+
+def _excel_chunks(path, chunksize):
+    # read-only openpyxl streams rows instead of building the whole workbook in memory
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == chunksize:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+
+def iterChunks(source, chunksize=DEFAULT_CHUNKSIZE):
+    # raw frames of at most chunksize rows from a csv, xlsx or json lines file
+    extension = os.path.splitext(str(source))[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(source, chunksize=chunksize)
+    elif extension in ('.xlsx', '.xlsm'):
+        yield from _excel_chunks(source, chunksize)
+    elif extension in ('.jsonl', '.ndjson'):
+        with pd.read_json(source, lines=True, chunksize=chunksize, convert_dates=False) as reader:
+            yield from reader
+    else:
+        raise ValueError(f"can't stream {source!r}, expected a .csv, .xlsx or .jsonl file")
+
+
+def _parse_dates(chunk, date_format):
+    if 'Date' in chunk.columns and not pd.api.types.is_datetime64_any_dtype(chunk['Date']):
+        chunk['Date'] = pd.to_datetime(chunk['Date'], format=date_format)
+    return chunk
+
+
+def streamWorkout(source, chunksize=DEFAULT_CHUNKSIZE, date_format='%m/%d/%Y'):
+    # processed workout chunks (volume, standardized weight, intensity) one at a time
+    for chunk in iterChunks(source, chunksize):
+        chunk = applyWorkoutSchema(_parse_dates(chunk, date_format))
+        yield data.processWorkout(chunk)
+
+
+def streamDietary(source, chunksize=DEFAULT_CHUNKSIZE, date_format='%m/%d/%Y'):
+    for chunk in iterChunks(source, chunksize):
+        chunk = applyDietarySchema(_parse_dates(chunk, date_format))
+        yield data.processDietary(chunk)
+
+
+class WorkoutAggregates:
+    # running per-day volume and per-lift max, memory grows with days and lifts, not rows
+    def __init__(self):
+        self.rows = 0
+        self.daily_volume = pd.Series(dtype='float64', name='Total Volume')
+        self.lift_max = pd.Series(dtype='float64', name='Weight (kg)')
+
+    def update(self, chunk):
+        if chunk.empty:
+            return self
+        self.rows += len(chunk)
+        # float64 running totals, the chunks themselves may be float32
+        daily = chunk['Total Volume'].astype('float64').groupby(chunk['Date']).sum()
+        self.daily_volume = self.daily_volume.add(daily, fill_value=0).rename('Total Volume')
+        lift_max = chunk.groupby('Exercise', observed=True)['Weight (kg)'].max().astype('float64')
+        # every chunk's categoricals have their own categories, plain string names line up across chunks
+        lift_max.index = lift_max.index.astype(str)
+        if self.lift_max.empty:
+            self.lift_max = lift_max.rename('Weight (kg)')
+        else:
+            self.lift_max = pd.concat([self.lift_max, lift_max]).groupby(level=0).max().rename('Weight (kg)')
+        return self
+
+
+class DietAggregates:
+    # running macro sums so the means come out the same as on the full frame
+    def __init__(self):
+        self.rows = 0
+        self.sums = pd.Series(0.0, index=MACROS)
+        self.counts = pd.Series(0, index=MACROS)
+        self.calorie_categories = pd.Series(dtype='int64', name='count')
+
+    def update(self, chunk):
+        if chunk.empty:
+            return self
+        self.rows += len(chunk)
+        present = [macro for macro in MACROS if macro in chunk.columns]
+        self.sums[present] += chunk[present].astype('float64').sum()
+        self.counts[present] += chunk[present].count()
+        categories = chunk['Calorie Category'].value_counts()
+        self.calorie_categories = self.calorie_categories.add(categories, fill_value=0).astype('int64')
+        return self
+
+    def means(self):
+        return self.sums / self.counts.where(self.counts > 0)
+
+
+def ingestWorkout(source, chunksize=DEFAULT_CHUNKSIZE, date_format='%m/%d/%Y'):
+    aggregates = WorkoutAggregates()
+    for chunk in streamWorkout(source, chunksize, date_format):
+        aggregates.update(chunk)
+    return aggregates
+
+
+def ingestDietary(source, chunksize=DEFAULT_CHUNKSIZE, date_format='%m/%d/%Y'):
+    aggregates = DietAggregates()
+    for chunk in streamDietary(source, chunksize, date_format):
+        aggregates.update(chunk)
+    return aggregates
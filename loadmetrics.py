@@ -0,0 +1,178 @@
+# time-windowed training load on top of processWorkout's output
+# rolling 7/28 day volume, acute:chronic workload ratio, estimated 1RM per lift and weekly tonnage
+# everything is aggregated to one row per athlete per day first, so the windows scale with days, not sets
+
+import numpy as np
+import pandas as pd
+
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+FORMULAS = ('epley', 'brzycki')
+
+
+def volumeColumn(days):
+    return f'{days} Day Volume'
+
+
+# the extra columns correlateDietToWorkout adds with load_features=True
+LOAD_FEATURES = [volumeColumn(ACUTE_DAYS), volumeColumn(CHRONIC_DAYS), 'ACWR', 'e1RM']
+
+
+def _keys(frame):
+    # per athlete when the log has several, otherwise the whole log is one series
+    return ['Athlete'] if 'Athlete' in frame.columns else []
+
+
+def estimated1RM(weight, reps, formula='epley'):
+    # single set -> estimated one rep max, a set of 1 is the 1RM itself and 0 reps gives NaN
+    if formula not in FORMULAS:
+        raise ValueError(f"formula must be one of {FORMULAS}, got {formula!r}")
+    weight = np.asarray(weight, dtype='float64')
+    reps = np.asarray(reps, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if formula == 'epley':
+            estimate = weight * (1 + reps / 30)
+        else:
+            # brzycki breaks down past 36 reps
+            estimate = np.where(reps < 37, weight * 36 / (37 - reps), np.nan)
+    estimate = np.where(reps == 1, weight, estimate)
+    return np.where(reps >= 1, estimate, np.nan)
+
+
+def dailyVolume(workout_data):
+    # total volume per athlete per day, sorted by athlete then date
+    keys = _keys(workout_data)
+    volume = workout_data['Total Volume'].astype('float64').rename('Volume')
+    daily = volume.groupby([workout_data[key] for key in keys + ['Date']], observed=True).sum()
+    return daily.reset_index()
+
+
+def liftDaily(workout_data, formula='epley'):
+    # per lift per day: tonnage actually lifted (sets x reps x kg), sets done and the best e1RM of the day
+    keys = _keys(workout_data) + ['Exercise', 'Date']
+    sets = workout_data['Sets'].astype('float64')
+    reps = workout_data['Reps'].astype('float64')
+    weight = workout_data['Weight (kg)'].astype('float64')
+    rows = pd.DataFrame({'Tonnage': sets * reps * weight, 'Sets': sets,
+                         'Best e1RM': estimated1RM(weight, reps, formula)}, index=workout_data.index)
+    grouped = rows.groupby([workout_data[key] for key in keys], observed=True)
+    return grouped.agg({'Tonnage': 'sum', 'Sets': 'sum', 'Best e1RM': 'max'}).reset_index()
+
+
+def _window_sums(daily, keys, days):
+    # trailing `days`-day sums of Volume for every row, daily must be sorted by keys then date
+    # groups are laid end to end on one integer day axis so a single searchsorted finds every window start
+    day = daily['Date'].to_numpy('datetime64[D]').astype('int64')
+    if len(day) == 0:
+        return np.zeros(0)
+    group = daily.groupby(keys, observed=True, sort=False).ngroup().to_numpy() if keys else np.zeros(len(day), 'int64')
+    position = group * (day.max() - day.min() + days + 1) + (day - day.min())
+    total = np.concatenate([[0.0], np.cumsum(daily['Volume'].to_numpy('float64'))])
+    start = np.searchsorted(position, position - days + 1, side='left')
+    return total[1:] - total[start]
+
+
+def rollingLoad(daily, acute=ACUTE_DAYS, chronic=CHRONIC_DAYS):
+    # adds the acute and chronic rolling volumes and their ratio to a dailyVolume frame
+    # the chronic load is the average `acute`-day volume over the chronic window, so a steady
+    # athlete sits at an ACWR of 1; days with no chronic load get NaN
+    keys = _keys(daily)
+    daily = daily.sort_values(keys + ['Date'], kind='stable', ignore_index=True)
+    acute_volume = _window_sums(daily, keys, acute)
+    chronic_volume = _window_sums(daily, keys, chronic)
+    chronic_load = chronic_volume * acute / chronic
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(chronic_load > 0, acute_volume / chronic_load, np.nan)
+    return daily.assign(**{volumeColumn(acute): acute_volume, volumeColumn(chronic): chronic_volume,
+                           'Chronic Load': chronic_load, 'ACWR': ratio})
+
+
+def loadMetrics(workout_data, acute=ACUTE_DAYS, chronic=CHRONIC_DAYS):
+    # one row per athlete per training day with its volume, rolling volumes and ACWR
+    return rollingLoad(dailyVolume(workout_data), acute, chronic)
+
+
+def weeklyTonnage(lift_daily):
+    # tonnage per lift per week (weeks start on monday), from liftDaily or a processed workout frame
+    if 'Tonnage' not in lift_daily.columns:
+        lift_daily = liftDaily(lift_daily)
+    dates = lift_daily['Date']
+    week = (dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')).dt.normalize().rename('Week')
+    keys = [lift_daily[key] for key in _keys(lift_daily) + ['Exercise']] + [week]
+    return lift_daily.groupby(keys, observed=True)[['Tonnage', 'Sets']].sum().reset_index()
+
+
+def addLoadFeatures(frame, workout_data, acute=ACUTE_DAYS, chronic=CHRONIC_DAYS, formula='epley'):
+    # the day's rolling load next to every row of `frame`, plus the row's own e1RM
+    # the windows come from the whole workout log so days without a diet entry still count
+    keys = _keys(frame) if _keys(workout_data) else []
+    metrics = loadMetrics(workout_data, acute, chronic)
+    columns = keys + ['Date', volumeColumn(acute), volumeColumn(chronic), 'ACWR']
+    merged = frame.merge(metrics[columns], on=keys + ['Date'], how='left')
+    merged['e1RM'] = estimated1RM(merged['Weight (kg)'], merged['Reps'], formula)
+    return merged
+
+
+def _accumulate(stored, new, by, how):
+    # stored is in date order (by starts with Date), only its rows on or after the new chunk's first date
+    # are regrouped together with the chunk, the rows before that are kept as they are
+    split = 0 if stored is None else stored['Date'].searchsorted(new['Date'].min(), side='left')
+    tail = new if stored is None else pd.concat([stored.iloc[split:], new], ignore_index=True)
+    tail = tail.groupby(by, observed=True, sort=True).agg(how).reset_index()
+    return tail if stored is None else pd.concat([stored.iloc[:split], tail], ignore_index=True)
+
+
+class LoadTracker:
+    # load metrics kept up to date as sessions are appended
+    # the tables are stored in date order, so an append only regroups the days from its first date onwards
+    # and recomputes the rolling windows from there, reading back chronic - 1 days of stored volume
+    def __init__(self, acute=ACUTE_DAYS, chronic=CHRONIC_DAYS, formula='epley'):
+        if formula not in FORMULAS:
+            raise ValueError(f"formula must be one of {FORMULAS}, got {formula!r}")
+        self.acute, self.chronic, self.formula = acute, chronic, formula
+        self.lifts = None
+        self._loads = None
+        self._daily = None
+
+    @property
+    def daily(self):
+        # one row per athlete per day in athlete then date order, the same rows loadMetrics gives
+        if self._daily is None and self._loads is not None:
+            keys = _keys(self._loads)
+            self._daily = self._loads.sort_values(keys + ['Date'], kind='stable', ignore_index=True) if keys else self._loads
+        return self._daily
+
+    def update(self, processed):
+        if processed.empty:
+            return self
+        keys = _keys(processed)
+        self.lifts = _accumulate(self.lifts, liftDaily(processed, self.formula), ['Date'] + keys + ['Exercise'],
+                                 {'Tonnage': 'sum', 'Sets': 'sum', 'Best e1RM': 'max'})
+
+        start = processed['Date'].min()
+        new = dailyVolume(processed)
+        stored = self._loads
+        if stored is not None:
+            # windows ending on or after `start` only reach back chronic - 1 days
+            reach = stored['Date'].searchsorted(start - pd.Timedelta(days=self.chronic - 1), side='left')
+            new = pd.concat([stored.iloc[reach:][keys + ['Date', 'Volume']], new], ignore_index=True)
+        volume = new.groupby(keys + ['Date'], observed=True, sort=True)['Volume'].sum().reset_index()
+        tail = rollingLoad(volume, self.acute, self.chronic)
+        tail = tail[tail['Date'] >= start].sort_values(['Date'] + keys, kind='stable')
+        if stored is not None:
+            tail = pd.concat([stored.iloc[:stored['Date'].searchsorted(start, side='left')], tail])
+        self._loads = tail.reset_index(drop=True)
+        self._daily = None
+        return self
+
+    def weeklyTonnage(self):
+        if self.lifts is None:
+            return None
+        return weeklyTonnage(self.lifts)
+
+    def bestLifts(self):
+        # best e1RM ever per lift (and athlete)
+        if self.lifts is None:
+            return None
+        keys = _keys(self.lifts) + ['Exercise']
+        return self.lifts.groupby(keys, observed=True)['Best e1RM'].max()
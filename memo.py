@@ -0,0 +1,259 @@
+# memoized analysis results, keyed by a content fingerprint of the input frames plus the other arguments
+# repeating an analysis on the same data is a dictionary lookup instead of a merge and a model fit
+# only calls on a CombinedDataset (or frames it built) are memoized: the dataset is hashed once when it's
+# first used, where fingerprinting a plain frame on every call costs about as much as the analysis itself
+# an LRU of results lives in memory, with an optional pickle tier on disk that survives restarts
+
+import os
+import copy
+import pickle
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import dataset
+from dataset import CombinedDataset
+
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# bump when an analysis changes its output so old disk entries are ignored
+MEMO_VERSION = 2
+
+
+def _frame(digest, value):
+    digest.update(b'frame')
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in value.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+
+
+def _update(digest, value):
+    if isinstance(value, CombinedDataset):
+        digest.update(b'dataset')
+        # nothing writes to a dataset's frames once it's built, so the fingerprint is only worked out once
+        if getattr(value, '_fingerprint', None) is None:
+            rows = hashlib.blake2b(digest_size=16)
+            _frame(rows, value.workout)
+            _frame(rows, value.diet)
+            value._fingerprint = rows.hexdigest()
+        digest.update(value._fingerprint.encode())
+    elif isinstance(value, pd.DataFrame) and dataset.owner(value) is not None:
+        owner, key = dataset.owner(value)
+        digest.update(f'view:{key!r}'.encode())
+        _update(digest, owner)
+    elif isinstance(value, pd.DataFrame):
+        _frame(digest, value)
+    elif isinstance(value, (pd.Series, pd.Index)):
+        digest.update(f'series:{value.name}:{value.dtype}'.encode())
+        digest.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f'array:{value.dtype}:{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}:{len(value)}'.encode())
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f'dict:{len(value)}'.encode())
+        for key in sorted(value, key=repr):
+            digest.update(repr(key).encode())
+            _update(digest, value[key])
+    elif value is None or isinstance(value, (str, bytes, int, float, bool, np.generic, pd.Timestamp)):
+        digest.update(f'{type(value).__name__}:{value!r}'.encode())
+    else:
+        # anything else (a RatioRegistry, say) is fingerprinted by its pickled state
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fingerprint(*values):
+    # hex digest of the contents, cheap next to the merges and fits it saves
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        _update(digest, value)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        # (found, value), checking memory first and then the disk tier
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+        if self.directory and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), 'rb') as handle:
+                    value = pickle.load(handle)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            else:
+                os.utime(self._path(key))
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return True, value
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory:
+            try:
+                with open(self._path(key), 'wb') as handle:
+                    pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                # unpicklable results just stay in memory
+                os.remove(self._path(key))
+            self.evict()
+
+    def evict(self):
+        # least recently used disk entries go first until the tier fits in max_bytes
+        # several processes can share the directory, so a file may be gone by the time it's looked at
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in found)
+        for _, size, name in sorted(found):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def invalidate(self, disk=False):
+        # drop the in-memory results, disk entries are keyed by content so they're only removed on request
+        with self._lock:
+            self._entries.clear()
+        if disk and self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'entries': len(self._entries),
+                    'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.disk_hits = 0
+
+
+# the cache the memoized analysis functions use, memory only unless configured with a directory
+results = ResultCache()
+
+
+def configure(max_entries=DEFAULT_MAX_ENTRIES, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    global results
+    results = ResultCache(max_entries, directory, max_bytes)
+    return results
+
+
+def _stable(value):
+    # True when fingerprinting value doesn't mean hashing the rows of a frame no dataset owns
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        return isinstance(value, pd.DataFrame) and dataset.owner(value) is not None
+    if isinstance(value, (list, tuple)):
+        return all(_stable(item) for item in value)
+    if isinstance(value, dict):
+        return all(_stable(item) for item in value.values())
+    return True
+
+
+def memoize(function):
+    # results come back as copies, so a caller changing one can't change what the next caller gets
+    name = f'{function.__module__}.{function.__qualname__}'
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if results is None or not results.max_entries or not _stable((args, kwargs)):
+            return function(*args, **kwargs)
+        key = fingerprint(MEMO_VERSION, name, args, kwargs)
+        found, value = results.get(key)
+        if not found:
+            value = function(*args, **kwargs)
+            results.put(key, value)
+        return copy.deepcopy(value)
+
+    wrapper.uncached = function
+    return wrapper
+
+
+class _Lazy:
+    def __init__(self, load):
+        self.load = load
+
+
+class DataStorage(dict):
+    # the gui's data_storage, any upload that changes it drops the memoized results
+    # setLazy stores a loader instead of a value, it's called (once) the first time the value is read
+    def _changed(self):
+        if results is not None:
+            results.invalidate()
+
+    def setLazy(self, key, load):
+        super().__setitem__(key, _Lazy(load))
+        self._changed()
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, _Lazy):
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def clear(self):
+        super().clear()
+        self._changed()
@@ -0,0 +1,218 @@
+# command line entry point: python -m optilift load/process/analyze/export/batch/serve ...
+# plotting libraries are never imported here so the non-plotting commands start quickly
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+ANALYSES = ['correlate', 'performance', 'effectiveness', 'nutrition']
+
+
+def _load(path, kind, athlete=None):
+    import data
+    if kind == 'workout':
+        return data.loadWorkout(path, athlete=athlete)
+    return data.loadDietary(path, athlete=athlete)
+
+
+def _athlete(path, athlete=None):
+    # --athlete, else the name in an <athlete>_workout.xlsx style file name, else None and the
+    # training store is skipped for the file
+    if athlete:
+        return athlete
+    from batch import FILE_PATTERN
+    match = FILE_PATTERN.match(os.path.basename(path))
+    return match.group('athlete') if match and match.group('athlete') else None
+
+
+def _to_json(value):
+    # numpy/pandas values into plain json types
+    if isinstance(value, pd.DataFrame):
+        return {str(column): _to_json(series) for column, series in value.items()}
+    if isinstance(value, pd.Series):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, dict):
+        return {str(key): _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(pd.Timestamp(value).date())
+    return value
+
+
+def _print(result, as_json):
+    if as_json:
+        print(json.dumps(_to_json(result), indent=2))
+    elif isinstance(result, (pd.DataFrame, pd.Series)):
+        print(result.to_string())
+    else:
+        for key, value in result.items():
+            print(f'{key}: {value}')
+
+
+def summarize(frame):
+    summary = {'Rows': len(frame), 'Columns': list(frame.columns)}
+    if 'Date' in frame.columns and len(frame):
+        summary['First Date'] = frame['Date'].min()
+        summary['Last Date'] = frame['Date'].max()
+    if 'Exercise' in frame.columns:
+        summary['Exercises'] = frame['Exercise'].value_counts().to_dict()
+    return summary
+
+
+def cmd_load(args):
+    frame = _load(args.file, args.kind, _athlete(args.file, args.athlete))
+    if args.output:
+        frame.to_csv(args.output, index=False)
+    _print(summarize(frame), args.json)
+
+
+def cmd_process(args):
+    import data
+    frame = _load(args.file, args.kind, _athlete(args.file, args.athlete))
+    frame = data.processWorkout(frame) if args.kind == 'workout' else data.processDietary(frame)
+    if args.output:
+        frame.to_csv(args.output, index=False)
+    _print(summarize(frame), args.json)
+
+
+def cmd_analyze(args):
+    import data
+    import analysis
+    from dataset import CombinedDataset
+    workout_data = data.processWorkout(_load(args.workout, 'workout', _athlete(args.workout, args.athlete)))
+    dietary_data = data.processDietary(_load(args.diet, 'diet', _athlete(args.diet, args.athlete)))
+    dataset = CombinedDataset(workout_data, dietary_data)
+
+    if args.analysis == 'correlate':
+        result = analysis.correlateDietToWorkout(dataset, load_features=args.load_features)
+    elif args.analysis == 'performance':
+        performance = analysis.performanceModel(dataset)
+        result = {key: performance[key] for key in ('Intercept', 'Calories Coefficient', 'Calories SE', 'Score')}
+    elif args.analysis == 'effectiveness':
+        if args.date:
+            result = analysis.dietEffectiveness(dataset, args.date)
+        else:
+            # no date: rank every candidate date (or only the calorie changepoints)
+            candidates = 'changepoints' if args.changepoints else 'all'
+            result = analysis.dietEffectivenessScan(dataset, candidates=candidates, correction=args.correction)
+            if not args.json:
+                result = result.head(args.top)
+    elif args.exercise:
+        result = analysis.nutritionAnalysis(dataset, args.exercise)
+    else:
+        result = analysis.nutritionAnalysisAll(dataset)
+    _print(result, args.json)
+
+
+def cmd_export(args):
+    import data
+    import export
+    workout_data = data.processWorkout(_load(args.workout, 'workout', args.athlete))
+    dietary_data = data.processDietary(_load(args.diet, 'diet', args.athlete))
+    rows = export.exportAthlete(args.output, workout_data, dietary_data, args.athlete, args.date, args.format,
+                                frames=not args.results_only)
+    _print({sheet: f'{count} rows' for sheet, count in rows.items()}, args.json)
+
+
+def cmd_batch(args):
+    import batch
+    return batch.main(args.batch_args)
+
+
+def cmd_report(args):
+    import reports
+    return reports.main(args.report_args)
+
+
+def cmd_serve(args):
+    import service
+    return service.main(args.serve_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='optilift', description='OptiLift from the command line.')
+    parser.add_argument('--profile', action='store_true', help='time every stage and print the timings to stderr')
+    parser.add_argument('--profile-dir', help='with --profile, also write json/flamegraph files here')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help='load a workout or dietary excel file and summarize it')
+    process = commands.add_parser('process', help='load and process a workout or dietary file')
+    for command in (load, process):
+        command.add_argument('file')
+        command.add_argument('--kind', choices=['workout', 'diet'], default='workout')
+        command.add_argument('-o', '--output', help='write the frame to this csv')
+        command.add_argument('--athlete', help='whose file this is in the training store (default: from an '
+                                               '<athlete>_workout.xlsx style name, else not stored)')
+        command.add_argument('--json', action='store_true', help='print json instead of text')
+    load.set_defaults(run=cmd_load)
+    process.set_defaults(run=cmd_process)
+
+    analyze = commands.add_parser('analyze', help='run an analysis on a workout and dietary file')
+    analyze.add_argument('workout')
+    analyze.add_argument('diet')
+    analyze.add_argument('-a', '--analysis', choices=ANALYSES, default='correlate')
+    analyze.add_argument('--exercise', help='exercise for the nutrition analysis (default: all)')
+    analyze.add_argument('--athlete', help='whose files these are in the training store (default: from '
+                                           '<athlete>_workout.xlsx style names, else not stored)')
+    analyze.add_argument('--date', help='intervention date for the effectiveness t-test (default: scan every date)')
+    analyze.add_argument('--changepoints', action='store_true', help='only scan dates where the calories shift')
+    analyze.add_argument('--correction', choices=['holm', 'bonferroni', 'fdr_bh', 'none'], default='holm',
+                         help='multiple comparison correction for the scan')
+    analyze.add_argument('--top', type=int, default=10, help='rows of the scan to print')
+    analyze.add_argument('--load-features', action='store_true',
+                         help='correlate rolling load, ACWR and e1RM as well')
+    analyze.add_argument('--json', action='store_true', help='print json instead of text')
+    analyze.set_defaults(run=cmd_analyze)
+
+    export = commands.add_parser('export', help='write the processed frames and analysis tables to csv/parquet/xlsx')
+    export.add_argument('workout')
+    export.add_argument('diet')
+    export.add_argument('-o', '--output', required=True, help='.xlsx workbook, or a directory for csv/parquet')
+    export.add_argument('--format', choices=['csv', 'parquet', 'xlsx'], help='default: from the output extension')
+    export.add_argument('--athlete', help='fill an Athlete column with this name')
+    export.add_argument('--date', help='intervention date for the t-test (default: the calorie changepoints)')
+    export.add_argument('--results-only', action='store_true', help='skip the processed workout/combined frames')
+    export.add_argument('--json', action='store_true', help='print json instead of text')
+    export.set_defaults(run=cmd_export)
+
+    batch = commands.add_parser('batch', help='run batch.py for many athletes', add_help=False)
+    batch.add_argument('batch_args', nargs=argparse.REMAINDER)
+    batch.set_defaults(run=cmd_batch)
+
+    report = commands.add_parser('report', help='run reports.py, an html/pdf report per athlete', add_help=False)
+    report.add_argument('report_args', nargs=argparse.REMAINDER)
+    report.set_defaults(run=cmd_report)
+
+    serve = commands.add_parser('serve', help='run service.py, the local http/json api', add_help=False)
+    serve.add_argument('serve_args', nargs=argparse.REMAINDER)
+    serve.set_defaults(run=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.profile:
+        return args.run(args) or 0
+    import profiling
+    profiling.enable(memory=True)
+    try:
+        with profiling.run(args.command) as run:
+            status = args.run(args) or 0
+    finally:
+        profiling.disable()
+    print(run.table(), file=sys.stderr)
+    if args.profile_dir:
+        print(f'profile written to {run.dump(args.profile_dir)}', file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# lightweight stage timings for the data, analysis and visualization hot paths
+# off by default: a disabled stage() hands back a shared no-op context and an @instrument'ed function
+# only pays for one flag check. switch on with enable() or OPTILIFT_PROFILE=1 (OPTILIFT_PROFILE=memory
+# also tracks peak memory with tracemalloc, which slows allocations down noticeably)
+#
+# stages nest, every top level stage (or an explicit run()) becomes a Run that can be written out as
+# json or as collapsed stacks for flamegraph.pl / speedscope. OPTILIFT_PROFILE_DIR dumps every run there
+
+import os
+import json
+import time
+import functools
+import threading
+import contextlib
+import tracemalloc
+
+enabled = False
+track_memory = False
+last_run = None
+
+_local = threading.local()
+_NULL = contextlib.nullcontext()
+_runs_lock = threading.Lock()
+
+
+def enable(memory=False):
+    global enabled, track_memory
+    enabled, track_memory = True, memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global enabled, track_memory
+    if track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    enabled, track_memory = False, False
+
+
+def _rows(value):
+    # row count of frames, series and arrays, None for anything else
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+class Run:
+    # every stage recorded between the start and end of one run, in the order they finished
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.wall = 0.0
+        self.stages = []
+
+    def add(self, record):
+        with _runs_lock:
+            self.stages.append(record)
+
+    def summary(self):
+        # per stage path: calls, total and self seconds, largest row counts and peak memory
+        totals = {}
+        for record in self.stages:
+            path = ';'.join(record['path'])
+            entry = totals.setdefault(path, {'stage': record['name'], 'path': path, 'calls': 0, 'wall': 0.0,
+                                             'self': 0.0, 'rows_in': None, 'rows_out': None, 'peak_mb': None})
+            entry['calls'] += 1
+            entry['wall'] += record['wall']
+            entry['self'] += record['self']
+            for key in ('rows_in', 'rows_out', 'peak_mb'):
+                if record[key] is not None:
+                    entry[key] = record[key] if entry[key] is None else max(entry[key], record[key])
+        return sorted(totals.values(), key=lambda entry: -entry['wall'])
+
+    def to_dict(self):
+        return {'name': self.name, 'started': self.started, 'wall': self.wall,
+                'stages': self.summary(), 'events': self.stages}
+
+    def collapsed(self):
+        # "outer;inner self_microseconds" lines, the input format of flamegraph.pl and speedscope
+        lines = [f"{entry['path']} {int(round(entry['self'] * 1e6))}" for entry in self.summary()]
+        return '\n'.join(sorted(lines)) + '\n'
+
+    def table(self, limit=15):
+        # plain text for the gui panel and the command line
+        lines = [f"{self.name}: {self.wall * 1000:.1f} ms",
+                 f"{'stage':44s} {'calls':>5s} {'total ms':>9s} {'self ms':>8s} {'rows':>9s} {'peak MB':>8s}"]
+        # tree order, slowest sibling first
+        entries = self.summary()
+        wall = {entry['path']: entry['wall'] for entry in entries}
+        parts = lambda path: path.split(';')
+        tree = sorted(entries, key=lambda entry: [(-wall.get(';'.join(parts(entry['path'])[:depth + 1]), 0),
+                                                   parts(entry['path'])[depth])
+                                                  for depth in range(len(parts(entry['path'])))])
+        for entry in tree[:limit]:
+            depth = entry['path'].count(';')
+            rows = entry['rows_out'] if entry['rows_out'] is not None else entry['rows_in']
+            lines.append(f"{('  ' * depth + entry['stage'])[:44]:44s} {entry['calls']:5d} {entry['wall'] * 1000:9.1f} "
+                         f"{entry['self'] * 1000:8.1f} {'' if rows is None else rows:>9} "
+                         f"{'' if entry['peak_mb'] is None else format(entry['peak_mb'], '.1f'):>8s}")
+        return '\n'.join(lines)
+
+    def dump(self, directory):
+        # writes <name>-<time>.json and .folded, returns the json path
+        os.makedirs(directory, exist_ok=True)
+        stem = ''.join(char if char.isalnum() else '_' for char in self.name)
+        base = os.path.join(directory, f"{stem}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}")
+        with open(base + '.json', 'w') as handle:
+            json.dump(self.to_dict(), handle, indent=2)
+        with open(base + '.folded', 'w') as handle:
+            handle.write(self.collapsed())
+        return base + '.json'
+
+
+def _finish_run(current):
+    global last_run
+    last_run = current
+    directory = os.environ.get('OPTILIFT_PROFILE_DIR')
+    if directory:
+        current.dump(directory)
+
+
+class _Stage:
+    __slots__ = ('name', 'rows_in', 'rows_out', 'start', 'children', 'peak', 'base', 'owns_run')
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.owns_run = getattr(_local, 'run', None) is None
+        if self.owns_run:
+            _local.run = Run(self.name)
+        if track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # the parent keeps the peak it reached so far, the child measures from here
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.base, self.peak = current, current
+        else:
+            self.base = self.peak = None
+        self.children = 0.0
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        peak_mb = None
+        if self.base is not None and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_mb = (self.peak - self.base) / 1e6
+            if stack and stack[-1].peak is not None:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+        if stack:
+            stack[-1].children += wall
+        current = _local.run
+        current.add({'name': self.name, 'path': [stage.name for stage in stack] + [self.name],
+                     'wall': wall, 'self': wall - self.children, 'rows_in': self.rows_in,
+                     'rows_out': self.rows_out, 'peak_mb': peak_mb})
+        if self.owns_run:
+            current.wall = wall
+            _local.run = None
+            _finish_run(current)
+        return False
+
+
+def stage(name, rows=None):
+    # with stage('merge', rows=len(frame)) as timing: ... ; timing.rows_out = len(result)
+    if not enabled:
+        return _NULL
+    return _Stage(name, rows)
+
+
+@contextlib.contextmanager
+def run(name, into=None):
+    # groups everything inside into one Run (yielded, None when disabled), into= continues an earlier run,
+    # e.g. drawing a chart on the gui thread after the numbers were computed on a worker
+    if not enabled:
+        yield into
+        return
+    if getattr(_local, 'run', None) is not None:
+        # already inside a run, just add a stage to it
+        with _Stage(name):
+            yield _local.run
+        return
+    current = into if into is not None else Run(name)
+    _local.run = current
+    start = time.perf_counter()
+    try:
+        with _Stage(name):
+            yield current
+    finally:
+        _local.run = None
+        current.wall += time.perf_counter() - start
+        _finish_run(current)
+
+
+def instrument(function=None, name=None):
+    # @instrument or @instrument(name='...'), records rows of the first argument and of the result
+    if function is None:
+        return functools.partial(instrument, name=name)
+    label = name or f'{function.__module__}.{function.__qualname__}'
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return function(*args, **kwargs)
+        with _Stage(label, _rows(args[0]) if args else None) as timing:
+            result = function(*args, **kwargs)
+            timing.rows_out = _rows(result)
+        return result
+    return wrapper
+
+
+_setting = os.environ.get('OPTILIFT_PROFILE', '').lower()
+if _setting and _setting not in ('0', 'false', 'off'):
+    enable(memory=_setting == 'memory')
@@ -0,0 +1,113 @@
+# lift ratios used to standardize weights across exercises
+# lives on its own so data.py can use it without importing the analysis module
+
+import numpy as np
+import pandas as pd
+from profiling import instrument
+
+
+# standard ratios to ensure that effort is the same across lifts using the 3:4:5 rule
+STRENGTH_RATIOS = {
+    'Bench Press': 3,
+    'Squat': 4,
+    'Deadlift': 5
+}
+
+# the column standardize_weights adds
+STANDARD_COLUMN = 'Weight (kg)_std'
+
+# what to do with an exercise that has no ratio
+UNKNOWN_POLICIES = ('raise', 'nan', 'default', 'drop')
+
+
+class RatioRegistry:
+    # table of lift ratios used by standardize_weights
+    # base lifts and accessories map straight to a ratio, variants are a fraction of a base lift
+    # (e.g. a front squat is about 0.85 of a back squat) and overrides are per athlete
+    def __init__(self, ratios=None, unknown='raise', default_ratio=None):
+        if unknown not in UNKNOWN_POLICIES:
+            raise ValueError(f"unknown policy must be one of {UNKNOWN_POLICIES}, got {unknown!r}")
+        if unknown == 'default' and default_ratio is None:
+            raise ValueError("the 'default' policy needs a default_ratio")
+        self.ratios = dict(STRENGTH_RATIOS if ratios is None else ratios)
+        self.variants = {}
+        self.overrides = {}
+        self.unknown = unknown
+        self.default_ratio = default_ratio
+
+    def register(self, exercise, ratio):
+        # accessories and any other lift with its own ratio
+        if ratio <= 0:
+            raise ValueError(f"ratio for {exercise!r} must be positive")
+        self.ratios[exercise] = ratio
+        return self
+
+    def register_variant(self, variant, base, factor=1.0):
+        # a variant is lifted at `factor` times its base lift, so its ratio scales the same way
+        if factor <= 0:
+            raise ValueError(f"factor for {variant!r} must be positive")
+        self.variants[variant] = (base, factor)
+        return self
+
+    def set_override(self, athlete, exercise, ratio):
+        # an athlete whose lifts don't follow the standard ratios
+        if ratio <= 0:
+            raise ValueError(f"ratio for {exercise!r} must be positive")
+        self.overrides[(athlete, exercise)] = ratio
+        return self
+
+    def table(self):
+        # flatten variants into a single exercise -> ratio dict
+        table = dict(self.ratios)
+        for variant, (base, factor) in self.variants.items():
+            if base not in self.ratios:
+                raise KeyError(f"variant {variant!r} refers to unregistered lift {base!r}")
+            table.setdefault(variant, self.ratios[base] * factor)
+        return table
+
+    def lookup(self, exercises, athletes=None):
+        # one ratio per row, computed with column operations only
+        ratios = exercises.map(self.table()).astype('float64')
+        if athletes is not None and self.overrides:
+            overrides = pd.Series(self.overrides, dtype='float64')
+            keys = pd.MultiIndex.from_arrays([athletes, exercises])
+            athlete_ratios = overrides.reindex(keys).to_numpy()
+            ratios = ratios.where(np.isnan(athlete_ratios), athlete_ratios)
+        return ratios
+
+
+default_registry = RatioRegistry()
+
+
+@instrument
+def standardize_weights(workout_data, registry=None, athlete_column='Athlete', inplace=False, force=False):
+    # divide every weight by its lift ratio so effort is comparable across lifts
+    # returns a new frame that shares the input's columns unless inplace=True, and a frame that already has
+    # the standardized column (anything out of processWorkout) comes back untouched unless force=True
+    if STANDARD_COLUMN in workout_data.columns and not force:
+        return workout_data
+    registry = default_registry if registry is None else registry
+    athletes = workout_data[athlete_column] if athlete_column in workout_data.columns else None
+    ratios = registry.lookup(workout_data['Exercise'], athletes)
+
+    missing = ratios.isna().to_numpy()
+    dropped = False
+    if missing.any():
+        if registry.unknown == 'raise':
+            unknown = sorted(workout_data['Exercise'][missing].astype(str).unique())
+            raise KeyError(f"no strength ratio registered for {unknown}")
+        if registry.unknown == 'default':
+            ratios = ratios.fillna(registry.default_ratio)
+        elif registry.unknown == 'drop':
+            # dropping rows always makes a new frame, even with inplace=True
+            keep = np.flatnonzero(~missing)
+            workout_data, ratios, dropped = workout_data.take(keep), ratios.take(keep), True
+    if not inplace and not dropped:
+        workout_data = workout_data.copy(deep=False)
+
+    # float32 weights stay float32, everything else comes out as float64
+    weights = workout_data['Weight (kg)']
+    dtype = np.float32 if weights.dtype == np.float32 else np.float64
+    workout_data[STANDARD_COLUMN] = (weights / ratios).astype(dtype)
+
+    return workout_data
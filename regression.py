@@ -0,0 +1,125 @@
+# closed-form least squares for the small regressions in analysis/visualization
+# many groups (exercises, athletes, resamples) are fit in one batched svd over stacked design matrices
+# and the fits match sklearn's LinearRegression, including its minimum-norm answer for rank deficient data
+
+import numpy as np
+import pandas as pd
+
+
+class OLSFit:
+    # coefficients and uncertainty for g stacked fits, arrays are indexed by group first
+    def __init__(self, coef, intercept, r2, stderr, intercept_stderr, sigma2, dof, n, xmean, cov):
+        self.coef = coef
+        self.intercept = intercept
+        self.r2 = r2
+        self.stderr = stderr
+        self.intercept_stderr = intercept_stderr
+        self.sigma2 = sigma2
+        self.dof = dof
+        self.n = n
+        self.xmean = xmean
+        self.cov = cov  # unscaled, multiply by sigma2 for the coefficient covariance
+
+    def __len__(self):
+        return len(self.coef)
+
+    def __repr__(self):
+        if len(self) == 1:
+            return f'OLSFit(intercept={self.intercept[0]:.4g}, coef={np.round(self.coef[0], 4).tolist()}, r2={self.r2[0]:.4g})'
+        return f'OLSFit({len(self)} groups, {self.coef.shape[1]} features)'
+
+    def _stack(self, X):
+        X = np.asarray(X, dtype='float64')
+        if X.ndim == 1:
+            X = X.reshape(-1, 1)
+        return np.broadcast_to(X, (len(self),) + X.shape) if X.ndim == 2 else X
+
+    def predict(self, X):
+        # X is (m, p) for every group or (g, m, p) per group, the result is (g, m)
+        X = self._stack(X)
+        return self.intercept[:, None] + np.einsum('gmp,gp->gm', X, self.coef)
+
+    def interval(self, X, alpha=0.05):
+        # prediction interval for new observations at X: (prediction, lower, upper)
+        from scipy.stats import t as student_t
+        X = self._stack(X)
+        prediction = self.predict(X)
+        centered = X - self.xmean[:, None, :]
+        leverage = np.einsum('gmp,gpq,gmq->gm', centered, self.cov, centered)
+        variance = self.sigma2[:, None] * (1 + 1 / self.n[:, None] + leverage)
+        dof = np.where(self.dof > 0, self.dof, np.nan)
+        half_width = student_t.ppf(1 - alpha / 2, dof)[:, None] * np.sqrt(variance)
+        return prediction, prediction - half_width, prediction + half_width
+
+
+def fitBatch(X, y, mask=None):
+    # X is (g, n, p), y is (g, n) and mask marks real rows when groups were padded to the same n
+    X = np.asarray(X, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if mask is None:
+        mask = np.ones(y.shape, dtype=bool)
+    weights = mask.astype('float64')
+    n = weights.sum(axis=1)
+    if (n < 1).any():
+        raise ValueError('every group needs at least one row')
+
+    # centering takes care of the intercept, padded rows become zeros and drop out of the svd
+    xmean = np.einsum('gnp,gn->gp', X, weights) / n[:, None]
+    ymean = (y * weights).sum(axis=1) / n
+    Xc = (X - xmean[:, None, :]) * weights[:, :, None]
+    yc = (y - ymean[:, None]) * weights
+
+    U, s, Vt = np.linalg.svd(Xc, full_matrices=False)
+    cutoff = np.finfo('float64').eps * max(X.shape[1:]) * s.max(axis=1, initial=0)[:, None]
+    keep = s > cutoff
+    s_inv = np.divide(1.0, s, out=np.zeros_like(s), where=keep)
+    coef = np.einsum('gkp,gk,gnk,gn->gp', Vt, s_inv, U, yc)
+    intercept = ymean - np.einsum('gp,gp->g', xmean, coef)
+
+    residuals = yc - np.einsum('gnp,gp->gn', Xc, coef)
+    rss = (residuals ** 2).sum(axis=1)
+    tss = (yc ** 2).sum(axis=1)
+    # same convention as sklearn's r2_score for a constant target
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(tss > 0, 1 - rss / tss, np.where(rss > 0, 0.0, 1.0))
+
+    rank = keep.sum(axis=1)
+    dof = n - rank - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = np.where(dof > 0, rss / dof, np.nan)
+    cov = np.einsum('gkp,gk,gkq->gpq', Vt, s_inv ** 2, Vt)
+    stderr = np.sqrt(sigma2[:, None] * np.diagonal(cov, axis1=1, axis2=2))
+    intercept_stderr = np.sqrt(sigma2 * (1 / n + np.einsum('gp,gpq,gq->g', xmean, cov, xmean)))
+    return OLSFit(coef, intercept, r2, stderr, intercept_stderr, sigma2, dof, n, xmean, cov)
+
+
+def fitOLS(X, y):
+    # a single regression, same arrays as fitBatch with one group
+    X = np.asarray(X, dtype='float64')
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    return fitBatch(X[None], np.asarray(y, dtype='float64')[None])
+
+
+def stackGroups(frame, features, target, by):
+    # pad every group to the size of the largest one so they can go through fitBatch together
+    frame = frame.dropna(subset=list(features) + [target])
+    codes, keys = pd.factorize(frame[by], sort=True)
+    counts = np.bincount(codes, minlength=len(keys))
+    order = np.argsort(codes, kind='stable')
+    position = np.arange(len(frame)) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = np.empty(len(frame), dtype=np.intp)
+    rows[order] = position
+    X = np.zeros((len(keys), counts.max(initial=0), len(features)))
+    y = np.zeros(X.shape[:2])
+    mask = np.zeros(X.shape[:2], dtype=bool)
+    X[codes, rows] = frame[list(features)].to_numpy(dtype='float64')
+    y[codes, rows] = frame[target].to_numpy(dtype='float64')
+    mask[codes, rows] = True
+    return keys, X, y, mask
+
+
+def fitGroups(frame, features, target, by):
+    # one fit per value of `by`, all solved in the same batched svd
+    keys, X, y, mask = stackGroups(frame, features, target, by)
+    return keys, fitBatch(X, y, mask)
@@ -0,0 +1,67 @@
+# off-screen rendering of the visualization charts straight to png/svg bytes
+# figures are plain matplotlib Figures on an Agg canvas, so there is no pyplot state and no display needed
+
+import io
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import visualization
+
+# chart name -> (compute function or None, draw function)
+# charts with a compute function take the combined frame and its arguments, the others take
+# what they draw directly (a correlation matrix, or analysis.performanceModel's result)
+CHARTS = {
+    'macros': (visualization.macroMeans, visualization.drawMacroDist),
+    'gains': (visualization.gainsSeries, visualization.drawGains),
+    'progress': (None, visualization.drawProgress),
+    'heatmap': (None, visualization.drawHeatmap),
+    'forecast': (visualization.forecastSeries, visualization.drawForecast),
+    'performance': (None, visualization.drawPerformance),
+}
+
+
+class Renderer:
+    # keeps one Figure per size and clears it between charts instead of building a new one
+    def __init__(self, dpi=100):
+        self.dpi = dpi
+        self._figures = {}
+
+    def figure(self, figsize):
+        fig = self._figures.get(figsize)
+        if fig is None:
+            fig = Figure(figsize=figsize, dpi=self.dpi)
+            FigureCanvasAgg(fig)
+            self._figures[figsize] = fig
+        fig.clear()
+        return fig
+
+    def draw(self, draw, *args, figsize=(10, 6), fmt='png', **kwargs):
+        # run a draw function on a reused figure and return the encoded image
+        fig = self.figure(figsize)
+        draw(fig, *args, **kwargs)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt)
+        return buffer.getvalue()
+
+    def chart(self, name, *args, fmt='png', **kwargs):
+        # e.g. renderer.chart('forecast', combined, 'Squat', 5) or renderer.chart('heatmap', matrix)
+        if name not in CHARTS:
+            raise KeyError(f"unknown chart {name!r}, expected one of {sorted(CHARTS)}")
+        compute, draw = CHARTS[name]
+        figsize = visualization.FIGSIZES[name]
+        if compute is not None:
+            return self.draw(draw, compute(*args, **kwargs), figsize=figsize, fmt=fmt)
+        return self.draw(draw, *args, figsize=figsize, fmt=fmt, **kwargs)
+
+    def close(self):
+        self._figures.clear()
+
+
+_renderer = None
+
+
+def renderChart(name, *args, fmt='png', **kwargs):
+    # module level shortcut that shares one Renderer per process
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    return _renderer.chart(name, *args, fmt=fmt, **kwargs)
@@ -0,0 +1,295 @@
+# per-athlete report dossiers: every chart and analysis table in one html page or a multi-page pdf
+# athletes are spread over a process pool and each worker keeps one render.Renderer (an Agg canvas per
+# figure size) for all of its reports. a chart's png is stored under the fingerprint of the data it draws,
+# so a rerun only redraws the charts whose inputs changed and picks up the rest from the chart cache.
+# the analyses behind them go through memo's disk tier in the same folder, so an unchanged athlete isn't
+# recomputed either. both caches drop their least recently used entries past their size limit
+
+import os
+import io
+import html
+import time
+import base64
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import data
+import analysis
+import export
+import memo
+import render
+import visualization
+from batch import collectJobs
+from dataset import CombinedDataset
+
+FORMATS = ('html', 'pdf')
+# bump when a chart is drawn differently so the cached pngs are redrawn
+REPORT_VERSION = 1
+CHART_CACHE = '.chart-cache'
+RESULT_CACHE = '.result-cache'
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_DPI = 100
+# A4 portrait in inches, and how many table rows go on one pdf page
+PAGE_SIZE = (8.27, 11.69)
+TABLE_ROWS_PER_PAGE = 35
+
+_renderer = None
+
+
+def _start_worker(dpi=DEFAULT_DPI, result_dir=None, max_bytes=MAX_CACHE_BYTES):
+    # pool initializer: one renderer per worker process, reused for every chart it draws, and the
+    # analysis results on disk when caching
+    global _renderer
+    _renderer = render.Renderer(dpi=dpi)
+    if result_dir:
+        memo.configure(directory=result_dir, max_bytes=max_bytes)
+
+
+def reportCharts(dataset, future_sessions=5, goals=None):
+    # [(title, chart name, what the draw function takes)] in report order
+    # a lift's progress goal defaults to its forecast at the last future session
+    combined = dataset.combined
+    charts = [('Diet and Training Correlations', 'heatmap', (analysis.correlateDietToWorkout(dataset),)),
+              ('Average Macronutrient Distribution', 'macros', (visualization.macroMeans(combined),)),
+              ('Strength Gains', 'gains', (visualization.gainsSeries(dataset.workout),)),
+              ('Calories and Training Volume', 'performance', (analysis.performanceModel(dataset),))]
+    goals = goals or {}
+    logged = set(combined['Exercise'])
+    for lift in visualization.COMPOUND_LIFTS:
+        if lift not in logged:
+            continue
+        series = visualization.forecastSeries(combined, lift, future_sessions)
+        goal = round(float(goals.get(lift, series['Future Predictions'][-1])), 1)
+        charts.append((f'{lift} Forecast', 'forecast', (series,)))
+        charts.append((f'{lift} Progress', 'progress', (lift, visualization.currentLift(combined, lift), goal)))
+    return charts
+
+
+def chartImage(name, args, cache_dir=None, renderer=None):
+    # (png bytes, drawn), drawn is False when an identical chart was already in cache_dir
+    renderer = renderer or _renderer or render.Renderer()
+    path = None
+    if cache_dir:
+        key = memo.fingerprint(REPORT_VERSION, name, args, renderer.dpi)
+        path = os.path.join(cache_dir, f'{name}-{key}.png')
+        if os.path.exists(path):
+            with open(path, 'rb') as handle:
+                png = handle.read()
+            # a hit counts as a use, pruneCharts drops the longest unused charts first
+            os.utime(path)
+            return png, False
+    png = renderer.draw(render.CHARTS[name][1], *args, figsize=visualization.FIGSIZES[name])
+    if path:
+        # workers share the cache, so write under a temporary name and move it into place
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as handle:
+            handle.write(png)
+        os.replace(temporary, path)
+    return png, True
+
+
+def pruneCharts(cache_dir, max_bytes=MAX_CACHE_BYTES):
+    # least recently used charts go first until the cache fits in max_bytes, returns how many were removed
+    found = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.png'):
+            try:
+                stat = os.stat(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, stat.st_size, name))
+    total, removed = sum(size for _, size, _ in found), 0
+    for _, size, name in sorted(found):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def summaryTable(athlete, dataset):
+    workout = dataset.workout
+    return pd.DataFrame({'': ['Athlete', 'Sessions', 'Days Logged', 'Matched Rows', 'First Session', 'Last Session'],
+                         'Value': [athlete, len(workout), len(dataset.diet), len(dataset.combined),
+                                   f"{workout['Date'].min():%Y-%m-%d}" if len(workout) else '',
+                                   f"{workout['Date'].max():%Y-%m-%d}" if len(workout) else '']})
+
+
+def _cell(value):
+    if isinstance(value, (float, np.floating)):
+        return '' if np.isnan(value) else f'{value:.4g}'
+    if isinstance(value, pd.Timestamp):
+        return f'{value:%Y-%m-%d}'
+    return str(value)
+
+
+def writeHtml(path, athlete, summary, images, tables):
+    # one self-contained page, the charts are embedded as base64 pngs
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+             f'<title>OptiLift report: {html.escape(str(athlete))}</title>',
+             '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;font-size:0.9em}'
+             'td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}img{max-width:100%}</style>',
+             '</head><body>', f'<h1>OptiLift report: {html.escape(str(athlete))}</h1>',
+             summary.to_html(index=False, border=0)]
+    for title, png in images:
+        encoded = base64.b64encode(png).decode('ascii')
+        parts.append(f'<h2>{html.escape(title)}</h2><img alt="{html.escape(title)}" src="data:image/png;base64,{encoded}">')
+    for name, table in tables.items():
+        parts.append(f'<h2>{html.escape(name)}</h2>')
+        parts.append(table.to_html(index=False, border=0, na_rep='', formatters={
+            column: _cell for column in table.columns}))
+    parts.append('</body></html>')
+    with open(path, 'w', encoding='utf-8') as handle:
+        handle.write('\n'.join(parts))
+
+
+def _table_pages(pdf, title, table):
+    # a table split over as many pages as it needs
+    from matplotlib.figure import Figure
+    cells = [[_cell(value) for value in row] for row in table.itertuples(index=False, name=None)]
+    for start in range(0, max(len(cells), 1), TABLE_ROWS_PER_PAGE):
+        fig = Figure(figsize=PAGE_SIZE)
+        ax = fig.add_subplot()
+        ax.axis('off')
+        ax.set_title(title if start == 0 else f'{title} (continued)', loc='left')
+        rows = cells[start:start + TABLE_ROWS_PER_PAGE]
+        if rows:
+            drawn = ax.table(cellText=rows, colLabels=[str(column) for column in table.columns], loc='upper center')
+            drawn.auto_set_font_size(False)
+            drawn.set_fontsize(6 if len(table.columns) > 6 else 8)
+            drawn.auto_set_column_width(range(len(table.columns)))
+        pdf.savefig(fig)
+
+
+def writePdf(path, athlete, summary, images, tables):
+    # a summary page, one page per chart and the tables after them
+    from matplotlib.figure import Figure
+    from matplotlib.image import imread
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(path) as pdf:
+        _table_pages(pdf, f'OptiLift report: {athlete}', summary)
+        for title, png in images:
+            fig = Figure(figsize=PAGE_SIZE)
+            ax = fig.add_subplot()
+            ax.imshow(imread(io.BytesIO(png), format='png'))
+            ax.axis('off')
+            ax.set_title(title)
+            pdf.savefig(fig)
+        for name, table in tables.items():
+            _table_pages(pdf, name, table)
+
+
+WRITERS = {'html': writeHtml, 'pdf': writePdf}
+
+
+def _file_name(athlete):
+    return ''.join(char if char.isalnum() or char in '-_' else '_' for char in str(athlete)) or 'athlete'
+
+
+def buildReport(job, output, fmt='html', cache_dir=None, future_sessions=5):
+    # runs inside a worker: load, analyze, draw and write one athlete's report
+    # like batch.runAthlete every failure is caught and only fails this athlete's row
+    started = time.perf_counter()
+    row = {'Athlete': job['Athlete']}
+    try:
+        if 'Workout' not in job or 'Diet' not in job:
+            raise FileNotFoundError('missing a workout or diet file')
+        workout_data = data.processWorkout(data.loadWorkout(job['Workout'], athlete=job['Athlete']))
+        dietary_data = data.processDietary(data.loadDietary(job['Diet'], athlete=job['Athlete']))
+        dataset = CombinedDataset(workout_data, dietary_data)
+        images, drawn = [], 0
+        for title, name, args in reportCharts(dataset, future_sessions, job.get('Goals')):
+            png, fresh = chartImage(name, args, cache_dir)
+            images.append((title, png))
+            drawn += fresh
+        tables = export.analysisTables(dataset, job.get('Intervention Date'), future_sessions)
+        path = os.path.join(output, f"{_file_name(job['Athlete'])}.{fmt}")
+        WRITERS[fmt](path, job['Athlete'], summaryTable(job['Athlete'], dataset), images, tables)
+        row.update({'Status': 'ok', 'Report': path, 'Charts': len(images), 'Drawn': drawn,
+                    'Unchanged': len(images) - drawn})
+    except Exception as error:
+        row.update({'Status': 'error', 'Error': f'{type(error).__name__}: {error}', 'Traceback': traceback.format_exc()})
+    row['Seconds'] = time.perf_counter() - started
+    return row
+
+
+def generateReports(jobs, output, fmt='html', workers=None, cache=True, future_sessions=5, dpi=DEFAULT_DPI,
+                    max_cache_bytes=MAX_CACHE_BYTES):
+    # batch.collectJobs style jobs -> one report file per athlete in output
+    # returns the per-athlete results and the run's totals, including reports per minute
+    # max_cache_bytes caps the chart cache and the analysis result cache, each
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {FORMATS}, got {fmt!r}')
+    os.makedirs(output, exist_ok=True)
+    cache_dir = os.path.join(output, CHART_CACHE) if cache else None
+    result_dir = os.path.join(output, RESULT_CACHE) if cache else None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    started = time.perf_counter()
+    arguments = (output, fmt, cache_dir, future_sessions)
+    if workers == 1:
+        # in this process, so the caller's own memo settings come back afterwards
+        previous = memo.results
+        try:
+            _start_worker(dpi, result_dir, max_cache_bytes)
+            rows = [buildReport(job, *arguments) for job in jobs]
+        finally:
+            memo.results = previous
+    else:
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                 initargs=(dpi, result_dir, max_cache_bytes)) as pool:
+            futures = {pool.submit(buildReport, job, *arguments): job for job in jobs}
+            for future in as_completed(futures):
+                try:
+                    rows.append(future.result())
+                except Exception as error:  # the worker itself died
+                    rows.append({'Athlete': futures[future]['Athlete'], 'Status': 'error',
+                                 'Error': f'{type(error).__name__}: {error}'})
+    if cache_dir:
+        # a rerun that only hit the caches wrote nothing, so the limits are checked here as well
+        pruneCharts(cache_dir, max_cache_bytes)
+        memo.ResultCache(directory=result_dir, max_bytes=max_cache_bytes).evict()
+    seconds = time.perf_counter() - started
+    results = pd.DataFrame(rows)
+    if not results.empty:
+        results = results.sort_values('Athlete', kind='stable', ignore_index=True)
+    done = results[results['Status'] == 'ok'] if not results.empty else results
+    totals = {'Reports': len(done), 'Failed': len(results) - len(done), 'Seconds': seconds,
+              'Reports/min': len(done) * 60 / seconds if seconds > 0 else float('nan'),
+              'Charts Drawn': int(done['Drawn'].sum()) if len(done) else 0,
+              'Charts Unchanged': int(done['Unchanged'].sum()) if len(done) else 0}
+    return results, totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write an OptiLift report for every athlete.')
+    parser.add_argument('source', help='directory of athlete files or a manifest csv')
+    parser.add_argument('-o', '--output', default='reports', help='directory for the reports')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='html')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: one per cpu)')
+    parser.add_argument('--sessions', type=int, default=5, help='future sessions to forecast')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--no-cache', action='store_true', help='redraw every chart and recompute every analysis')
+    parser.add_argument('--cache-mb', type=float, default=MAX_CACHE_BYTES / 1024 / 1024,
+                        help='size limit of the chart cache and of the result cache, in MB')
+    args = parser.parse_args(argv)
+
+    results, totals = generateReports(collectJobs(args.source), args.output, args.format, args.workers,
+                                      not args.no_cache, args.sessions, args.dpi, int(args.cache_mb * 1024 * 1024))
+    print(f"{totals['Reports']} reports, {totals['Failed']} failed, in {totals['Seconds']:.1f}s "
+          f"({totals['Reports/min']:.1f} reports/min), {totals['Charts Drawn']} charts drawn, "
+          f"{totals['Charts Unchanged']} unchanged, written to {args.output}")
+    for row in results[results['Status'] == 'error'].itertuples() if not results.empty else []:
+        print(f'  {row.Athlete}: {row.Error}')
+    return 1 if totals['Failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
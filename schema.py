@@ -0,0 +1,95 @@
+# typed column layout for workout and dietary frames, applied when a file is loaded
+# exercises become categoricals, sets/reps small integers and weights/macros float32, which cuts
+# memory by several times on long histories; bad values raise a SchemaError naming the column and rows
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+Column = namedtuple('Column', ['dtype', 'required', 'minimum', 'maximum'])
+
+WORKOUT_SCHEMA = {
+    'Date': Column('datetime64[ns]', True, None, None),
+    'Athlete': Column('category', False, None, None),
+    'Exercise': Column('category', True, None, None),
+    'Weight (kg)': Column('float32', True, 0, None),
+    'Sets': Column('uint8', True, 0, 255),
+    'Reps': Column('uint8', True, 0, 255),
+}
+
+DIETARY_SCHEMA = {
+    'Date': Column('datetime64[ns]', True, None, None),
+    'Athlete': Column('category', False, None, None),
+    # float32 keeps whole calories and grams exact up to 16 million
+    'Calories': Column('float32', True, 0, None),
+    'Protein (g)': Column('float32', True, 0, None),
+    'Carbs (g)': Column('float32', True, 0, None),
+    'Fats (g)': Column('float32', True, 0, None),
+}
+
+
+class SchemaError(ValueError):
+    pass
+
+
+def _rows(mask, limit=5):
+    rows = list(mask[mask].index[:limit])
+    more = int(mask.sum()) - len(rows)
+    return ', '.join(map(str, rows)) + (f' and {more} more' if more > 0 else '')
+
+
+def _numeric(frame, name, column, kind):
+    values = frame[name]
+    converted = pd.to_numeric(values, errors='coerce')
+    bad = converted.isna() & values.notna()
+    if bad.any():
+        example = values[bad].iloc[0]
+        raise SchemaError(f"{kind} column {name!r} has non-numeric values in rows {_rows(bad)} (e.g. {example!r})")
+    if column.minimum is not None and (converted < column.minimum).any():
+        raise SchemaError(f"{kind} column {name!r} is below {column.minimum} in rows {_rows(converted < column.minimum)}")
+    if column.maximum is not None and (converted > column.maximum).any():
+        raise SchemaError(f"{kind} column {name!r} is above {column.maximum} in rows {_rows(converted > column.maximum)}")
+    if np.issubdtype(np.dtype(column.dtype), np.integer):
+        if converted.isna().any():
+            raise SchemaError(f"{kind} column {name!r} is missing values in rows {_rows(converted.isna())}")
+        fractional = converted != np.floor(converted)
+        if fractional.any():
+            raise SchemaError(f"{kind} column {name!r} must be whole numbers, see rows {_rows(fractional)}")
+    return converted.astype(column.dtype)
+
+
+def applySchema(frame, schema, kind='data'):
+    # returns a new frame with the schema's dtypes, extra columns are passed through untouched
+    missing = [name for name, column in schema.items() if column.required and name not in frame.columns]
+    if missing:
+        raise SchemaError(f"{kind} data is missing columns {missing}, found {list(frame.columns)}")
+
+    typed = {}
+    for name, column in schema.items():
+        if name not in frame.columns:
+            continue
+        if column.dtype == 'datetime64[ns]':
+            values = frame[name]
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, errors='coerce')
+            if values.isna().any():
+                raise SchemaError(f"{kind} column {name!r} has missing or unreadable dates in rows {_rows(values.isna())}")
+            typed[name] = values
+        elif column.dtype == 'category':
+            typed[name] = frame[name].astype('category')
+        else:
+            typed[name] = _numeric(frame, name, column, kind)
+    return frame.assign(**typed)
+
+
+def applyWorkoutSchema(workout_data):
+    return applySchema(workout_data, WORKOUT_SCHEMA, 'workout')
+
+
+def applyDietarySchema(dietary_data):
+    return applySchema(dietary_data, DIETARY_SCHEMA, 'dietary')
+
+
+def memoryUsage(frame):
+    # bytes including the python strings behind object columns
+    return int(frame.memory_usage(deep=True).sum())
@@ -0,0 +1,412 @@
+# local http/json api for the coaching dashboard: python service.py --port 8765
+# one asyncio loop handles the connections, the loading and analyses run in a process pool so a slow fit
+# doesn't hold up other requests, and identical requests that arrive while one is running share its result.
+# each worker keeps the datasets it has loaded, so an analysis request only sends the dataset id
+#
+#   GET  /health                     {"status": "ok"}
+#   GET  /stats                      request, computed and coalesced counts
+#   POST /load, /process             {"path": ..., "kind": "workout" | "diet", "records": false}
+#   POST /datasets                   {"athlete": ..., "workout": path or rows, "diet": path or rows} -> {"dataset": id}
+#   GET  /datasets                   every registered dataset
+#   POST /correlate, /predict, /effectiveness, /nutrition, /forecast
+#                                    {"dataset": id (or workout + diet like /datasets), ...analysis options,
+#                                     "chart": "png" | "svg"} -> {"result": ..., "chart": base64}
+# only plain python is used for http so nothing beyond the analysis dependencies is needed
+
+import os
+import json
+import base64
+import asyncio
+import argparse
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY = 64 * 1024 * 1024
+# registered datasets kept in memory, the oldest is dropped first
+MAX_DATASETS = 32
+ANALYSES = ('correlate', 'predict', 'effectiveness', 'nutrition', 'forecast')
+CHART_FORMATS = ('png', 'svg')
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    # turned into a json error response with this status
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def toJson(value):
+    # numpy/pandas values into plain json types, tables become lists of row dicts
+    if isinstance(value, pd.DataFrame):
+        if not isinstance(value.index, pd.RangeIndex):
+            value = value.rename_axis(value.index.name or 'index').reset_index()
+        return [{str(column): toJson(item) for column, item in row.items()} for row in value.to_dict('records')]
+    if isinstance(value, pd.Series):
+        return {str(key): toJson(item) for key, item in value.items()}
+    if isinstance(value, dict):
+        return {str(key): toJson(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+        return [toJson(item) for item in value]
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if value is pd.NaT or value is None or isinstance(value, (str, int, float, bool)):
+        return None if value is pd.NaT else value
+    return str(value)
+
+
+def summarize(frame):
+    from optilift import summarize
+    return toJson(summarize(frame))
+
+
+# worker side, everything below runs in the process pool and hands back plain json types or frames
+
+# this worker's datasets by id, the least recently used is dropped past MAX_DATASETS
+_loaded = OrderedDict()
+
+
+class _Unloaded(LookupError):
+    # the worker hasn't loaded this dataset, the service sends its sources on a second try
+    pass
+
+def _frame(source, kind, athlete=None):
+    # a path on this machine or the rows themselves, athlete keeps a training store's rows per athlete
+    import data
+    from schema import applyWorkoutSchema, applyDietarySchema
+    if isinstance(source, str):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f'no such file: {source}')
+        load = data.loadWorkout if kind == 'workout' else data.loadDietary
+        return load(source, athlete=athlete)
+    if not isinstance(source, list) or not source:
+        raise ValueError(f'{kind} must be a file path or a non-empty list of rows')
+    frame = pd.DataFrame(source)
+    frame['Date'] = pd.to_datetime(frame['Date'])
+    return applyWorkoutSchema(frame) if kind == 'workout' else applyDietarySchema(frame)
+
+
+def _processed(frame, kind):
+    import data
+    return data.processWorkout(frame) if kind == 'workout' else data.processDietary(frame)
+
+
+def loadFile(path, kind, process=False, records=False):
+    frame = _frame(path, kind)
+    if process:
+        frame = _processed(frame, kind)
+    result = {'summary': summarize(frame)}
+    if records:
+        result['records'] = toJson(frame)
+    return result
+
+
+def _load(workout, diet, athlete=None):
+    # (id, dataset) for a processed pair, kept in this worker. the id is the content fingerprint
+    import memo
+    from dataset import CombinedDataset
+    dataset = CombinedDataset(_processed(_frame(workout, 'workout', athlete), 'workout'),
+                              _processed(_frame(diet, 'diet', athlete), 'diet'))
+    dataset_id = memo.fingerprint(dataset)
+    _loaded[dataset_id] = dataset
+    _loaded.move_to_end(dataset_id)
+    while len(_loaded) > MAX_DATASETS:
+        _loaded.popitem(last=False)
+    return dataset_id, dataset
+
+
+def prepareDataset(workout, diet, athlete=None):
+    # loads the pair into this worker, only the id and summaries go back to the service
+    dataset_id, dataset = _load(workout, diet, athlete)
+    return {'dataset': dataset_id, 'workout': summarize(dataset.workout), 'diet': summarize(dataset.diet),
+            'workout rows': len(dataset.workout), 'diet rows': len(dataset.diet)}
+
+
+def _dataset(dataset_id, sources=None):
+    dataset = _loaded.get(dataset_id)
+    if dataset is not None:
+        _loaded.move_to_end(dataset_id)
+        return dataset
+    if sources is None:
+        raise _Unloaded(dataset_id)
+    loaded_id, dataset = _load(*sources)
+    if loaded_id != dataset_id:
+        raise ValueError(f'dataset {dataset_id} no longer matches its files, register it again')
+    return dataset
+
+
+def runAnalysis(name, dataset_id, options, sources=None):
+    # one analysis on a dataset this worker holds (loaded from sources if it doesn't yet)
+    # the chart (if asked for) is drawn on this worker's off-screen renderer
+    import analysis
+    import forecast
+    dataset = _dataset(dataset_id, sources)
+    chart = None
+    if name == 'correlate':
+        result = analysis.correlateDietToWorkout(dataset, load_features=bool(options.get('load_features')))
+        result = result.rename_axis('Variable')
+        chart = ('heatmap', (result,), {})
+    elif name == 'predict':
+        result = analysis.performanceModel(dataset)
+        result = {key: value for key, value in result.items() if key != 'model'}
+        chart = ('performance', (result,), {})
+    elif name == 'effectiveness':
+        if options.get('date'):
+            result = analysis.dietEffectiveness(dataset, options['date'])
+        else:
+            result = analysis.dietEffectivenessScan(dataset, candidates=options.get('candidates', 'all'),
+                                                    correction=options.get('correction', 'holm'))
+    elif name == 'nutrition':
+        if options.get('exercise'):
+            result = analysis.nutritionAnalysis(dataset, options['exercise'])
+        else:
+            result = analysis.nutritionAnalysisAll(dataset)
+    else:
+        future_sessions = int(options.get('future_sessions', 5))
+        model = options.get('model', 'auto')
+        result = forecast.forecastLifts(dataset.combined, future_sessions, model=model, by=['Exercise'],
+                                        exercises=options.get('exercise'))
+        if options.get('exercise'):
+            chart = ('forecast', (dataset.combined, options['exercise'], future_sessions), {'model': model})
+    response = {'result': toJson(result)}
+    fmt = options.get('chart')
+    if fmt:
+        if chart is None:
+            raise ValueError(f'there is no chart for {name}' + (' without an exercise' if name == 'forecast' else ''))
+        import render
+        chart_name, args, kwargs = chart
+        image = render.renderChart(chart_name, *args, fmt=fmt, **kwargs)
+        response['chart'] = {'format': fmt, 'data': base64.b64encode(image).decode('ascii')}
+    return response
+
+
+class AnalysisService:
+    # the routes, the dataset registry and the request coalescing, independent of the http layer
+    def __init__(self, workers=None, executor=None, max_datasets=MAX_DATASETS):
+        self.max_datasets = max_datasets
+        self.executor = executor if executor is not None else ProcessPoolExecutor(max_workers=workers)
+        self._owns_executor = executor is None
+        self.datasets = {}
+        self._running = {}
+        self.stats = {'requests': 0, 'computed': 0, 'coalesced': 0, 'errors': 0}
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def _pool(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _shared(self, key, work):
+        # requests with the same key while one is running wait for that one instead of computing again
+        running = self._running.get(key)
+        if running is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(running)
+        self.stats['computed'] += 1
+        running = asyncio.ensure_future(work())
+        self._running[key] = running
+        try:
+            return await asyncio.shield(running)
+        finally:
+            if self._running.get(key) is running:
+                del self._running[key]
+
+    @staticmethod
+    def _source_key(source):
+        # files are identified by path, size and mtime, inline rows by their content
+        if isinstance(source, str):
+            try:
+                stat = os.stat(source)
+            except OSError:
+                return ('missing', source)
+            return ('file', os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+        return ('rows', json.dumps(source, sort_keys=True, default=str))
+
+    async def register(self, payload):
+        for kind in ('workout', 'diet'):
+            if kind not in payload:
+                raise RequestError(400, f'missing {kind!r}')
+        athlete = payload.get('athlete')
+        sources = (payload['workout'], payload['diet'], athlete)
+        key = ('dataset', self._source_key(payload['workout']), self._source_key(payload['diet']), athlete)
+        prepared = await self._shared(key, lambda: self._pool(prepareDataset, *sources))
+        dataset_id = prepared['dataset']
+        # the frames stay in the worker, the service only keeps what it needs to load them again
+        self.datasets.pop(dataset_id, None)
+        self.datasets[dataset_id] = {'athlete': athlete, 'sources': sources, 'workout rows': prepared['workout rows'],
+                                     'diet rows': prepared['diet rows']}
+        while len(self.datasets) > self.max_datasets:
+            del self.datasets[next(iter(self.datasets))]
+        return {'dataset': dataset_id, 'athlete': athlete, 'workout': prepared['workout'], 'diet': prepared['diet']}
+
+    async def _analysis(self, name, dataset_id, options, sources):
+        # only the id is sent, a worker that hasn't loaded the dataset asks for the sources
+        try:
+            return await self._pool(runAnalysis, name, dataset_id, options)
+        except _Unloaded:
+            return await self._pool(runAnalysis, name, dataset_id, options, sources)
+
+    async def analyze(self, name, payload):
+        if 'dataset' in payload:
+            dataset_id = payload['dataset']
+            if dataset_id not in self.datasets:
+                raise RequestError(404, f'unknown dataset {dataset_id!r}, register it with POST /datasets')
+        else:
+            dataset_id = (await self.register(payload))['dataset']
+        options = {key: value for key, value in payload.items() if key not in ('dataset', 'workout', 'diet', 'athlete')}
+        if options.get('chart') and options['chart'] not in CHART_FORMATS:
+            raise RequestError(400, f'chart must be one of {CHART_FORMATS}')
+        stored = self.datasets[dataset_id]
+        key = (name, dataset_id, json.dumps(options, sort_keys=True, default=str))
+        response = await self._shared(key, lambda: self._analysis(name, dataset_id, options, stored['sources']))
+        return dict(response, dataset=dataset_id, athlete=stored['athlete'])
+
+    async def handle(self, method, path, payload):
+        # (status, json body) for one request
+        self.stats['requests'] += 1
+        route = path.split('?', 1)[0].rstrip('/') or '/'
+        try:
+            if route == '/health':
+                return 200, {'status': 'ok'}
+            if route == '/stats':
+                return 200, dict(self.stats, datasets=len(self.datasets), running=len(self._running))
+            if route == '/datasets' and method == 'GET':
+                return 200, {'datasets': [{'dataset': key, 'athlete': value['athlete'], 'workout rows': value['workout rows'],
+                                           'diet rows': value['diet rows']} for key, value in self.datasets.items()]}
+            if method != 'POST':
+                known = route in ('/load', '/process', '/datasets') or route.lstrip('/') in ANALYSES
+                raise RequestError(405 if known else 404, f'{method} {route} is not supported')
+            if not isinstance(payload, dict):
+                raise RequestError(400, 'the body must be a json object')
+            if route in ('/load', '/process'):
+                if 'path' not in payload:
+                    raise RequestError(400, "missing 'path'")
+                kind = payload.get('kind', 'workout')
+                if kind not in ('workout', 'diet'):
+                    raise RequestError(400, "kind must be 'workout' or 'diet'")
+                key = (route, self._source_key(payload['path']), kind, bool(payload.get('records')))
+                return 200, await self._shared(key, lambda: self._pool(loadFile, payload['path'], kind, route == '/process',
+                                                                       bool(payload.get('records'))))
+            if route == '/datasets':
+                return 200, await self.register(payload)
+            if route.lstrip('/') in ANALYSES:
+                return 200, await self.analyze(route.lstrip('/'), payload)
+            raise RequestError(404, f'no route {route}')
+        except RequestError as error:
+            self.stats['errors'] += 1
+            return error.status, {'error': str(error)}
+        except FileNotFoundError as error:
+            self.stats['errors'] += 1
+            return 404, {'error': str(error)}
+        except (ValueError, KeyError, TypeError) as error:
+            self.stats['errors'] += 1
+            return 400, {'error': f'{type(error).__name__}: {error}'}
+        except Exception as error:
+            self.stats['errors'] += 1
+            return 500, {'error': f'{type(error).__name__}: {error}'}
+
+
+async def _read_request(reader):
+    # (method, path, headers, body) or None once the client is done
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise RequestError(400, 'malformed request line')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise RequestError(400, 'content-length is not a number')
+    if length < 0:
+        raise RequestError(400, 'content-length is negative')
+    if length > MAX_BODY:
+        raise RequestError(413, f'body larger than {MAX_BODY} bytes')
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path, headers, body
+
+
+def _response(status, body, keep_alive):
+    data = json.dumps(body).encode()
+    head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1') + data
+
+
+async def _connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except RequestError as error:
+                writer.write(_response(error.status, {'error': str(error)}, False))
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            try:
+                payload = json.loads(body) if body.strip() else {}
+            except ValueError:
+                status, result = 400, {'error': 'the body is not valid json'}
+            else:
+                status, result = await service.handle(method, path, payload)
+            writer.write(_response(status, result, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def startServer(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    # an asyncio Server, port=0 picks a free port (server.sockets[0].getsockname()[1])
+    return await asyncio.start_server(lambda reader, writer: _connection(service, reader, writer), host, port)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    service = AnalysisService(workers)
+    server = await startServer(service, host, port)
+    print(f'OptiLift service on http://{host}:{server.sockets[0].getsockname()[1]}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the OptiLift analyses as a local http/json api.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='interface to listen on (default: localhost only)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='worker processes (default: one per cpu)')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
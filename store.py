@@ -0,0 +1,378 @@
+# persistent sqlite store for training history, so a new session doesn't start with excel reloads
+# athletes and exercises are lookup tables, every athlete's training day is a session row holding its lifts,
+# and nutrition has one row per athlete per day. dates are stored as days since 1970 so they index and
+# compare as integers; date ranges, athletes and exercises are filtered in sql and only that slice is read
+
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from schema import applyWorkoutSchema, applyDietarySchema
+
+# athlete name used when a file has no Athlete column and none is given
+DEFAULT_ATHLETE = ''
+# inserts bigger than this drop the lift indexes and rebuild them afterwards, which beats updating
+# two b-trees row by row
+BULK_ROWS = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS athletes (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS exercises (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    athlete_id INTEGER NOT NULL REFERENCES athletes(id),
+    day INTEGER NOT NULL,
+    UNIQUE (athlete_id, day)
+);
+CREATE TABLE IF NOT EXISTS lifts (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    exercise_id INTEGER NOT NULL REFERENCES exercises(id),
+    weight REAL NOT NULL,
+    sets INTEGER NOT NULL,
+    reps INTEGER NOT NULL
+);
+{lift_indexes}
+CREATE TABLE IF NOT EXISTS nutrition (
+    athlete_id INTEGER NOT NULL REFERENCES athletes(id),
+    day INTEGER NOT NULL,
+    calories REAL, protein REAL, carbs REAL, fats REAL,
+    PRIMARY KEY (athlete_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT NOT NULL, kind TEXT NOT NULL, athlete TEXT,
+    size INTEGER, mtime INTEGER, hash TEXT, first_day INTEGER, last_day INTEGER, rows_hash TEXT,
+    PRIMARY KEY (path, kind)
+);
+"""
+
+LIFT_INDEXES = """
+CREATE INDEX IF NOT EXISTS lifts_by_session ON lifts (session_id, exercise_id);
+CREATE INDEX IF NOT EXISTS lifts_by_exercise ON lifts (exercise_id, session_id);
+"""
+SCHEMA = SCHEMA.format(lift_indexes=LIFT_INDEXES.strip())
+
+WORKOUT_COLUMNS = ['Date', 'Exercise', 'Weight (kg)', 'Sets', 'Reps']
+DIETARY_COLUMNS = ['Date', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)']
+FLOAT_COLUMNS = {'Weight (kg)', 'Calories', 'Protein (g)', 'Carbs (g)', 'Fats (g)'}
+
+
+def _days(dates):
+    return pd.to_datetime(dates).to_numpy('datetime64[D]').astype('int64')
+
+
+def _day(date):
+    return None if date is None else int(_days(pd.Series([date]))[0])
+
+
+def _dates(days):
+    return pd.to_datetime(np.asarray(days, dtype='int64'), unit='D')
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def _rows_hash(frame, kind, athletes):
+    # digest of a file's rows that doesn't depend on their order, so the rows a file put in the store can be
+    # told apart from a slice that other files (or other athletes) have since written into
+    columns = WORKOUT_COLUMNS if kind == 'workout' else DIETARY_COLUMNS
+    rows = pd.DataFrame({'Athlete': athletes.astype(str).to_numpy(), 'Date': _days(frame['Date'])})
+    for column in columns[1:]:
+        values = frame[column]
+        rows[column] = values.astype('float64' if column in FLOAT_COLUMNS else 'int64' if column in ('Sets', 'Reps')
+                                     else str).to_numpy()
+    hashed = np.sort(pd.util.hash_pandas_object(rows, index=False).to_numpy())
+    return hashlib.blake2b(hashed.tobytes(), digest_size=16).hexdigest()
+
+
+class TrainingStore:
+    def __init__(self, path=':memory:'):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # the gui queries from its worker thread, a lock keeps one statement at a time on the connection
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        with self._lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('PRAGMA foreign_keys=ON')
+            self.connection.executescript(SCHEMA)
+            # stores made before rows_hash existed get the column, their files are re-read once
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(files)')]
+            if 'rows_hash' not in columns:
+                self.connection.execute('ALTER TABLE files ADD COLUMN rows_hash TEXT')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- writing ---
+
+    def _ids(self, table, names):
+        # id for every name, adding the ones that are new
+        names = sorted(set(map(str, names)))
+        self.connection.executemany(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', [(name,) for name in names])
+        found = {}
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = self.connection.execute(
+                f'SELECT name, id FROM {table} WHERE name IN ({",".join("?" * len(chunk))})', chunk)
+            found.update(rows)
+        return found
+
+    def _athletes(self, frame, athlete):
+        if athlete is not None:
+            return pd.Series(str(athlete), index=frame.index)
+        if 'Athlete' in frame.columns:
+            return frame['Athlete'].astype(str)
+        return pd.Series(DEFAULT_ATHLETE, index=frame.index)
+
+    def insertWorkout(self, frame, athlete=None, replace=False):
+        # bulk insert in one transaction, replace=True first drops the athlete's lifts on the dates the frame covers
+        frame = applyWorkoutSchema(frame)
+        if frame.empty:
+            return 0
+        athletes = self._athletes(frame, athlete)
+        days = _days(frame['Date'])
+        with self._lock, self.connection:
+            athlete_ids = athletes.map(self._ids('athletes', athletes.unique())).to_numpy('int64')
+            exercise_ids = frame['Exercise'].astype(str).map(self._ids('exercises', frame['Exercise'].astype(str).unique()))
+            sessions = pd.DataFrame({'athlete_id': athlete_ids, 'day': days})
+            keys = sessions.drop_duplicates()
+            if replace:
+                self.connection.executemany(
+                    'DELETE FROM lifts WHERE session_id IN (SELECT id FROM sessions WHERE athlete_id = ? AND day = ?)',
+                    keys.itertuples(index=False, name=None))
+            self.connection.executemany('INSERT OR IGNORE INTO sessions (athlete_id, day) VALUES (?, ?)',
+                                        keys.itertuples(index=False, name=None))
+            session_ids = self._session_ids(keys)
+            session_id = sessions.merge(session_ids, on=['athlete_id', 'day'], how='left')['id'].to_numpy('int64')
+            rows = zip(session_id.tolist(), exercise_ids.to_numpy('int64').tolist(),
+                       frame['Weight (kg)'].astype('float64').tolist(),
+                       frame['Sets'].astype('int64').tolist(), frame['Reps'].astype('int64').tolist())
+            bulk = len(frame) > BULK_ROWS
+            if bulk:
+                self.connection.execute('DROP INDEX IF EXISTS lifts_by_session')
+                self.connection.execute('DROP INDEX IF EXISTS lifts_by_exercise')
+            self.connection.executemany(
+                'INSERT INTO lifts (session_id, exercise_id, weight, sets, reps) VALUES (?, ?, ?, ?, ?)', rows)
+            if bulk:
+                for statement in LIFT_INDEXES.strip().splitlines():
+                    self.connection.execute(statement)
+        return len(frame)
+
+    def _session_ids(self, keys):
+        found = []
+        for athlete_id, group in keys.groupby('athlete_id'):
+            rows = self.connection.execute(
+                'SELECT id, athlete_id, day FROM sessions WHERE athlete_id = ? AND day BETWEEN ? AND ?',
+                (int(athlete_id), int(group['day'].min()), int(group['day'].max()))).fetchall()
+            found.append(pd.DataFrame(rows, columns=['id', 'athlete_id', 'day']))
+        return pd.concat(found, ignore_index=True)
+
+    def insertDietary(self, frame, athlete=None):
+        # one row per athlete per day, a day logged again overwrites the old entry
+        frame = applyDietarySchema(frame)
+        if frame.empty:
+            return 0
+        athletes = self._athletes(frame, athlete)
+        with self._lock, self.connection:
+            athlete_ids = athletes.map(self._ids('athletes', athletes.unique())).to_numpy('int64')
+            columns = [frame[column].astype('float64').tolist() for column in DIETARY_COLUMNS[1:]]
+            rows = zip(athlete_ids.tolist(), _days(frame['Date']).tolist(), *columns)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO nutrition (athlete_id, day, calories, protein, carbs, fats) VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+        return len(frame)
+
+    def loadedFile(self, path, kind, athlete=None):
+        # the rows a file stored earlier put in the store, or None when it has to be read again: the file changed,
+        # it was stored under another athlete, or other files have since replaced or added rows in its slice
+        # size and mtime are checked first and the file is only hashed when they differ
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self.connection.execute('SELECT size, mtime, hash, athlete, first_day, last_day, rows_hash FROM files '
+                                          'WHERE path = ? AND kind = ?', (path, kind)).fetchone()
+        if row is None or row[6] is None:
+            return None
+        if (None if athlete is None else str(athlete)) != row[3]:
+            return None
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) != tuple(row[:2]) and \
+                (stat.st_size != row[0] or _fingerprint(path)[2] != row[2]):
+            return None
+        first, last = row[4:6]
+        query = self.workout if kind == 'workout' else self.dietary
+        frame = query(row[3], _dates([first])[0], _dates([last + 1])[0])
+        if _rows_hash(frame, kind, self._athletes(frame, None)) != row[6]:
+            return None
+        return frame
+
+    def recordFile(self, path, kind, frame, athlete=None):
+        # remember what a file held, athlete None means the frame had its own Athlete column
+        days = _days(frame['Date'])
+        size, mtime, digest = _fingerprint(path)
+        rows_hash = _rows_hash(frame, kind, self._athletes(frame, athlete))
+        with self._lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO files (path, kind, athlete, size, mtime, hash, first_day, '
+                                    'last_day, rows_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (os.path.abspath(path), kind, None if athlete is None else str(athlete),
+                                     size, mtime, digest, int(days.min()), int(days.max()), rows_hash))
+
+    def deleteAthlete(self, athlete):
+        with self._lock, self.connection:
+            row = self.connection.execute('SELECT id FROM athletes WHERE name = ?', (str(athlete),)).fetchone()
+            if row is None:
+                return
+            self.connection.execute('DELETE FROM lifts WHERE session_id IN (SELECT id FROM sessions WHERE athlete_id = ?)', row)
+            self.connection.execute('DELETE FROM sessions WHERE athlete_id = ?', row)
+            self.connection.execute('DELETE FROM nutrition WHERE athlete_id = ?', row)
+            self.connection.execute('DELETE FROM files WHERE athlete = ?', (str(athlete),))
+
+    # --- reading ---
+
+    def _where(self, day_column, athlete, start, end, exercises=None):
+        # sql conditions and parameters for the filters that were given, end is exclusive
+        conditions, parameters = [], []
+        if athlete is not None:
+            athletes = [athlete] if isinstance(athlete, str) else list(athlete)
+            conditions.append(f'a.name IN ({",".join("?" * len(athletes))})')
+            parameters += [str(name) for name in athletes]
+        if start is not None:
+            conditions.append(f'{day_column} >= ?')
+            parameters.append(_day(start))
+        if end is not None:
+            conditions.append(f'{day_column} < ?')
+            parameters.append(_day(end))
+        if exercises is not None:
+            exercises = [exercises] if isinstance(exercises, str) else list(exercises)
+            conditions.append(f'e.name IN ({",".join("?" * len(exercises))})')
+            parameters += exercises
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    def _query(self, sql, parameters, columns):
+        # rows go straight into typed numpy columns, a lot less work than a list of tuples
+        dtype = [(name, 'float64' if name in FLOAT_COLUMNS else 'int64') for name in columns]
+        with self._lock:
+            rows = self.connection.execute(sql, parameters).fetchall()
+        try:
+            return pd.DataFrame(np.fromiter(rows, dtype=dtype, count=len(rows)))
+        except TypeError:
+            # NULL macros can't go into a float column that way
+            return pd.DataFrame.from_records(rows, columns=columns)
+
+    def _names(self, table):
+        with self._lock:
+            return dict(self.connection.execute(f'SELECT id, name FROM {table}'))
+
+    def _finish(self, frame, columns, order=None):
+        # ids back to names and days back to dates, sorted by athlete, date and then `order`
+        # (sorting the fetched rows here is quicker than an ORDER BY over the join)
+        frame['Athlete'] = frame['Athlete'].map(self._names('athletes'))
+        if 'Exercise' in frame.columns:
+            frame['Exercise'] = frame['Exercise'].map(self._names('exercises'))
+        keys = [frame[order].to_numpy()] if order else []
+        rows = np.lexsort(keys + [frame['Date'].to_numpy(), pd.Categorical(frame['Athlete']).codes])
+        frame = frame.iloc[rows].reset_index(drop=True)
+        frame['Date'] = _dates(frame['Date'])
+        # the Athlete column only comes back when someone other than the default is in there
+        if (frame['Athlete'] == DEFAULT_ATHLETE).all():
+            return frame[columns]
+        return frame[['Athlete'] + columns]
+
+    def workout(self, athlete=None, start=None, end=None, exercises=None):
+        # raw workout rows (like loadWorkout returns) for the athletes, dates in [start, end) and exercises given
+        where, parameters = self._where('s.day', athlete, start, end, exercises)
+        frame = self._query(
+            'SELECT s.athlete_id, s.day, l.exercise_id, l.weight, l.sets, l.reps, l.id FROM lifts l '
+            'JOIN sessions s ON s.id = l.session_id JOIN athletes a ON a.id = s.athlete_id '
+            f'JOIN exercises e ON e.id = l.exercise_id{where}',
+            parameters, ['Athlete'] + WORKOUT_COLUMNS + ['Lift'])
+        return applyWorkoutSchema(self._finish(frame, WORKOUT_COLUMNS, 'Lift'))
+
+    def dietary(self, athlete=None, start=None, end=None):
+        where, parameters = self._where('n.day', athlete, start, end)
+        frame = self._query(
+            'SELECT n.athlete_id, n.day, n.calories, n.protein, n.carbs, n.fats FROM nutrition n '
+            f'JOIN athletes a ON a.id = n.athlete_id{where}',
+            parameters, ['Athlete'] + DIETARY_COLUMNS)
+        return applyDietarySchema(self._finish(frame, DIETARY_COLUMNS))
+
+    def join(self, athlete=None, start=None, end=None, exercises=None, lag=0):
+        # workout rows with the same athlete's nutrition from `lag` days earlier, joined in sql,
+        # then processed like processWorkout/processDietary would (same columns as dataset.combine)
+        import data
+        where, parameters = self._where('s.day', athlete, start, end, exercises)
+        frame = self._query(
+            'SELECT s.athlete_id, s.day, l.exercise_id, l.weight, l.sets, l.reps, '
+            'n.calories, n.protein, n.carbs, n.fats, l.id FROM lifts l '
+            'JOIN sessions s ON s.id = l.session_id JOIN athletes a ON a.id = s.athlete_id '
+            'JOIN exercises e ON e.id = l.exercise_id '
+            f'JOIN nutrition n ON n.athlete_id = s.athlete_id AND n.day = s.day - ?{where}',
+            [int(lag)] + parameters, ['Athlete'] + WORKOUT_COLUMNS + DIETARY_COLUMNS[1:] + ['Lift'])
+        frame = self._finish(frame, WORKOUT_COLUMNS + DIETARY_COLUMNS[1:], 'Lift')
+        frame = data.processDietary(data.processWorkout(applyDietarySchema(applyWorkoutSchema(frame))))
+        if lag:
+            frame['Diet Date'] = frame['Date'] - pd.Timedelta(days=lag)
+        return frame.reset_index(drop=True)
+
+    def dataset(self, athlete=None, start=None, end=None, exercises=None, lag=0):
+        # a CombinedDataset over just the slice, the diet reaches back `lag` days so lagged joins still match
+        import data
+        from dataset import CombinedDataset
+        workout = data.processWorkout(self.workout(athlete, start, end, exercises))
+        diet_start = None if start is None else pd.to_datetime(start) - pd.Timedelta(days=lag)
+        diet = data.processDietary(self.dietary(athlete, diet_start, end))
+        return CombinedDataset(workout, diet)
+
+    def lastAthlete(self):
+        # the athlete whose file was stored most recently, None when nothing was stored under a name
+        with self._lock:
+            row = self.connection.execute('SELECT athlete FROM files WHERE athlete IS NOT NULL AND athlete != ? '
+                                          'ORDER BY rowid DESC LIMIT 1', (DEFAULT_ATHLETE,)).fetchone()
+        return None if row is None else row[0]
+
+    def athletes(self):
+        with self._lock:
+            return [name for (name,) in self.connection.execute('SELECT name FROM athletes ORDER BY name')]
+
+    def exercises(self):
+        with self._lock:
+            return [name for (name,) in self.connection.execute('SELECT name FROM exercises ORDER BY name')]
+
+    def counts(self):
+        with self._lock:
+            return {table: self.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                    for table in ('athletes', 'sessions', 'lifts', 'nutrition')}
+
+
+# the store data.loadWorkout/loadDietary write through to, off unless configured or OPTILIFT_STORE is set
+default_store = None
+
+
+def configure(path):
+    global default_store
+    if default_store is not None:
+        default_store.close()
+    default_store = TrainingStore(path) if path else None
+    return default_store
+
+
+def get_default_store():
+    if default_store is None and os.environ.get('OPTILIFT_STORE'):
+        configure(os.environ['OPTILIFT_STORE'])
+    return default_store
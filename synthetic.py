@@ -0,0 +1,76 @@
+# seeded synthetic training logs for benchmarks and tests, from a few thousand to tens of millions of rows
+# everything is generated with numpy column operations, so 10M sessions take seconds rather than minutes
+
+import numpy as np
+import pandas as pd
+
+# starting working weight (kg) and yearly progress for each lift
+LIFTS = {
+    'Bench Press': (70, 0.10),
+    'Squat': (95, 0.12),
+    'Deadlift': (120, 0.11),
+}
+
+
+def generateWorkout(sessions, athletes=1, lifts=None, start='2020-01-01', years=3, seed=0, zero_fraction=0.01):
+    # `sessions` rows spread over `athletes` athletes and `years` years, sorted by athlete then date
+    rng = np.random.default_rng(seed)
+    lifts = LIFTS if lifts is None else lifts
+    names = list(lifts)
+    base = np.array([lifts[name][0] for name in names], dtype='float64')
+    progress = np.array([lifts[name][1] for name in names], dtype='float64')
+    days = int(365 * years)
+
+    athlete = np.sort(rng.integers(0, athletes, sessions))
+    day = rng.integers(0, days, sessions)
+    order = np.lexsort((day, athlete))
+    athlete, day = athlete[order], day[order]
+    lift = rng.integers(0, len(names), sessions)
+
+    strength = rng.normal(1.0, 0.15, athletes)[athlete]
+    weight = base[lift] * strength * (1 + progress[lift] * day / 365) + rng.normal(0, 2.5, sessions)
+    weight = np.round(np.clip(weight, 20, None) / 2.5) * 2.5
+    weight[rng.random(sessions) < zero_fraction] = 0  # the odd skipped lift, processWorkout drops these
+
+    return pd.DataFrame({
+        'Athlete': np.char.add('athlete_', athlete.astype(str)),
+        'Date': pd.Timestamp(start) + pd.to_timedelta(day, unit='D'),
+        'Exercise': np.array(names, dtype=object)[lift],
+        'Weight (kg)': weight,
+        'Sets': rng.integers(1, 6, sessions),
+        'Reps': rng.integers(1, 13, sessions),
+    })
+
+
+def generateDietary(start='2020-01-01', years=3, seed=0):
+    # one row per day, macros loosely tied to calories
+    rng = np.random.default_rng(seed + 1)
+    days = int(365 * years)
+    calories = np.round(rng.normal(2600, 350, days))
+    protein = np.round(calories * rng.uniform(0.22, 0.32, days) / 4)
+    fats = np.round(calories * rng.uniform(0.22, 0.32, days) / 9)
+    carbs = np.round(np.clip(calories - protein * 4 - fats * 9, 0, None) / 4)
+    return pd.DataFrame({
+        'Date': pd.date_range(start, periods=days, freq='D'),
+        'Calories': calories,
+        'Protein (g)': protein,
+        'Carbs (g)': carbs,
+        'Fats (g)': fats,
+    })
+
+
+def generatePair(sessions, athletes=1, years=None, seed=0):
+    # a workout log and the diet log covering it, with enough years that days rarely repeat for big sizes
+    if years is None:
+        years = max(1, min(30, sessions // (3 * 365 * athletes) or 1))
+    workout = generateWorkout(sessions, athletes=athletes, years=years, seed=seed)
+    dietary = generateDietary(years=years, seed=seed)
+    return workout, dietary
+
+
+def writeExcel(frame, path):
+    # the excel layout loadWorkout/loadDietary expect, dates as month/day/year text
+    frame = frame.copy()
+    frame['Date'] = frame['Date'].dt.strftime('%m/%d/%Y')
+    frame.to_excel(path, index=False)
+    return path
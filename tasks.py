@@ -0,0 +1,134 @@
+# background jobs for the GUI so excel parsing and analyses don't freeze the Tk main loop
+# workers only talk to Tk through a queue that the main loop drains with root.after polling
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    # handed to thread jobs as their first argument for progress reports and cancellation checks
+    def __init__(self, name, events):
+        self.name = name
+        self.future = None
+        self._events = events
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()  # only stops jobs that haven't started yet
+
+    def check(self):
+        # call between steps, stops the job if the user pressed cancel
+        if self.cancelled:
+            raise TaskCancelled(self.name)
+
+    def report(self, fraction, message=''):
+        self.check()
+        self._events.put(('progress', self, (fraction, message)))
+
+
+class TaskRunner:
+    # processes=True runs jobs in a process pool; those get no Task and report no progress
+    def __init__(self, root, workers=1, processes=False, poll_ms=100):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.processes = processes
+        pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.executor = pool(max_workers=workers)
+        self._events = queue.Queue()
+        self._callbacks = {}
+        # running jobs per widget, a widget shared by several jobs comes back once the last one finishes
+        self._holds = {}
+        self._polling = False
+
+    @property
+    def busy(self):
+        return bool(self._callbacks)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None, on_cancel=None,
+               widgets=(), name='', **kwargs):
+        # widgets are disabled until the job finishes, callbacks always run on the Tk thread
+        task = Task(name or getattr(fn, '__name__', 'task'), self._events)
+        for widget in widgets:
+            self._holds[widget] = self._holds.get(widget, 0) + 1
+            widget.configure(state='disabled')
+        self._callbacks[task] = (on_done, on_error, on_progress, on_cancel, widgets)
+        if self.processes:
+            task.future = self.executor.submit(fn, *args, **kwargs)
+            task.future.add_done_callback(lambda future: self._finished(task, future))
+        else:
+            task.future = self.executor.submit(self._run, task, fn, args, kwargs)
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self.poll)
+        return task
+
+    def _run(self, task, fn, args, kwargs):
+        try:
+            task.check()
+            result = fn(task, *args, **kwargs)
+        except TaskCancelled:
+            self._events.put(('cancelled', task, None))
+        except Exception as error:
+            self._events.put(('error', task, error))
+        else:
+            self._events.put(('done', task, result))
+
+    def _finished(self, task, future):
+        # process pool jobs can't see the Task, so a cancel just drops their result
+        if future.cancelled() or task.cancelled:
+            self._events.put(('cancelled', task, None))
+        elif future.exception() is not None:
+            self._events.put(('error', task, future.exception()))
+        else:
+            self._events.put(('done', task, future.result()))
+
+    def poll(self):
+        # drain the queue on the Tk thread and hand each event to its callback
+        while True:
+            try:
+                kind, task, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if task not in self._callbacks:
+                continue
+            on_done, on_error, on_progress, on_cancel, widgets = self._callbacks[task]
+            if kind == 'progress':
+                if on_progress is not None and not task.cancelled:
+                    on_progress(*payload)
+                continue
+            del self._callbacks[task]
+            for widget in widgets:
+                self._holds[widget] -= 1
+                if not self._holds[widget]:
+                    del self._holds[widget]
+                    widget.configure(state='normal')
+            if kind == 'cancelled':
+                if on_cancel is not None:
+                    on_cancel()
+            else:
+                callback = on_done if kind == 'done' else on_error
+                if callback is not None:
+                    callback(payload)
+        if self._callbacks:
+            self.root.after(self.poll_ms, self.poll)
+        else:
+            self._polling = False
+
+    def cancel_all(self):
+        for task in list(self._callbacks):
+            task.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,46 @@
 import unittest
+import os
+import tempfile
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
-from data import ProcessDietaryChange, processWorkout, processDietary
-from analysis import correlateDietToWorkout, predictPerformance, dietEffectiveness, AlignDataforNutrition, standardize_weights, nutritionAnalysis
+from data import ProcessDietaryChange, processWorkout, processDietary, loadWorkout, loadDietary
+from cache import FrameCache
+import ingest
+from incremental import TrainingLog
+from dataset import CombinedDataset
+import batch
+import render
+from analysis import performanceModel, nutritionAnalysisAll
+import regression
+import io
+import sys
+import json
+import subprocess
+import contextlib
+import optilift
+import synthetic
+import time
+import threading
+import socket
+from tasks import TaskRunner
+import schema
+import loadmetrics
+import changepoint
+import inference
+import memo
+import profiling
+import store
+import export
+import forecast
+import service
+import base64
+import visualization
+import downsample
+import reports
+import unittest.mock
+import analysis
+from analysis import correlateDietToWorkout, predictPerformance, dietEffectiveness, AlignDataforNutrition, standardize_weights, nutritionAnalysis, RatioRegistry
 
 
 #Only did unittests for my Data and Analysis files as they have direct and testable features while the visualizations require manual inspection 
@@ -187,5 +224,1290 @@ class Fitnessanalysis(unittest.TestCase):
         self.assertIsNotNone(results, "Results should not be None")
         self.assertIn('Score', results, "Score should be reported in results")
 
+class StandardizeRegistry(unittest.TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({
+            'Athlete': ['ana', 'ana', 'ben', 'ben'],
+            'Exercise': ['Bench Press', 'Front Squat', 'Squat', 'Curl'],
+            'Weight (kg)': [90.0, 85.0, 120.0, 20.0]
+        })
+
+    def test_unknown_lift_raises_by_default(self):
+        """\nAn exercise without a ratio should still raise a KeyError unless a policy says otherwise."""
+        with self.assertRaises(KeyError):
+            standardize_weights(self.data.copy())
+
+    def test_variants_accessories_and_overrides(self):
+        """\nVariants scale their base lift, accessories get their own ratio and athlete overrides win."""
+        registry = RatioRegistry().register_variant('Front Squat', 'Squat', 0.85).register('Curl', 0.5)
+        registry.set_override('ben', 'Squat', 6)
+        result = standardize_weights(self.data.copy(), registry)
+        expected = [30, 85 / (4 * 0.85), 20, 40]
+        np.testing.assert_allclose(result['Weight (kg)_std'], expected)
+
+    def test_unknown_policies(self):
+        """\nThe nan, default and drop policies handle lifts that are not registered."""
+        data = self.data.drop(columns='Athlete')
+        as_nan = standardize_weights(data.copy(), RatioRegistry(unknown='nan'))
+        self.assertEqual(int(as_nan['Weight (kg)_std'].isna().sum()), 2)
+        as_default = standardize_weights(data.copy(), RatioRegistry(unknown='default', default_ratio=2))
+        self.assertEqual(as_default['Weight (kg)_std'].iloc[3], 10)
+        dropped = standardize_weights(data.copy(), RatioRegistry(unknown='drop'))
+        self.assertEqual(list(dropped['Exercise']), ['Bench Press', 'Squat'])
+
+class CacheLayer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'workout.xlsx')
+        pd.DataFrame({
+            'Date': ['01/02/2024', '01/03/2024'],
+            'Exercise': ['Squat', 'Bench Press'],
+            'Weight (kg)': [120, 80], 'Sets': [3, 3], 'Reps': [5, 5]
+        }).to_excel(self.source, index=False)
+        self.cache = FrameCache(os.path.join(self.tmp.name, 'cache'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def counting_reader(self):
+        calls = []
+        def reader(path):
+            calls.append(path)
+            return pd.DataFrame({'Date': pd.to_datetime(['2024-01-02']), 'Weight (kg)': [len(calls)]})
+        return reader, calls
+
+    def test_second_load_skips_excel(self):
+        """\nA cached frame comes back with the same dates and values without parsing the workbook again."""
+        first = loadWorkout(self.source, cache=self.cache)
+        second = loadWorkout(self.source, cache=self.cache)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(len(self.cache.entries()), 1)
+
+    def test_change_detection_and_invalidation(self):
+        """\nTouching the file keeps the entry, changing it or invalidating forces a reload."""
+        reader, calls = self.counting_reader()
+        self.cache.load(self.source, 'workout', reader)
+        os.utime(self.source, ns=(0, 0))
+        self.cache.load(self.source, 'workout', reader)
+        self.assertEqual(len(calls), 1, "same content should not be reparsed")
+        with open(self.source, 'ab') as handle:
+            handle.write(b'more')
+        self.cache.load(self.source, 'workout', reader)
+        self.assertEqual(len(calls), 2, "changed content must be reparsed")
+        self.cache.invalidate(self.source)
+        self.cache.load(self.source, 'workout', reader)
+        self.cache.load(self.source, 'workout', reader, refresh=True)
+        self.assertEqual(len(calls), 4)
+
+    def test_size_bounded_eviction(self):
+        """\nThe oldest entries are evicted once the cache grows past max_bytes."""
+        reader, _ = self.counting_reader()
+        self.cache.load(self.source, 'workout', reader)
+        self.cache.max_bytes = 1
+        self.cache.load(self.source, 'dietary', reader)
+        self.assertLessEqual(len(self.cache.entries()), 1)
+
+class StreamingIngest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workout = pd.DataFrame({
+            'Date': ['01/01/2024', '01/01/2024', '01/02/2024', '01/03/2024', '01/03/2024'],
+            'Exercise': ['Squat', 'Bench Press', 'Deadlift', 'Squat', 'Squat'],
+            'Weight (kg)': [120, 90, 0, 140, 100],
+            'Sets': [3, 3, 1, 5, 5], 'Reps': [5, 5, 1, 3, 5]
+        })
+        self.diet = pd.DataFrame({
+            'Date': ['01/01/2024', '01/02/2024', '01/03/2024'],
+            'Calories': [1900, 2600, 3100], 'Protein (g)': [150, 160, 170],
+            'Carbs (g)': [200, 300, 400], 'Fats (g)': [60, 70, 80]
+        })
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, frame, name):
+        path = os.path.join(self.tmp.name, name)
+        if name.endswith('.csv'):
+            frame.to_csv(path, index=False)
+        elif name.endswith('.xlsx'):
+            frame.to_excel(path, index=False)
+        else:
+            frame.to_json(path, orient='records', lines=True)
+        return path
+
+    def test_workout_aggregates_match_full_frame(self):
+        """\nChunked csv, xlsx and jsonl ingestion should give the same totals as processing everything at once."""
+        full = self.workout.copy()
+        full['Date'] = pd.to_datetime(full['Date'], format='%m/%d/%Y')
+        full = processWorkout(full)
+        expected_daily = full.groupby('Date')['Total Volume'].sum()
+        expected_max = full.groupby('Exercise')['Weight (kg)'].max()
+        for name in ('workout.csv', 'workout.xlsx', 'workout.jsonl'):
+            aggregates = ingest.ingestWorkout(self.write(self.workout, name), chunksize=2)
+            self.assertEqual(aggregates.rows, 4, name)
+            pd.testing.assert_series_equal(aggregates.daily_volume, expected_daily.astype('float64'), check_names=False)
+            pd.testing.assert_series_equal(aggregates.lift_max.sort_index(), expected_max.astype('float64'), check_names=False)
+
+    def test_dietary_means_and_categories(self):
+        """\nMacro means and calorie categories survive chunking."""
+        aggregates = ingest.ingestDietary(self.write(self.diet, 'diet.csv'), chunksize=2)
+        self.assertAlmostEqual(aggregates.means()['Calories'], self.diet['Calories'].mean())
+        self.assertEqual(dict(aggregates.calorie_categories), {'Low': 1, 'Medium': 1, 'High': 1})
+
+    def test_unsupported_source(self):
+        """\nAn unknown extension is rejected instead of guessed."""
+        with self.assertRaises(ValueError):
+            list(ingest.iterChunks('workout.txt'))
+
+class IncrementalAppend(unittest.TestCase):
+    def setUp(self):
+        self.workout = pd.DataFrame({
+            'Date': pd.to_datetime(['2024-01-01', '2024-01-01', '2024-01-02', '2024-01-03']),
+            'Exercise': ['Squat', 'Bench Press', 'Deadlift', 'Squat'],
+            'Weight (kg)': [120, 90, 150, 125], 'Sets': [3, 3, 1, 3], 'Reps': [5, 5, 5, 5]
+        })
+        self.diet = pd.DataFrame({
+            'Date': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']),
+            'Calories': [2100, 2600, 3100, 2800], 'Protein (g)': [150, 160, 170, 165],
+            'Carbs (g)': [200, 300, 400, 350], 'Fats (g)': [60, 70, 80, 75]
+        })
+
+    def full_merge(self, workout):
+        return pd.merge(processWorkout(workout.copy()), processDietary(self.diet.copy()), on='Date', how='inner')
+
+    def test_appending_matches_full_reprocess(self):
+        """\nAppending a grown file only adds the new sessions and ends up equal to reprocessing everything."""
+        log = TrainingLog()
+        log.setDietary(self.diet)
+        log.setWorkout(self.workout.iloc[:2])
+        added = log.appendWorkout(self.workout)
+        self.assertEqual(len(added), 2)
+        pd.testing.assert_frame_equal(log.combined, self.full_merge(self.workout))
+        self.assertEqual(log.workout_aggregates.rows, 4)
+
+    def test_same_day_repeats_are_kept(self):
+        """\nA second identical set on the last stored day is new, re-uploading the same rows is not."""
+        log = TrainingLog()
+        log.setWorkout(self.workout)
+        self.assertEqual(len(log.appendWorkout(self.workout)), 0)
+        extra = pd.concat([self.workout, self.workout.iloc[[3]]], ignore_index=True)
+        self.assertEqual(len(log.appendWorkout(extra)), 1)
+        self.assertEqual(len(log.workout), 5)
+
+    def test_dedup_policy_backfills_older_rows(self):
+        """\nWith the dedup policy an older unseen session is inserted in date order."""
+        log = TrainingLog()
+        log.setDietary(self.diet)
+        log.setWorkout(self.workout.iloc[[0, 1, 3]])
+        self.assertEqual(len(log.appendWorkout(self.workout, policy='newer')), 0)
+        self.assertEqual(len(log.appendWorkout(self.workout, policy='dedup')), 1)
+        pd.testing.assert_frame_equal(log.combined, self.full_merge(self.workout))
+
+    def test_dataset_reuses_the_appended_merge(self):
+        """\nThe log's dataset is kept until the next append and its same-day join is the log's merge, not a new one."""
+        log = TrainingLog()
+        log.setDietary(self.diet)
+        log.setWorkout(self.workout.iloc[:2])
+        first = log.dataset
+        self.assertIs(log.dataset, first)
+        log.appendWorkout(self.workout)
+        self.assertIsNot(log.dataset, first)
+        pd.testing.assert_frame_equal(log.dataset.combined, self.full_merge(self.workout))
+        pd.testing.assert_frame_equal(log.dataset.combined, CombinedDataset(log.workout, log.diet).combined)
+        storage = memo.DataStorage()
+        storage.setLazy('dataset', lambda: log.dataset)
+        self.assertIs(storage['dataset'], log.dataset)
+
+class CombinedDatasetJoins(unittest.TestCase):
+    def setUp(self):
+        self.workout = pd.DataFrame({
+            'Date': pd.to_datetime(['2023-01-05', '2023-01-02', '2023-01-03', '2023-01-03', '2023-01-09']),
+            'Exercise': ['Squat', 'Squat', 'Bench Press', 'Deadlift', 'Squat'],
+            'Total Volume': [1000, 1500, 1200, 900, 1100]
+        })
+        self.diet = pd.DataFrame({
+            'Date': pd.to_datetime(['2023-01-01', '2023-01-02', '2023-01-03', '2023-01-04', '2023-01-05']),
+            'Calories': [2000, 2500, 2300, 2800, 2600],
+            'Protein (g)': [50, 60, 55, 65, 70], 'Carbs (g)': [300, 350, 320, 380, 360], 'Fats (g)': [70, 80, 75, 85, 90]
+        })
+        self.dataset = CombinedDataset(self.workout, self.diet)
+
+    def sort(self, frame):
+        return frame.sort_values(['Date', 'Exercise'], ignore_index=True)
+
+    def test_same_day_join_matches_merge(self):
+        """\nThe lag 0 view holds the same rows as an inner pd.merge and is only built once."""
+        expected = pd.merge(self.workout, self.diet, on='Date', how='inner')
+        pd.testing.assert_frame_equal(self.sort(self.dataset.join()), self.sort(expected))
+        self.assertIs(self.dataset.join(), self.dataset.join())
+        pd.testing.assert_frame_equal(correlateDietToWorkout(self.dataset), correlateDietToWorkout(self.workout, self.diet))
+
+    def test_previous_day_matches_align(self):
+        """\nThe lag 1 view pairs each workout with the previous day's diet like AlignDataforNutrition."""
+        aligned = AlignDataforNutrition(self.diet.copy(), self.workout.copy())
+        view = self.dataset.join(lag=1)
+        self.assertEqual(len(view), len(aligned))
+        self.assertTrue(((view['Date'] - view['Diet Date']) == pd.Timedelta(days=1)).all())
+        self.assertEqual(sorted(view['Calories']), sorted(aligned['Calories']))
+
+    def test_rolling_window_and_split(self):
+        """\nA 3-day window averages the diet before the workout and the split matches ProcessDietaryChange."""
+        view = self.dataset.join(window=3)
+        squat = view[view['Date'] == pd.Timestamp('2023-01-05')]
+        self.assertAlmostEqual(squat['Calories'].iloc[0], (2300 + 2800 + 2600) / 3)
+        before, after = ProcessDietaryChange(self.dataset, None, '2023-01-03')
+        expected_before, expected_after = ProcessDietaryChange(self.workout, self.diet, '2023-01-03')
+        self.assertEqual((len(before), len(after)), (len(expected_before), len(expected_after)))
+
+class BatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        dates = pd.date_range('2024-01-01', periods=8).strftime('%m/%d/%Y')
+        workout = pd.DataFrame({
+            'Date': dates, 'Exercise': ['Squat', 'Bench Press'] * 4,
+            'Weight (kg)': [100, 80, 105, 82, 110, 85, 112, 86], 'Sets': 3, 'Reps': 5
+        })
+        diet = pd.DataFrame({
+            'Date': dates, 'Calories': [2000, 2400, 2200, 2600, 2500, 2700, 2300, 2800],
+            'Protein (g)': [150, 160, 155, 170, 165, 175, 158, 180],
+            'Carbs (g)': [200, 260, 230, 300, 280, 310, 240, 320], 'Fats (g)': [60, 65, 62, 70, 68, 72, 63, 75]
+        })
+        workout.to_excel(os.path.join(self.tmp.name, 'ana_workout.xlsx'), index=False)
+        diet.to_excel(os.path.join(self.tmp.name, 'ana_diet.xlsx'), index=False)
+        os.makedirs(os.path.join(self.tmp.name, 'ben'))
+        workout.to_excel(os.path.join(self.tmp.name, 'ben', 'workout.xlsx'), index=False)
+        with open(os.path.join(self.tmp.name, 'ben', 'diet.xlsx'), 'w') as handle:
+            handle.write('not a workbook')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_discovery_and_error_isolation(self):
+        """\nBoth naming layouts are found and a broken file only fails its own athlete."""
+        jobs = batch.discoverAthletes(self.tmp.name)
+        self.assertEqual([job['Athlete'] for job in jobs], ['ana', 'ben'])
+        output = os.path.join(self.tmp.name, 'results.csv')
+        results = batch.runBatch(jobs, workers=2, output=output)
+        self.assertEqual(list(results['Status']), ['ok', 'error'])
+        self.assertEqual(len(pd.read_csv(output)), 2)
+        self.assertIn('Squat Score', results.columns)
+
+    def test_manifest_with_intervention_date(self):
+        """\nA manifest can ask for the diet effectiveness t-test at a given date."""
+        manifest = os.path.join(self.tmp.name, 'manifest.csv')
+        pd.DataFrame({'Athlete': ['ana'], 'Workout': ['ana_workout.xlsx'], 'Diet': ['ana_diet.xlsx'],
+                      'Intervention Date': ['2024-01-05']}).to_csv(manifest, index=False)
+        results = batch.runBatch(batch.collectJobs(manifest), workers=1)
+        self.assertEqual(results['Status'].iloc[0], 'ok')
+        self.assertTrue(np.isfinite(results['Diet P-value'].iloc[0]))
+
+class HeadlessRendering(unittest.TestCase):
+    def setUp(self):
+        self.combined = pd.DataFrame({
+            'Date': pd.date_range('2024-01-01', periods=6),
+            'Exercise': ['Squat', 'Bench Press', 'Squat', 'Bench Press', 'Squat', 'Deadlift'],
+            'Weight (kg)': [100, 80, 105, 82, 110, 150],
+            'Total Volume': [1500, 1200, 1575, 1230, 1650, 750],
+            'Calories': [2000, 2400, 2200, 2600, 2500, 2700],
+            'Protein (g)': [150, 160, 155, 170, 165, 175],
+            'Carbs (g)': [200, 260, 230, 300, 280, 310], 'Fats (g)': [60, 65, 62, 70, 68, 72]
+        })
+
+    def test_performance_model_is_pure(self):
+        """\nThe compute half returns coefficients and forecast arrays without opening a figure."""
+        import matplotlib.pyplot as plt
+        plt.close('all')
+        workout = self.combined[['Date', 'Total Volume']]
+        diet = self.combined[['Date', 'Calories']]
+        result = performanceModel(workout, diet)
+        self.assertEqual(len(result['Predictions']), 6)
+        self.assertEqual(len(result['Future Calories']), len(result['Future Predictions']))
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_render_to_bytes_reuses_figures(self):
+        """\nCharts render to png and svg bytes off-screen and the same figure is reused."""
+        renderer = render.Renderer()
+        png = renderer.chart('forecast', self.combined, 'Squat', 3)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        first = renderer.figure((10, 5))
+        svg = renderer.chart('forecast', self.combined, 'Squat', 3, fmt='svg')
+        self.assertIn(b'<svg', svg)
+        self.assertIs(renderer.figure((10, 5)), first)
+        for name, args in [('macros', (self.combined,)), ('gains', (self.combined,)),
+                           ('progress', ('Squat', 110, 140)), ('heatmap', (self.combined[['Calories', 'Total Volume']].corr(),))]:
+            self.assertTrue(renderer.chart(name, *args).startswith(b'\x89PNG'), name)
+
+class FakeRoot:
+    # stands in for Tk: records after() calls so the test can drive the polling loop
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def run_until_idle(self, timeout=5):
+        deadline = time.time() + timeout
+        while self.scheduled and time.time() < deadline:
+            callback = self.scheduled.pop(0)
+            time.sleep(0.01)
+            callback()
+
+
+class FakeButton:
+    def __init__(self):
+        self.states = []
+
+    def configure(self, state):
+        self.states.append(state)
+
+
+class BackgroundTasks(unittest.TestCase):
+    def test_results_and_progress_arrive_through_polling(self):
+        """\nProgress and the result are delivered by the poll loop and buttons are re-enabled afterwards."""
+        root, button, events = FakeRoot(), FakeButton(), []
+        runner = TaskRunner(root, poll_ms=1)
+        def job(task, value):
+            task.report(0.5, 'half way')
+            return value * 2
+        runner.submit(job, 21, on_done=events.append, on_progress=lambda f, m: events.append((f, m)), widgets=[button])
+        root.run_until_idle()
+        self.assertEqual(events, [(0.5, 'half way'), 42])
+        self.assertEqual(button.states, ['disabled', 'normal'])
+        self.assertFalse(runner.busy)
+        runner.shutdown()
+
+    def test_cancel_and_errors(self):
+        """\nA cancelled job calls on_cancel instead of on_done and exceptions go to on_error."""
+        root, events = FakeRoot(), []
+        runner = TaskRunner(root, poll_ms=1)
+        started = threading.Event()
+        def slow(task):
+            started.set()
+            while True:
+                task.report(0.1)
+                time.sleep(0.01)
+        task = runner.submit(slow, on_done=events.append, on_cancel=lambda: events.append('cancelled'))
+        started.wait(5)
+        task.cancel()
+        def broken(task):
+            raise ValueError('bad file')
+        runner.submit(broken, on_error=lambda error: events.append(type(error).__name__))
+        root.run_until_idle()
+        self.assertEqual(sorted(events), ['ValueError', 'cancelled'])
+        runner.shutdown()
+
+    def test_shared_buttons_wait_for_every_job(self):
+        """\nButtons shared by two jobs are only re-enabled when the second one finishes."""
+        root, button = FakeRoot(), FakeButton()
+        runner = TaskRunner(root, workers=2, poll_ms=1)
+        release = threading.Event()
+        runner.submit(lambda task: 'quick', widgets=[button])
+        runner.submit(lambda task: release.wait(5), widgets=[button])
+        while len(runner._callbacks) > 1:
+            runner.poll()
+            time.sleep(0.01)
+        self.assertEqual(button.states, ['disabled', 'disabled'])
+        release.set()
+        root.run_until_idle()
+        self.assertEqual(button.states, ['disabled', 'disabled', 'normal'])
+        runner.shutdown()
+
+class ClosedFormRegression(unittest.TestCase):
+    def test_matches_sklearn_on_rank_deficient_data(self):
+        """\nThe nutritionAnalysis test data has identical protein and fat columns, the min-norm answer must match sklearn."""
+        combined_data = pd.DataFrame({
+            'Exercise': ['Bench Press', 'Bench Press', 'Bench Press'],
+            'Protein (g)': [50, 60, 55], 'Carbs (g)': [200, 220, 210], 'Fats (g)': [50, 60, 55],
+            'Calories': [2000, 2500, 2300], 'Weight (kg)_std': [1.0, 1.5, 1.2]
+        })
+        X = combined_data[['Protein (g)', 'Carbs (g)', 'Fats (g)', 'Calories']]
+        model = LinearRegression().fit(X, combined_data['Weight (kg)_std'])
+        results = nutritionAnalysis(combined_data, 'Bench Press')
+        np.testing.assert_allclose([results['Protein Coefficient'], results['Carbs Coefficient'],
+                                    results['Fats Coefficient'], results['Calories Coefficient']], model.coef_, rtol=1e-6, atol=1e-9)
+        self.assertAlmostEqual(results['Intercept'], model.intercept_, places=6)
+        self.assertAlmostEqual(results['Score'], model.score(X, combined_data['Weight (kg)_std']), places=6)
+
+    def test_batched_groups_match_separate_fits(self):
+        """\nFitting every exercise at once gives the same answer as one sklearn fit per exercise."""
+        rng = np.random.default_rng(7)
+        rows = 60
+        combined_data = pd.DataFrame({
+            'Exercise': rng.choice(['Bench Press', 'Squat', 'Deadlift'], rows),
+            'Protein (g)': rng.normal(160, 15, rows), 'Carbs (g)': rng.normal(300, 40, rows),
+            'Fats (g)': rng.normal(70, 8, rows), 'Calories': rng.normal(2600, 250, rows)
+        })
+        combined_data['Weight (kg)_std'] = 0.1 * combined_data['Protein (g)'] + 0.01 * combined_data['Calories'] + rng.normal(0, 1, rows)
+        table = nutritionAnalysisAll(combined_data)
+        for exercise, group in combined_data.groupby('Exercise'):
+            X = group[['Protein (g)', 'Carbs (g)', 'Fats (g)', 'Calories']]
+            model = LinearRegression().fit(X, group['Weight (kg)_std'])
+            np.testing.assert_allclose(table.loc[exercise, ['Protein Coefficient', 'Carbs Coefficient', 'Fats Coefficient', 'Calories Coefficient']].to_numpy(dtype=float), model.coef_, rtol=1e-6)
+            self.assertAlmostEqual(table.loc[exercise, 'Score'], model.score(X, group['Weight (kg)_std']), places=8)
+
+    def test_standard_errors_and_intervals(self):
+        """\nStandard errors follow the textbook simple regression formula and intervals contain the prediction."""
+        x = np.arange(10, dtype=float)
+        y = 2 * x + np.array([0.3, -0.2, 0.1, 0.4, -0.5, 0.2, -0.1, 0.0, 0.3, -0.4])
+        fit = regression.fitOLS(x, y)
+        residuals = y - fit.predict(x)[0]
+        expected = np.sqrt((residuals ** 2).sum() / 8 / ((x - x.mean()) ** 2).sum())
+        self.assertAlmostEqual(fit.stderr[0, 0], expected)
+        prediction, lower, upper = fit.interval([[12.0]])
+        self.assertTrue(lower[0, 0] < prediction[0, 0] < upper[0, 0])
+
+class FastStartCli(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        dates = pd.date_range('2024-01-01', periods=6).strftime('%m/%d/%Y')
+        self.workout = os.path.join(self.tmp.name, 'workout.xlsx')
+        self.diet = os.path.join(self.tmp.name, 'diet.xlsx')
+        pd.DataFrame({'Date': dates, 'Exercise': ['Squat', 'Bench Press'] * 3,
+                      'Weight (kg)': [100, 80, 105, 82, 110, 85], 'Sets': 3, 'Reps': 5}).to_excel(self.workout, index=False)
+        pd.DataFrame({'Date': dates, 'Calories': [2000, 2400, 2200, 2600, 2500, 2700],
+                      'Protein (g)': [150, 160, 155, 170, 165, 175], 'Carbs (g)': [200, 260, 230, 300, 280, 310],
+                      'Fats (g)': [60, 65, 62, 70, 68, 72]}).to_excel(self.diet, index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, *argv):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            optilift.main(list(argv))
+        return json.loads(output.getvalue())
+
+    def test_load_and_analyze_commands(self):
+        """\nThe cli loads, processes and analyzes files and prints json."""
+        self.assertEqual(self.run_cli('load', self.workout, '--json')['Rows'], 6)
+        processed = self.run_cli('process', self.workout, '--json')
+        self.assertIn('Total Volume', processed['Columns'])
+        correlation = self.run_cli('analyze', self.workout, self.diet, '--json')
+        self.assertEqual(correlation['Total Volume']['Total Volume'], 1.0)
+        nutrition = self.run_cli('analyze', self.workout, self.diet, '-a', 'nutrition', '--json')
+        self.assertEqual(sorted(nutrition['Score']), ['Bench Press', 'Squat'])
+
+    def test_data_import_stays_light(self):
+        """\nImporting data and analysis must not drag in scipy, sklearn or matplotlib."""
+        script = "import sys, data, analysis, optilift; print([m for m in ('scipy', 'sklearn', 'matplotlib', 'seaborn') if m in sys.modules])"
+        output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), '[]')
+
+class SyntheticData(unittest.TestCase):
+    def test_seeded_and_processable(self):
+        """\nThe same seed gives the same log and the generated frames run through the pipeline."""
+        workout, dietary = synthetic.generatePair(5000, athletes=3, seed=11)
+        again, _ = synthetic.generatePair(5000, athletes=3, seed=11)
+        pd.testing.assert_frame_equal(workout, again)
+        self.assertEqual(workout['Athlete'].nunique(), 3)
+        self.assertTrue(workout['Date'].between(dietary['Date'].min(), dietary['Date'].max()).all())
+        processed = processWorkout(workout.copy())
+        self.assertFalse((processed['Weight (kg)'] == 0).any())
+        self.assertEqual(correlateDietToWorkout(processed, dietary).shape, (5, 5))
+
+class TypedSchema(unittest.TestCase):
+    def test_bad_values_raise(self):
+        """\nNon-numeric, negative and missing columns raise a SchemaError naming the column."""
+        frame = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=3), 'Exercise': 'Squat',
+                              'Weight (kg)': [100, 105, 110], 'Sets': [3, 'three', 3], 'Reps': 5})
+        with self.assertRaisesRegex(schema.SchemaError, "'Sets'.*rows 1"):
+            schema.applyWorkoutSchema(frame)
+        with self.assertRaisesRegex(schema.SchemaError, "'Weight \\(kg\\)'"):
+            schema.applyWorkoutSchema(frame.assign(Sets=3, **{'Weight (kg)': [100, -5, 110]}))
+        with self.assertRaisesRegex(schema.SchemaError, 'missing columns'):
+            schema.applyWorkoutSchema(frame.drop(columns='Reps'))
+
+    def test_compact_and_same_results(self):
+        """\nThe typed layout is at least 3x smaller and the analyses agree with the float64 frame."""
+        workout = synthetic.generateWorkout(200000, athletes=5, seed=3)
+        typed = schema.applyWorkoutSchema(workout)
+        self.assertIsInstance(typed['Exercise'].dtype, pd.CategoricalDtype)
+        self.assertEqual(typed['Sets'].dtype, np.uint8)
+        self.assertEqual(typed['Weight (kg)'].dtype, np.float32)
+        self.assertGreaterEqual(schema.memoryUsage(workout) / schema.memoryUsage(typed), 3)
+
+        small, dietary = synthetic.generatePair(3000, seed=4)
+        wide = processWorkout(small.copy())
+        narrow = processWorkout(schema.applyWorkoutSchema(small))
+        narrow_diet = schema.applyDietarySchema(dietary)
+        np.testing.assert_allclose(narrow['Total Volume'], wide['Total Volume'], rtol=1e-6)
+        pd.testing.assert_frame_equal(correlateDietToWorkout(narrow, narrow_diet), correlateDietToWorkout(wide, dietary),
+                                      check_exact=False, rtol=1e-4)
+        merged_wide = pd.merge(wide, dietary, on='Date')
+        merged_narrow = pd.merge(narrow, narrow_diet, on='Date')
+        for key, value in nutritionAnalysis(merged_wide, 'Squat').items():
+            self.assertAlmostEqual(nutritionAnalysis(merged_narrow, 'Squat')[key], value, places=3)
+
+    def test_volume_does_not_overflow(self):
+        """\nSets * Reps on uint8 columns is widened before multiplying."""
+        frame = pd.DataFrame({'Date': pd.date_range('2024-01-01', periods=2), 'Exercise': 'Squat',
+                              'Weight (kg)': [100, 100], 'Sets': [20, 20], 'Reps': [20, 20]})
+        processed = processWorkout(schema.applyWorkoutSchema(frame))
+        self.assertTrue((processed['Total Volume'] == 400 * 100 / 4).all())
+
+class LoadMetrics(unittest.TestCase):
+    def setUp(self):
+        workout, self.dietary = synthetic.generatePair(4000, athletes=2, years=1, seed=5)
+        self.workout = processWorkout(workout)
+
+    def test_rolling_matches_pandas(self):
+        """\nThe 7/28 day windows agree with a plain per-athlete time-based rolling sum."""
+        metrics = loadmetrics.loadMetrics(self.workout)
+        for athlete, group in metrics.groupby('Athlete', observed=True):
+            volume = group.set_index('Date')['Volume']
+            np.testing.assert_allclose(group['7 Day Volume'], volume.rolling('7D').sum())
+            np.testing.assert_allclose(group['28 Day Volume'], volume.rolling('28D').sum())
+        expected = metrics['7 Day Volume'] / (metrics['28 Day Volume'] / 4)
+        np.testing.assert_allclose(metrics['ACWR'], expected)
+
+    def test_e1rm_formulas(self):
+        """\nEpley and Brzycki estimates, a single is its own 1RM and 0 reps has none."""
+        np.testing.assert_allclose(loadmetrics.estimated1RM([100, 100, 100], [1, 10, 0]), [100, 100 * (1 + 10 / 30), np.nan])
+        np.testing.assert_allclose(loadmetrics.estimated1RM([100, 100], [5, 37], 'brzycki'), [100 * 36 / 32, np.nan])
+        with self.assertRaises(ValueError):
+            loadmetrics.estimated1RM(100, 5, 'lander')
+
+    def test_weekly_tonnage(self):
+        """\nWeekly tonnage per lift adds up to the total weight moved."""
+        weekly = loadmetrics.weeklyTonnage(self.workout)
+        self.assertTrue((weekly['Week'].dt.dayofweek == 0).all())
+        total = (self.workout['Sets'] * self.workout['Reps'] * self.workout['Weight (kg)']).sum()
+        self.assertAlmostEqual(weekly['Tonnage'].sum() / total, 1.0, places=6)
+
+    def test_incremental_matches_full(self):
+        """\nAppending sessions month by month gives the same metrics as computing them at once."""
+        log = TrainingLog()
+        months = self.workout['Date'].dt.to_period('M')
+        raw = self.workout[['Athlete', 'Date', 'Exercise', 'Weight (kg)', 'Sets', 'Reps']]
+        for month in months.unique():
+            log.appendWorkout(raw[months == month], policy='dedup')
+        full = loadmetrics.loadMetrics(self.workout)
+        tracked = log.load_metrics.daily
+        np.testing.assert_allclose(tracked['ACWR'], full['ACWR'])
+        np.testing.assert_allclose(tracked['28 Day Volume'], full['28 Day Volume'])
+        best = self.workout.assign(e1RM=loadmetrics.estimated1RM(self.workout['Weight (kg)'], self.workout['Reps']))
+        expected = best.groupby(['Athlete', 'Exercise'], observed=True)['e1RM'].max()
+        np.testing.assert_allclose(log.load_metrics.bestLifts(), expected)
+
+    def test_correlation_features(self):
+        """\nload_features adds the rolling load columns to the correlation matrix."""
+        dataset = CombinedDataset(self.workout, self.dietary)
+        matrix = correlateDietToWorkout(dataset, load_features=True)
+        self.assertEqual(list(matrix.columns[-4:]), loadmetrics.LOAD_FEATURES)
+        self.assertEqual(matrix.shape, (9, 9))
+        pd.testing.assert_frame_equal(matrix.iloc[:5, :5], correlateDietToWorkout(dataset))
+
+class ChangepointScan(unittest.TestCase):
+    def setUp(self):
+        workout, dietary = synthetic.generatePair(2000, years=1, seed=2)
+        dietary.loc[dietary['Date'] >= '2020-06-01', 'Calories'] += 600
+        self.dataset = CombinedDataset(processWorkout(workout), processDietary(dietary))
+
+    def test_scan_matches_single_tests(self):
+        """\nEvery row of the scan is the same Welch test dietEffectiveness runs at that date."""
+        table = analysis.dietEffectivenessScan(self.dataset, min_size=5)
+        self.assertEqual(list(table.index[:3]), [1, 2, 3])
+        self.assertTrue(table['Adjusted P-value'].is_monotonic_increasing)
+        for _, row in table.sample(5, random_state=0).iterrows():
+            single = dietEffectiveness(self.dataset, row['Date'])
+            self.assertAlmostEqual(row['T-statistic'], single['T-statistic'], places=8)
+            self.assertAlmostEqual(row['P-value'], single['P-value'], places=8)
+
+    def test_corrections(self):
+        """\nBonferroni, Holm and Benjamini-Hochberg adjustments."""
+        p = [0.01, 0.04, 0.03, np.nan]
+        np.testing.assert_allclose(changepoint.adjustPValues(p, 'bonferroni'), [0.03, 0.12, 0.09, np.nan])
+        np.testing.assert_allclose(changepoint.adjustPValues(p, 'holm'), [0.03, 0.06, 0.06, np.nan])
+        np.testing.assert_allclose(changepoint.adjustPValues(p, 'fdr_bh'), [0.03, 0.04, 0.04, np.nan])
+        with self.assertRaises(ValueError):
+            changepoint.adjustPValues(p, 'sidak')
+
+    def test_finds_calorie_change(self):
+        """\nThe 600 kcal jump is found as a changepoint and used as the candidate date."""
+        found = changepoint.changepoints(self.dataset.diet)
+        self.assertIn(pd.Timestamp('2020-06-01'), list(found['Date']))
+        table = analysis.dietEffectivenessScan(self.dataset, candidates='changepoints')
+        self.assertIn(pd.Timestamp('2020-06-01'), list(table['Date']))
+
+class ResamplingInference(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        x = rng.normal(size=80)
+        self.frame = pd.DataFrame({'x': x, 'y': 2 * x + rng.normal(size=80), 'noise': rng.normal(size=80)})
+
+    def test_correlation_intervals_and_pvalues(self):
+        """\nThe related pair gets a tight interval and a small p-value, the noise column doesn't."""
+        table = inference.bootstrapCorrelation(self.frame, resamples=1000, permutations=1000, seed=1, tol=0)
+        self.assertEqual(table.attrs['resamples'], 1000)
+        related, unrelated = table.loc[('x', 'y')], table.loc[('x', 'noise')]
+        self.assertAlmostEqual(related['Correlation'], self.frame['x'].corr(self.frame['y']))
+        self.assertTrue(related['Lower'] < related['Correlation'] < related['Upper'])
+        self.assertLess(related['P-value'], 0.01)
+        self.assertTrue(unrelated['Lower'] < 0 < unrelated['Upper'])
+        self.assertGreater(unrelated['P-value'], 0.05)
+
+    def test_seeded_and_parallel(self):
+        """\nThe same seed gives the same table with or without a process pool."""
+        serial = inference.bootstrapRegression(self.frame[['x']], self.frame['y'], ['x'], resamples=600, permutations=600, seed=4)
+        again = inference.bootstrapRegression(self.frame[['x']], self.frame['y'], ['x'], resamples=600, permutations=600, seed=4)
+        parallel = inference.bootstrapRegression(self.frame[['x']], self.frame['y'], ['x'], resamples=600, permutations=600,
+                                                 seed=4, workers=2)
+        pd.testing.assert_frame_equal(serial, again)
+        pd.testing.assert_frame_equal(serial, parallel)
+        self.assertTrue(serial.loc['x', 'Lower'] < serial.loc['x', 'Estimate'] < serial.loc['x', 'Upper'])
+        self.assertLess(serial.loc['x', 'P-value'], 0.01)
+
+    def test_early_stopping(self):
+        """\nSampling stops before the cap once the interval stops moving."""
+        table = inference.bootstrapCorrelation(self.frame, resamples=20000, permutations=250, batch=250, tol=0.01)
+        self.assertLess(table.attrs['resamples'], 20000)
+        with self.assertRaises(ValueError):
+            inference.resample(inference._correlation_batch, (self.frame.to_numpy(),), 'jackknife', 10, None)
+
+    def test_nutrition_inference(self):
+        """\nnutritionInference reports the nutritionAnalysis estimates with intervals around them."""
+        workout, dietary = synthetic.generatePair(800, years=1, seed=6)
+        dataset = CombinedDataset(processWorkout(workout), processDietary(dietary))
+        table = analysis.nutritionInference(dataset, 'Squat', resamples=500, permutations=500)
+        point = nutritionAnalysis(dataset, 'Squat')
+        self.assertEqual(list(table.index), ['Intercept', 'Protein', 'Carbs', 'Fats', 'Calories'])
+        self.assertAlmostEqual(table.loc['Calories', 'Estimate'], point['Calories Coefficient'])
+        self.assertTrue((table['Lower'] <= table['Upper']).all())
+        self.assertTrue(table['P-value'].iloc[1:].between(0, 1).all())
+
+class MemoizedResults(unittest.TestCase):
+    def setUp(self):
+        self.previous = memo.results
+        memo.configure()
+        workout, dietary = synthetic.generatePair(1000, years=1, seed=9)
+        self.workout, self.dietary = processWorkout(workout), processDietary(dietary)
+
+    def tearDown(self):
+        memo.results = self.previous
+
+    def test_hits_on_same_content(self):
+        """\nThe same data (even a copy) and arguments hit the cache, different data misses."""
+        first = correlateDietToWorkout(CombinedDataset(self.workout, self.dietary))
+        second = correlateDietToWorkout(CombinedDataset(self.workout.copy(), self.dietary.copy()))
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(memo.results.stats()['hits'], 1)
+        changed = self.workout.copy()
+        changed.loc[changed.index[0], 'Total Volume'] += 1
+        dataset = CombinedDataset(changed, self.dietary)
+        correlateDietToWorkout(dataset)
+        nutritionAnalysis(dataset.combined, 'Squat')
+        nutritionAnalysis(dataset.combined, 'Bench Press')
+        self.assertEqual(memo.results.stats()['misses'], 4)
+
+    def test_plain_frames_are_not_hashed(self):
+        """\nCalls on frames no dataset built skip the cache instead of fingerprinting every row."""
+        first = correlateDietToWorkout(self.workout, self.dietary)
+        pd.testing.assert_frame_equal(first, correlateDietToWorkout(self.workout, self.dietary))
+        self.assertEqual(memo.results.stats()['hits'] + memo.results.stats()['misses'], 0)
+        self.assertEqual(memo.results.stats()['entries'], 0)
+
+    def test_results_are_copies(self):
+        """\nChanging a returned result doesn't change the cached one."""
+        dataset = CombinedDataset(self.workout, self.dietary)
+        first = correlateDietToWorkout(dataset)
+        first.iloc[0, 0] = -5
+        self.assertEqual(correlateDietToWorkout(dataset).iloc[0, 0], 1.0)
+
+    def test_disk_tier_and_invalidation(self):
+        """\nA new cache with the same directory reads results from disk; updating storage clears memory."""
+        with tempfile.TemporaryDirectory() as directory:
+            memo.configure(directory=directory)
+            expected = performanceModel(CombinedDataset(self.workout, self.dietary))
+            memo.configure(directory=directory)
+            again = performanceModel(CombinedDataset(self.workout, self.dietary))
+            self.assertEqual(memo.results.stats()['disk_hits'], 1)
+            self.assertEqual(again['Score'], expected['Score'])
+
+            storage = memo.DataStorage()
+            self.assertEqual(memo.results.stats()['entries'], 1)
+            storage['workout'] = self.workout
+            self.assertEqual(memo.results.stats()['entries'], 0)
+
+class StageProfiling(unittest.TestCase):
+    def tearDown(self):
+        profiling.disable()
+
+    def test_disabled_is_a_no_op(self):
+        """\nWith profiling off nothing is recorded and stage() is the shared null context."""
+        profiling.disable()
+        profiling.last_run = None
+        self.assertIs(profiling.stage('x'), profiling._NULL)
+        processWorkout(synthetic.generateWorkout(200))
+        self.assertIsNone(profiling.last_run)
+
+    def test_nested_stages_and_outputs(self):
+        """\nStages nest into one run with rows, self time, peak memory, json and collapsed stacks."""
+        profiling.enable(memory=True)
+        workout, dietary = synthetic.generatePair(2000, years=1)
+        with profiling.run('click') as run:
+            processed = processWorkout(workout)
+            with profiling.stage('outer'):
+                with profiling.stage('inner') as timing:
+                    buffer = np.ones(500000)
+                    timing.rows_out = len(buffer)
+            correlateDietToWorkout(processed, dietary)
+        self.assertIs(profiling.last_run, run)
+        summary = {entry['path']: entry for entry in run.summary()}
+        self.assertEqual(summary['click;data.processWorkout']['rows_in'], 2000)
+        self.assertIn('click;data.processWorkout;ratios.standardize_weights', summary)
+        self.assertIn('click;analysis.correlateDietToWorkout;dataset.combine', summary)
+        inner, outer = summary['click;outer;inner'], summary['click;outer']
+        self.assertEqual(inner['rows_out'], 500000)
+        self.assertGreaterEqual(inner['peak_mb'], 3.9)
+        self.assertGreaterEqual(outer['peak_mb'], inner['peak_mb'])
+        self.assertAlmostEqual(outer['self'] + inner['wall'], outer['wall'])
+        for line in run.collapsed().splitlines():
+            stack, micros = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('click') and micros.isdigit())
+        with tempfile.TemporaryDirectory() as directory:
+            with open(run.dump(directory)) as handle:
+                self.assertEqual(json.load(handle)['name'], 'click')
+        self.assertIn('data.processWorkout', run.table())
+
+class SqliteStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = store.TrainingStore(os.path.join(self.tmp.name, 'training.db'))
+        self.workout, self.dietary = synthetic.generatePair(3000, athletes=2, years=1, seed=12)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_round_trip_and_pushdown(self):
+        """\nStored rows come back unchanged and filters return the same slice as pandas would."""
+        self.store.insertWorkout(self.workout)
+        self.store.insertDietary(self.dietary, athlete='athlete_1')
+        back = self.store.workout()
+        expected = schema.applyWorkoutSchema(self.workout)
+        pd.testing.assert_frame_equal(back, expected, check_categorical=False)
+        sliced = self.store.workout('athlete_1', '2020-03-01', '2020-05-01', ['Squat', 'Deadlift'])
+        mask = ((self.workout['Athlete'] == 'athlete_1') & self.workout['Date'].between('2020-03-01', '2020-04-30')
+                & self.workout['Exercise'].isin(['Squat', 'Deadlift']))
+        self.assertEqual(len(sliced), mask.sum())
+        self.assertTrue(sliced['Exercise'].isin(['Squat', 'Deadlift']).all())
+        self.assertEqual(list(self.store.dietary(start='2020-01-01', end='2020-01-11')['Date'].dt.day), list(range(1, 11)))
+
+    def test_sql_join_matches_combined_dataset(self):
+        """\nThe joined slice from sql is the same as the CombinedDataset join of the processed frames."""
+        workout = self.workout[self.workout['Athlete'] == 'athlete_0'].drop(columns='Athlete')
+        self.store.insertWorkout(workout)
+        self.store.insertDietary(self.dietary)
+        joined = self.store.join(exercises='Squat', lag=1)
+        dataset = CombinedDataset(processWorkout(schema.applyWorkoutSchema(workout)), processDietary(schema.applyDietarySchema(self.dietary)))
+        expected = dataset.join(lag=1)
+        expected = expected[expected['Exercise'] == 'Squat'].reset_index(drop=True)
+        self.assertEqual(len(joined), len(expected))
+        np.testing.assert_allclose(joined['Total Volume'], expected['Total Volume'])
+        np.testing.assert_allclose(joined['Calories'], expected['Calories'])
+        self.assertTrue((joined['Diet Date'] == expected['Diet Date']).all())
+        self.assertEqual(nutritionAnalysis(joined, 'Squat')['Score'], nutritionAnalysis(expected, 'Squat')['Score'])
+
+    def test_load_writes_through_and_skips_excel(self):
+        """\nA file loaded once is read back from the store, and loading it again doesn't duplicate rows."""
+        path = synthetic.writeExcel(self.workout.head(200), os.path.join(self.tmp.name, 'workout.xlsx'))
+        first = loadWorkout(path, cache=False, store=self.store)
+        with unittest.mock.patch('data.readWorkout', side_effect=AssertionError('excel was read')):
+            again = loadWorkout(path, cache=False, store=self.store)
+        pd.testing.assert_frame_equal(again, first.reset_index(drop=True), check_categorical=False)
+        loadWorkout(path, cache=False, store=self.store, refresh=True)
+        self.assertEqual(self.store.counts()['lifts'], 200)
+
+    def test_batch_keeps_athletes_apart(self):
+        """\nBatch runs store each athlete under their own name, a second run gives the same results as no store."""
+        for athlete in ('athlete_0', 'athlete_1'):
+            workout = self.workout[self.workout['Athlete'] == athlete].drop(columns='Athlete')
+            synthetic.writeExcel(workout, os.path.join(self.tmp.name, f'{athlete}_workout.xlsx'))
+            synthetic.writeExcel(self.dietary, os.path.join(self.tmp.name, f'{athlete}_diet.xlsx'))
+        jobs = batch.discoverAthletes(self.tmp.name)
+        with unittest.mock.patch('store.default_store', None), unittest.mock.patch.dict(os.environ, {'OPTILIFT_STORE': ''}):
+            expected = batch.runBatch(jobs, workers=1)
+        with unittest.mock.patch('store.default_store', self.store):
+            batch.runBatch(jobs, workers=1)
+            again = batch.runBatch(jobs, workers=1)
+        pd.testing.assert_series_equal(again['Sessions'], expected['Sessions'])
+        np.testing.assert_allclose(again['Squat Score'], expected['Squat Score'])
+        self.assertEqual(self.store.athletes(), ['athlete_0', 'athlete_1'])
+        self.assertEqual(self.store.lastAthlete(), 'athlete_1')
+        # every athlete's lifts only meet their own nutrition
+        both = self.store.dataset()
+        self.assertEqual(len(both.combined), expected['Matched Rows'].sum())
+        self.assertEqual(len(self.store.dataset('athlete_0').combined), expected['Matched Rows'].iloc[0])
+        windowed = both.join(lag=1, window=3)
+        alone = self.store.dataset('athlete_1').join(lag=1, window=3)
+        np.testing.assert_allclose(windowed.loc[windowed['Athlete'] == 'athlete_1', 'Calories'], alone['Calories'])
+
+    def test_overlapping_files_keep_their_own_rows(self):
+        """
+Files over the same dates come back with their own rows, named or not, and a new name re-reads the file."""
+        paths = {}
+        for name, calories in (('ana_diet.xlsx', 2000), ('ben_diet.xlsx', 3000), ('week1.xlsx', 2000), ('week2.xlsx', 3000)):
+            paths[name] = synthetic.writeExcel(self.dietary.head(30).assign(Calories=calories), os.path.join(self.tmp.name, name))
+        for name in ('ana_diet.xlsx', 'ben_diet.xlsx'):
+            loadDietary(paths[name], cache=False, store=self.store, athlete=name.split('_')[0])
+        with unittest.mock.patch('data.readDietary', side_effect=AssertionError('excel was read')):
+            again = loadDietary(paths['ana_diet.xlsx'], cache=False, store=self.store, athlete='ana')
+        self.assertEqual(set(again['Calories']), {2000})
+        self.assertEqual(set(again['Athlete']), {'ana'})
+        # the same file under another name is read again and filed under that name too
+        renamed = loadDietary(paths['ana_diet.xlsx'], cache=False, store=self.store, athlete='cleo')
+        self.assertEqual(set(renamed['Athlete']), {'cleo'})
+        self.assertEqual(self.store.athletes(), ['ana', 'ben', 'cleo'])
+        # unnamed files aren't stored at all, so they can't overwrite each other
+        for name, calories in (('week1.xlsx', 2000), ('week2.xlsx', 3000), ('week1.xlsx', 2000)):
+            self.assertEqual(set(loadDietary(paths[name], cache=False, store=self.store)['Calories']), {calories})
+        self.assertEqual(self.store.counts()['nutrition'], 90)
+        # the command line names files from --athlete or the file name
+        self.assertEqual(optilift._athlete(paths['ben_diet.xlsx']), 'ben')
+        self.assertEqual(optilift._athlete(paths['week1.xlsx']), None)
+        self.assertEqual(optilift._athlete(paths['week1.xlsx'], 'dan'), 'dan')
+
+class BulkExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        workout, dietary = synthetic.generatePair(600, years=1, seed=19)
+        self.workout = processWorkout(schema.applyWorkoutSchema(workout))
+        self.dietary = processDietary(schema.applyDietarySchema(dietary))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_formats_round_trip(self):
+        """\nCsv, parquet and xlsx exports hold the same tables with the same rows."""
+        outputs = {'csv': os.path.join(self.tmp.name, 'csv'), 'parquet': os.path.join(self.tmp.name, 'parquet'),
+                   'xlsx': os.path.join(self.tmp.name, 'results.xlsx')}
+        rows = {fmt: export.exportAthlete(path, self.workout, self.dietary, athlete='ana', fmt=fmt)
+                for fmt, path in outputs.items()}
+        self.assertEqual(rows['csv'], rows['parquet'])
+        self.assertEqual(rows['csv'], rows['xlsx'])
+        self.assertEqual(list(rows['csv']), export.SHEETS)
+        self.assertEqual(rows['csv']['Workout'], len(self.workout))
+        parquet = pd.read_parquet(os.path.join(outputs['parquet'], 'Nutrition.parquet'))
+        workbook = pd.read_excel(outputs['xlsx'], sheet_name=None)
+        self.assertEqual(list(workbook), export.SHEETS)
+        for frame in (parquet, pd.read_csv(os.path.join(outputs['csv'], 'Nutrition.csv')), workbook['Nutrition']):
+            self.assertEqual(list(frame.columns[:2]), ['Athlete', 'Exercise'])
+            np.testing.assert_allclose(frame['Score'], parquet['Score'])
+
+    def test_chunked_writes_keep_one_layout(self):
+        """\nChunks and later athletes are appended under the first chunk's header, and xlsx uses write-only mode."""
+        path = os.path.join(self.tmp.name, 'chunks.xlsx')
+        with export.Exporter(path, chunksize=7) as exporter:
+            self.assertTrue(exporter._workbook.write_only)
+            exporter.write('Combined', self.dietary.head(20).assign(Athlete='ana'))
+            exporter.write('Combined', self.dietary.head(5).assign(Athlete='ben').iloc[:, ::-1])
+        back = pd.read_excel(path)
+        self.assertEqual(len(back), 25)
+        self.assertEqual(list(back.columns), list(self.dietary.columns) + ['Athlete'])
+        self.assertEqual(back['Athlete'].value_counts().to_dict(), {'ana': 20, 'ben': 5})
+
+    def test_many_athletes_in_one_export(self):
+        """\nA batch export stacks every athlete in each table and reports the ones that failed."""
+        jobs = []
+        for name in ('ana', 'ben'):
+            workout_path = synthetic.writeExcel(self.workout.head(150)[['Date', 'Exercise', 'Weight (kg)', 'Sets', 'Reps']],
+                                                os.path.join(self.tmp.name, f'{name}_workout.xlsx'))
+            diet_path = synthetic.writeExcel(self.dietary.drop(columns='Calorie Category'),
+                                             os.path.join(self.tmp.name, f'{name}_diet.xlsx'))
+            jobs.append({'Athlete': name, 'Workout': workout_path, 'Diet': diet_path})
+        jobs.append({'Athlete': 'cy', 'Workout': os.path.join(self.tmp.name, 'missing.xlsx'), 'Diet': diet_path})
+        output = os.path.join(self.tmp.name, 'all')
+        rows, errors = export.exportAthletes(jobs, output, 'parquet', workers=2)
+        self.assertEqual(list(errors), ['cy'])
+        workout = pd.read_parquet(os.path.join(output, 'Workout.parquet'))
+        self.assertEqual(workout['Athlete'].value_counts().to_dict(), {'ana': 150, 'ben': 150})
+        self.assertEqual(rows['Workout'], 300)
+        forecasts = pd.read_parquet(os.path.join(output, 'Forecasts.parquet'))
+        self.assertEqual(set(forecasts['Athlete']), {'ana', 'ben'})
+
+    def test_parquet_after_an_empty_table(self):
+        """\nAn athlete without calorie changepoints doesn't fix the parquet schema for the ones after."""
+        dietary = self.dietary.drop(columns='Calorie Category')
+        # ben's calories jump halfway through the logged sessions
+        change = self.workout.head(150)['Date'].iloc[75]
+        jobs = []
+        for name, calories in (('ana', np.full(len(dietary), 2500.0)),
+                               ('ben', np.where(dietary['Date'] < change, 2000.0, 3200.0))):
+            workout_path = synthetic.writeExcel(self.workout.head(150)[['Date', 'Exercise', 'Weight (kg)', 'Sets', 'Reps']],
+                                                os.path.join(self.tmp.name, f'{name}_workout.xlsx'))
+            diet_path = synthetic.writeExcel(dietary.assign(Calories=calories), os.path.join(self.tmp.name, f'{name}_diet.xlsx'))
+            jobs.append({'Athlete': name, 'Workout': workout_path, 'Diet': diet_path})
+        output = os.path.join(self.tmp.name, 'typed')
+        rows, errors = export.exportAthletes(jobs, output, 'parquet', workers=1)
+        self.assertEqual(errors, {})
+        ttests = pd.read_parquet(os.path.join(output, 'T-tests.parquet'))
+        self.assertEqual(set(ttests['Athlete']), {'ben'})
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(ttests['Date']))
+        # nothing but empty chunks still leaves a readable file
+        with export.Exporter(os.path.join(self.tmp.name, 'empty'), 'parquet') as exporter:
+            exporter.write('T-tests', ttests.iloc[:0])
+        self.assertEqual(len(pd.read_parquet(os.path.join(self.tmp.name, 'empty', 'T-tests.parquet'))), 0)
+
+class LiftForecasts(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(20)
+        # irregular training days: gaps of 2 to 4 days
+        days = np.cumsum(rng.integers(2, 5, size=150))
+        dates = pd.Timestamp('2023-01-01') + pd.to_timedelta(days - days[0], unit='D')
+        elapsed = (days - days[0]).astype(float)
+        self.frame = pd.concat([
+            pd.DataFrame({'Date': dates, 'Exercise': 'Squat', 'Weight (kg)': 100 + 0.25 * elapsed}),
+            pd.DataFrame({'Date': dates, 'Exercise': 'Deadlift',
+                          'Weight (kg)': 200 - 80 * np.exp(-elapsed / 90) + rng.normal(0, 0.5, len(days))}),
+        ], ignore_index=True)
+        self.elapsed = elapsed
+
+    def test_elapsed_days_and_cadence(self):
+        """\nThe straight line is fit against days, not rows, and future sessions follow the median gap."""
+        table = forecast.forecastLifts(self.frame, 4, model='linear')
+        squat = table[table['Exercise'] == 'Squat']
+        cadence = np.median(np.diff(self.elapsed))
+        self.assertEqual(squat['Cadence (days)'].iloc[0], cadence)
+        np.testing.assert_allclose(squat['Slope'], 0.25)
+        np.testing.assert_allclose(squat['Days'], self.elapsed[-1] + cadence * np.arange(1, 5))
+        np.testing.assert_allclose(squat['Predicted'], 100 + 0.25 * squat['Days'])
+        self.assertEqual(list(squat['Date']), list(self.frame['Date'].iloc[149] + pd.to_timedelta(squat['Days'] - self.elapsed[-1], unit='D')))
+
+    def test_auto_picks_saturating_curve(self):
+        """\nA lift that levels off gets the saturating model, and its forecast stays under the ceiling."""
+        table = forecast.forecastLifts(self.frame, 50, cadence=14)
+        deadlift = table[table['Exercise'] == 'Deadlift']
+        self.assertEqual(deadlift['Model'].iloc[0], 'saturating')
+        self.assertLess(deadlift['Predicted'].max(), 202)
+        self.assertTrue((deadlift['Lower'] < deadlift['Predicted']).all() and (deadlift['Predicted'] < deadlift['Upper']).all())
+        linear = forecast.forecastLifts(self.frame, 50, model='linear', cadence=14)
+        self.assertGreater(linear[linear['Exercise'] == 'Deadlift']['Predicted'].max(), 210)
+
+    def test_grouped_matches_single_fits(self):
+        """\nFitting every athlete and lift at once gives the same forecasts as one group at a time."""
+        workout = processWorkout(synthetic.generateWorkout(3000, athletes=3, years=2, seed=20))
+        together = forecast.forecastLifts(workout, 3)
+        self.assertEqual(len(together), 3 * workout.groupby(['Athlete', 'Exercise'], observed=True).ngroups)
+        for (athlete, exercise), expected in together.groupby(['Athlete', 'Exercise'], observed=True):
+            single = forecast.forecastLifts(workout[(workout['Athlete'] == athlete) & (workout['Exercise'] == exercise)], 3)
+            np.testing.assert_allclose(single['Predicted'], expected['Predicted'], rtol=1e-9)
+            self.assertEqual(single['Model'].iloc[0], expected['Model'].iloc[0])
+
+    def test_length_buckets_match_one_batch(self):
+        """\nGroups of very different lengths fitted in several small batches give the one-batch forecasts."""
+        short = self.frame.groupby('Exercise').head(12).assign(Exercise=lambda frame: frame['Exercise'] + ' (new)')
+        frame = pd.concat([self.frame, short], ignore_index=True)
+        self.assertEqual(len(forecast._buckets(frame.groupby('Exercise').size().to_numpy())), 2)
+        together = forecast.forecastLifts.uncached(frame, 3)
+        limit = forecast.MAX_BATCH_CELLS
+        forecast.MAX_BATCH_CELLS = 100
+        try:
+            batched = forecast.forecastLifts.uncached(frame, 3)
+        finally:
+            forecast.MAX_BATCH_CELLS = limit
+        pd.testing.assert_frame_equal(batched, together)
+
+    def test_series_for_the_chart(self):
+        """\nforecastSeries picks one lift out of the batched forecast and keeps the interval for drawing."""
+        series = visualization.forecastSeries(self.frame, 'Squat', 3)
+        self.assertEqual(len(series['Future Dates']), 3)
+        self.assertTrue((series['Future Lower'] < series['Future Upper']).all())
+        self.assertAlmostEqual(series['Slope'], 0.25)
+        with self.assertRaises(ValueError):
+            visualization.forecastSeries(self.frame, 'Curl')
+
+class CopyFreePipeline(unittest.TestCase):
+    def setUp(self):
+        workout, dietary = synthetic.generatePair(400000, athletes=4, years=3, seed=21)
+        self.workout = schema.applyWorkoutSchema(workout)
+        self.dietary = schema.applyDietarySchema(dietary)
+
+    @staticmethod
+    def peak(function, *args, **kwargs):
+        # (result, bytes allocated at the peak of the call)
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            result = function(*args, **kwargs)
+            return result, tracemalloc.get_traced_memory()[1] - base
+        finally:
+            tracemalloc.stop()
+
+    @staticmethod
+    def size(frame):
+        return frame.memory_usage(deep=True).sum()
+
+    def test_stages_leave_inputs_alone(self):
+        """\nProcessing and aligning never add columns to or change the caller's frames, and never warn."""
+        import warnings
+        workout, dietary = self.workout.copy(), self.dietary.copy()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', pd.errors.SettingWithCopyWarning)
+            processed = processWorkout(self.workout)
+            diet = processDietary(self.dietary)
+            standardize_weights(self.workout)
+            AlignDataforNutrition(self.dietary, self.workout)
+        pd.testing.assert_frame_equal(self.workout, workout)
+        pd.testing.assert_frame_equal(self.dietary, dietary)
+        self.assertIn('Weight (kg)_std', processed.columns)
+        self.assertIn('Calorie Category', diet.columns)
+
+    def test_peak_memory(self):
+        """\nDerived columns aren't recomputed and datasets share the processed frames instead of copying them."""
+        processed, peak = self.peak(processWorkout, self.workout)
+        # the filtered rows, the new columns and at most one frame sized temporary
+        self.assertLess(peak, self.size(processed) + 2 * self.size(self.workout))
+        again, peak = self.peak(standardize_weights, processed)
+        self.assertIs(again, processed)
+        self.assertLess(peak, 1000)
+        ordered = processed.sort_values('Date', kind='stable', ignore_index=True)
+        diet = processDietary(self.dietary)
+        dataset, peak = self.peak(CombinedDataset, ordered, diet)
+        self.assertLess(peak, 0.05 * (self.size(ordered) + self.size(diet)))
+        self.assertTrue(np.shares_memory(dataset.workout['Weight (kg)_std'].to_numpy(), ordered['Weight (kg)_std'].to_numpy()))
+
+    def test_forced_restandardize(self):
+        """\nforce=True recomputes the column on a copy, inplace=True writes to the frame it was given."""
+        processed = processWorkout(self.workout.head(1000))
+        registry = RatioRegistry({'Bench Press': 1, 'Squat': 1, 'Deadlift': 1})
+        forced = standardize_weights(processed, registry, force=True)
+        np.testing.assert_allclose(forced['Weight (kg)_std'], forced['Weight (kg)'])
+        self.assertFalse(np.allclose(processed['Weight (kg)_std'], processed['Weight (kg)']))
+        standardize_weights(processed, registry, inplace=True, force=True)
+        np.testing.assert_allclose(processed['Weight (kg)_std'], processed['Weight (kg)'])
+
+class LocalService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import asyncio
+        from concurrent.futures import ProcessPoolExecutor
+        cls.tmp = tempfile.TemporaryDirectory()
+        workout, dietary = synthetic.generatePair(800, years=1, seed=22)
+        cls.workout_path = synthetic.writeExcel(workout, os.path.join(cls.tmp.name, 'workout.xlsx'))
+        cls.diet_path = synthetic.writeExcel(dietary, os.path.join(cls.tmp.name, 'diet.xlsx'))
+        cls.executor = ProcessPoolExecutor(max_workers=2)
+        cls.service = service.AnalysisService(executor=cls.executor)
+        cls.loop = asyncio.new_event_loop()
+        cls.thread = threading.Thread(target=cls.loop.run_forever, daemon=True)
+        cls.thread.start()
+        cls.server = asyncio.run_coroutine_threadsafe(service.startServer(cls.service, port=0), cls.loop).result()
+        cls.port = cls.server.sockets[0].getsockname()[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(5)
+        cls.executor.shutdown()
+        cls.tmp.cleanup()
+
+    def request(self, method, path, body=None, connection=None):
+        import http.client
+        connection = connection or http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        data = body if isinstance(body, (str, bytes)) or body is None else json.dumps(body)
+        connection.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def register(self):
+        status, body = self.request('POST', '/datasets', {'athlete': 'ana', 'workout': self.workout_path,
+                                                          'diet': self.diet_path})
+        self.assertEqual(status, 200, body)
+        return body['dataset']
+
+    def test_endpoints(self):
+        """\nLoading, every analysis and a rendered chart come back as json over localhost."""
+        self.assertEqual(self.request('GET', '/health'), (200, {'status': 'ok'}))
+        status, loaded = self.request('POST', '/process', {'path': self.workout_path, 'kind': 'workout'})
+        self.assertEqual(status, 200)
+        self.assertIn('Total Volume', loaded['summary']['Columns'])
+        dataset = self.register()
+        status, correlation = self.request('POST', '/correlate', {'dataset': dataset})
+        self.assertEqual(status, 200)
+        self.assertEqual([row['Variable'] for row in correlation['result']], analysis.CORRELATION_COLUMNS)
+        status, nutrition = self.request('POST', '/nutrition', {'dataset': dataset})
+        self.assertEqual(sorted(row['Exercise'] for row in nutrition['result']), ['Bench Press', 'Deadlift', 'Squat'])
+        status, effect = self.request('POST', '/effectiveness', {'dataset': dataset, 'date': '2020-06-01'})
+        self.assertEqual(sorted(effect['result']), ['P-value', 'T-statistic'])
+        status, future = self.request('POST', '/forecast', {'dataset': dataset, 'exercise': 'Squat', 'future_sessions': 3,
+                                                            'chart': 'png'})
+        self.assertEqual(status, 200, future)
+        self.assertEqual(len(future['result']), 3)
+        self.assertTrue(base64.b64decode(future['chart']['data']).startswith(b'\x89PNG'))
+        status, predict = self.request('POST', '/predict', {'workout': self.workout_path, 'diet': self.diet_path})
+        self.assertEqual((status, predict['dataset']), (200, dataset))
+        self.assertIn('Calories Coefficient', predict['result'])
+
+    def test_identical_requests_are_coalesced(self):
+        """\nConcurrent requests for the same dataset and options are computed once."""
+        import asyncio
+        dataset = self.register()
+        before = dict(self.service.stats)
+        payload = {'dataset': dataset, 'date': '2020-05-01', 'correction': 'none'}
+
+        async def together():
+            return await asyncio.gather(*[self.service.handle('POST', '/effectiveness', dict(payload)) for _ in range(6)])
+        results = asyncio.run_coroutine_threadsafe(together(), self.loop).result(60)
+        self.assertEqual({status for status, _ in results}, {200})
+        self.assertEqual(len({json.dumps(body, sort_keys=True) for _, body in results}), 1)
+        self.assertEqual(self.service.stats['computed'] - before['computed'], 1)
+        self.assertEqual(self.service.stats['coalesced'] - before['coalesced'], 5)
+
+    def test_errors_and_keep_alive(self):
+        """\nBad requests get json errors with the right status, and one connection can carry several requests."""
+        import http.client
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        self.assertEqual(self.request('POST', '/correlate', {'dataset': 'nope'}, connection)[0], 404)
+        self.assertEqual(self.request('POST', '/correlate', '{not json', connection)[0], 400)
+        self.assertEqual(self.request('GET', '/correlate', None, connection)[0], 405)
+        self.assertEqual(self.request('GET', '/elsewhere', None, connection)[0], 404)
+        self.assertEqual(self.request('POST', '/load', {'path': os.path.join(self.tmp.name, 'missing.xlsx')}, connection)[0], 404)
+        status, body = self.request('POST', '/nutrition', {'dataset': self.register(), 'chart': 'png'}, connection)
+        self.assertEqual(status, 400)
+        self.assertIn('no chart', body['error'])
+        connection.close()
+        with socket.create_connection(('127.0.0.1', self.port), timeout=60) as raw:
+            raw.sendall(b'POST /correlate HTTP/1.1\r\nContent-Length: many\r\n\r\n')
+            self.assertTrue(raw.recv(1024).startswith(b'HTTP/1.1 400'))
+
+    def test_workers_keep_datasets(self):
+        """\nAn analysis only sends the dataset id, a worker without the dataset loads it from its sources once."""
+        sources = (self.workout_path, self.diet_path, 'ana')
+        dataset_id = service.prepareDataset(*sources)['dataset']
+        service._loaded.clear()
+        with self.assertRaises(service._Unloaded):
+            service.runAnalysis('nutrition', dataset_id, {})
+        first = service.runAnalysis('nutrition', dataset_id, {}, sources)
+        self.assertEqual(service.runAnalysis('nutrition', dataset_id, {}), first)
+        self.assertEqual(list(service._loaded), [dataset_id])
+
+class ChartRollups(unittest.TestCase):
+    def setUp(self):
+        workout, dietary = synthetic.generatePair(6000, athletes=1, years=3, seed=9)
+        self.workout = processWorkout(workout)
+        self.dietary = processDietary(dietary)
+        self.raw = self.workout[['Date', 'Exercise', 'Weight (kg)', 'Sets', 'Reps']]
+        self.log = TrainingLog()
+        self.log.setDietary(self.dietary)
+        months = self.raw['Date'].dt.to_period('M')
+        for month in months.unique():
+            self.log.appendWorkout(self.raw[months == month], policy='dedup')
+
+    def test_incremental_matches_batch(self):
+        """\nRollups appended month by month equal rolling up the whole history at once, at every level."""
+        for level in downsample.LEVELS:
+            batch_table = downsample.liftRollup(self.log.workout, level)
+            pd.testing.assert_frame_equal(self.log.rollups.liftTable(level), batch_table, check_dtype=False)
+        weekly = downsample.liftRollup(self.log.workout, 'week')
+        self.assertTrue((weekly['Date'].dt.dayofweek == 0).all())
+        self.assertAlmostEqual(weekly['Total Volume'].sum(), self.log.workout['Total Volume'].sum(), places=3)
+
+    def test_summaries_match_combined_frame(self):
+        """\nMacro means and the current lift from the rollups are what the combined frame gives."""
+        combined = self.log.combined
+        pd.testing.assert_series_equal(visualization.macroMeans(self.log.rollups), visualization.macroMeans(combined))
+        for exercise in ['Squat', 'Bench Press', 'Not A Lift']:
+            self.assertEqual(visualization.currentLift(self.log.rollups, exercise),
+                             visualization.currentLift(combined.sort_values('Date', kind='stable'), exercise))
+
+    def test_gains_fit_the_plot(self):
+        """\nA long history is cut down to the plot width and still keeps each lift's best day."""
+        series = visualization.gainsSeries(self.log.rollups, points=60)
+        from_frame = visualization.gainsSeries(self.log.workout, points=60)
+        for exercise, line in series.items():
+            self.assertLessEqual(len(line), 60)
+            self.assertTrue(line['Date'].is_monotonic_increasing)
+            best = self.workout.loc[self.workout['Exercise'] == exercise, 'Weight (kg)'].max()
+            self.assertEqual(line['Weight (kg)'].max(), best)
+            pd.testing.assert_frame_equal(line, from_frame[exercise])
+
+    def test_decimation_keeps_shape(self):
+        """\nLTTB and min/max keep the endpoints and the extremes, short lines are left alone."""
+        x = np.arange(10000, dtype=float)
+        y = np.sin(x / 300) + (x == 4321) * 5
+        for method in (downsample.lttb, downsample.minMax):
+            picked = method(x, y, 200)
+            self.assertLessEqual(len(picked), 200)
+            self.assertEqual((picked[0], picked[-1]), (0, 9999))
+            self.assertIn(4321, picked)
+            self.assertTrue((np.diff(picked) > 0).all())
+            np.testing.assert_array_equal(method(x[:50], y[:50], 200), np.arange(50))
+        with self.assertRaises(ValueError):
+            downsample.decimate(pd.DataFrame({'x': x, 'y': y}), 'x', 'y', 100, method='random')
+
+class ReportDossiers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        dates = pd.date_range('2024-01-01', periods=8).strftime('%m/%d/%Y')
+        self.workout = pd.DataFrame({
+            'Date': dates, 'Exercise': ['Squat', 'Bench Press'] * 4,
+            'Weight (kg)': [100, 80, 105, 82, 110, 85, 112, 86], 'Sets': 3, 'Reps': 5
+        })
+        diet = pd.DataFrame({
+            'Date': dates, 'Calories': [2000, 2400, 2200, 2600, 2500, 2700, 2300, 2800],
+            'Protein (g)': [150, 160, 155, 170, 165, 175, 158, 180],
+            'Carbs (g)': [200, 260, 230, 300, 280, 310, 240, 320], 'Fats (g)': [60, 65, 62, 70, 68, 72, 63, 75]
+        })
+        for athlete in ('ana', 'ben'):
+            self.workout.to_excel(os.path.join(self.tmp.name, f'{athlete}_workout.xlsx'), index=False)
+            diet.to_excel(os.path.join(self.tmp.name, f'{athlete}_diet.xlsx'), index=False)
+        # cy has no diet file
+        self.workout.to_excel(os.path.join(self.tmp.name, 'cy_workout.xlsx'), index=False)
+        self.jobs = batch.discoverAthletes(self.tmp.name)
+        self.output = os.path.join(self.tmp.name, 'reports')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_html_reports_and_chart_cache(self):
+        """\nEvery athlete gets a page with all charts, a rerun redraws nothing and changed data only redraws its own charts."""
+        results, totals = reports.generateReports(self.jobs, self.output, workers=2)
+        self.assertEqual(list(results['Status']), ['ok', 'ok', 'error'])
+        self.assertEqual((totals['Reports'], totals['Failed']), (2, 1))
+        self.assertGreater(totals['Reports/min'], 0)
+        with open(results['Report'].iloc[0]) as handle:
+            page = handle.read()
+        self.assertEqual(page.count('<img'), results['Charts'].iloc[0])
+        for table in ['Correlations', 'Nutrition', 'T-tests', 'Forecasts']:
+            self.assertIn(f'<h2>{table}</h2>', page)
+        # both athletes have the same data, so the second one's charts may already be cached
+        self.assertEqual(totals['Charts Drawn'] + totals['Charts Unchanged'], 2 * results['Charts'].iloc[0])
+
+        _, totals = reports.generateReports(self.jobs, self.output, workers=1)
+        self.assertEqual(totals['Charts Drawn'], 0)
+
+        self.workout.loc[6, 'Weight (kg)'] = 130
+        self.workout.to_excel(os.path.join(self.tmp.name, 'ben_workout.xlsx'), index=False)
+        results, totals = reports.generateReports(self.jobs, self.output, workers=1)
+        self.assertEqual(results['Drawn'].iloc[0], 0)
+        self.assertGreater(results['Drawn'].iloc[1], 0)
+        self.assertGreater(results['Unchanged'].iloc[1], 0)
+
+    def test_pdf_report(self):
+        """\nA pdf dossier from the command line, with the throughput printed."""
+        with contextlib.redirect_stdout(io.StringIO()) as printed:
+            status = optilift.main(['report', self.tmp.name, '-o', self.output, '--format', 'pdf', '-w', '1', '--no-cache'])
+        self.assertEqual(status, 1)
+        self.assertIn('reports/min', printed.getvalue())
+        self.assertIn('cy: FileNotFoundError', printed.getvalue())
+        with open(os.path.join(self.output, 'ana.pdf'), 'rb') as handle:
+            self.assertEqual(handle.read(5), b'%PDF-')
+        self.assertFalse(os.path.exists(os.path.join(self.output, reports.CHART_CACHE)))
+
+    def test_caches_are_reused_and_bounded(self):
+        """\nAnalyses are cached on disk next to the charts, and both caches are cut back to their size limit."""
+        previous = memo.results
+        reports.generateReports(self.jobs, self.output, workers=1)
+        self.assertIs(memo.results, previous)
+        results_dir = os.path.join(self.output, reports.RESULT_CACHE)
+        self.assertTrue(any(name.endswith('.pkl') for name in os.listdir(results_dir)))
+        charts_dir = os.path.join(self.output, reports.CHART_CACHE)
+        self.assertTrue(os.listdir(charts_dir))
+        reports.generateReports(self.jobs, self.output, workers=1, max_cache_bytes=1)
+        self.assertEqual(os.listdir(charts_dir), [])
+        self.assertFalse(any(name.endswith('.pkl') for name in os.listdir(results_dir)))
+
 if __name__ == '__main__':
     unittest.main(argv=[''], verbosity=2, exit=False)
\ No newline at end of file
@@ -1,98 +1,204 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
-from sklearn.linear_model import LinearRegression
-import pandas as pd
-
-def MacroDist(combined_data):
+import forecast
+import downsample
+from profiling import instrument
+
+# each chart is split in three: a compute function that returns data, a draw function that
+# fills a matplotlib Figure (no pyplot state) and the original name which shows it in a window
+# render.py uses the first two to draw charts off-screen
+# pyplot and seaborn are only imported when a chart is actually drawn
+# macroMeans, gainsSeries and currentLift also take a downsample.Rollups, which answers from
+# pre-aggregated summaries instead of scanning every row
+
+COMPOUND_LIFTS = ['Bench Press', 'Squat', 'Deadlift']
+MACRO_COLUMNS = ['Protein (g)', 'Carbs (g)', 'Fats (g)']
+
+FIGSIZES = {
+    'macros': (8, 8),
+    'gains': (12, 15),
+    'progress': (6.4, 4.8),
+    'heatmap': (12, 10),
+    'forecast': (10, 5),
+    'performance': (10, 6),
+}
+
+
+@instrument
+def macroMeans(combined_data):
+    if isinstance(combined_data, downsample.Rollups):
+        return combined_data.macroMeans()[MACRO_COLUMNS]
     # Calculate the mean of macronutrients across all available data
-    mean_values = combined_data[['Protein (g)', 'Carbs (g)', 'Fats (g)']].mean()
+    return combined_data[MACRO_COLUMNS].mean()
+
 
+@instrument
+def drawMacroDist(fig, mean_values):
     # Prepare labels and values for the pie chart
-    nutrients = ['Protein (g)', 'Carbs (g)', 'Fats (g)']
-    values = [mean_values[nutrient] for nutrient in nutrients]
+    values = [mean_values[nutrient] for nutrient in MACRO_COLUMNS]
+
+    ax = fig.add_subplot()
+    ax.pie(values, labels=MACRO_COLUMNS, autopct='%1.1f%%', startangle=140)
+    ax.set_title('Average Macronutrient Distribution')
+    ax.axis('equal')  # This makes the pie chart circular
+    return fig
+
 
+def MacroDist(combined_data):
+    import matplotlib.pyplot as plt
     # Plotting the pie chart
-    plt.figure(figsize=(8, 8))  # Set the figure size for better visibility
-    plt.pie(values, labels=nutrients, autopct='%1.1f%%', startangle=140)
-    plt.title('Average Macronutrient Distribution')
-    plt.axis('equal')  # This makes the pie chart circular
+    fig = plt.figure(figsize=FIGSIZES['macros'])  # Set the figure size for better visibility
+    drawMacroDist(fig, macroMeans(combined_data))
     plt.show()
 
-def gains(combined_data):
-    plt.figure(figsize=(12, 15))
-    exercises = ['Bench Press', 'Squat', 'Deadlift'] #compound lifts
 
+@instrument
+def gainsSeries(combined_data, exercises=COMPOUND_LIFTS, points=None):
+    # best weight per day for each exercise, per week or month and then LTTB-thinned
+    # when the history has more days than the plot has room for
+    points = downsample.pointsFor(FIGSIZES['gains']) if points is None else points
+    return downsample.liftSeries(combined_data, exercises, points)
+
+
+@instrument
+def drawGains(fig, series):
+    ax = fig.add_subplot()
     # loop through each exercise and plot its data
-    for exercise in exercises:
-        exercise_data = combined_data[combined_data['Exercise'] == exercise]
-        plt.plot(exercise_data['Date'], exercise_data['Weight (kg)'], label=exercise)
-
-   
-    plt.title('Strength Gains Over Time')
-    plt.xlabel('Date')
-    plt.ylabel('Max Weight Lifted (kg)')
-    plt.legend()
+    for exercise, exercise_data in series.items():
+        ax.plot(exercise_data['Date'], exercise_data['Weight (kg)'], label=exercise)
+
+    ax.set_title('Strength Gains Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Max Weight Lifted (kg)')
+    ax.legend()
+    return fig
+
+
+def gains(combined_data):
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=FIGSIZES['gains'])
+    drawGains(fig, gainsSeries(combined_data)) #compound lifts
     plt.show()
 
-def exerciseProgress(combined_data, exercise, goal_value):
+
+@instrument
+def currentLift(combined_data, exercise):
+    if isinstance(combined_data, downsample.Rollups):
+        return combined_data.currentLift(exercise)
     # find data for the exercise chosen
     exercise_data = combined_data[combined_data['Exercise'] == exercise]
     # check if there is any data, and get the last recorded weight
     if not exercise_data.empty:
-        current_value = exercise_data.iloc[-1]['Weight (kg)']  # get the most recent weight
-    else:
-        current_value = 0  # set to 0 if no data exists
+        return exercise_data.iloc[-1]['Weight (kg)']  # get the most recent weight
+    return 0  # set to 0 if no data exists
 
-    # create a figure and axis for the bar plot
-    fig, ax = plt.subplots()
+
+@instrument
+def drawProgress(fig, exercise, current_value, goal_value):
+    ax = fig.add_subplot()
     # make a horizontal bar for current pr
     ax.barh([exercise], [current_value], color='lightblue')
-    # draw a vertical line for the goal value 
+    # draw a vertical line for the goal value
     ax.axvline(x=goal_value, color='green', label=f'Goal for {exercise}')
     # acommodate the xaxis for largest value
     ax.set_xlim(0, max(goal_value, current_value) + 10)
     ax.set_xlabel('Weight Lifted (kg)')
     ax.set_title(f'Progress Towards Goal for {exercise}')
-    plt.legend()
-    plt.show()
+    ax.legend()
+    return fig
 
-def heatmap(correlation_matrix):
-    plt.figure(figsize=(12,10))
-    sns.heatmap(correlation_matrix, annot=True, cmap='plasma')
-    plt.title("Correlation between Dietary Metrics and Workout Total Volume")
+
+def exerciseProgress(combined_data, exercise, goal_value):
+    import matplotlib.pyplot as plt
+    # create a figure and axis for the bar plot
+    fig = plt.figure(figsize=FIGSIZES['progress'])
+    drawProgress(fig, exercise, currentLift(combined_data, exercise), goal_value)
     plt.show()
 
-def forecastLift(combined_data, exercise, future_sessions=5):
-    # filter data for the specific exercise
-    exercise_data = combined_data[combined_data['Exercise'] == exercise]
-    exercise_data = exercise_data.sort_values('Date')  # Ensure data is sorted by date
 
-    
-    X = np.arange(len(exercise_data)).reshape(-1, 1)
-    y = exercise_data['Weight (kg)'].values
+@instrument
+def drawHeatmap(fig, correlation_matrix):
+    import seaborn as sns
+    ax = fig.add_subplot()
+    sns.heatmap(correlation_matrix, annot=True, cmap='plasma', ax=ax)
+    ax.set_title("Correlation between Dietary Metrics and Workout Total Volume")
+    return fig
 
-    model = LinearRegression()
-    model.fit(X, y)
 
-    # create dates for predictions
-    last_date = pd.to_datetime(exercise_data['Date'].iloc[-1])
-    future_dates = [last_date + pd.DateOffset(days=30*i) for i in range(1, future_sessions+1)]
+def heatmap(correlation_matrix):
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=FIGSIZES['heatmap'])
+    drawHeatmap(fig, correlation_matrix)
+    plt.show()
 
-    # predict future values
-    future_X = np.arange(len(X), len(X) + future_sessions).reshape(-1, 1)
-    future_predictions = model.predict(future_X)
 
+@instrument
+def forecastSeries(combined_data, exercise, future_sessions=5, model='auto'):
+    # filter data for the specific exercise
+    exercise_data = combined_data[combined_data['Exercise'] == exercise]
+    exercise_data = exercise_data.sort_values('Date')  # Ensure data is sorted by date
+    if exercise_data.empty:
+        raise ValueError(f'no sessions of {exercise!r} to forecast')
+
+    # every lift is forecast in one batch and memoized, so the next lift asked for is a lookup
+    # days since the first session are the regressor and future sessions follow the usual gap between sessions
+    forecasts = forecast.forecastLifts(combined_data, future_sessions, model=model, by=['Exercise'])
+    future = forecasts[forecasts['Exercise'] == exercise]
+
+    return {
+        'Exercise': exercise,
+        'Dates': exercise_data['Date'].to_numpy(),
+        'Weights': exercise_data['Weight (kg)'].to_numpy(),
+        'Future Dates': future['Date'].to_numpy(),
+        'Future Predictions': future['Predicted'].to_numpy(),
+        'Future Lower': future['Lower'].to_numpy(),
+        'Future Upper': future['Upper'].to_numpy(),
+        'Model': future['Model'].iloc[0],
+        'Intercept': future['Intercept'].iloc[0],
+        'Slope': future['Slope'].iloc[0],
+    }
+
+
+@instrument
+def drawForecast(fig, forecast):
+    ax = fig.add_subplot()
     # plot historical data
-    plt.figure(figsize=(10, 5))
-    plt.plot(exercise_data['Date'], y, label='Historical Data', marker='o')
+    ax.plot(forecast['Dates'], forecast['Weights'], label='Historical Data', marker='o')
 
     # plot predictions
-    plt.plot(future_dates, future_predictions, 'r--', label='Predicted Future Weights')
-    plt.xlabel('Date')
-    plt.ylabel('Weight Lifted (kg)')
-    plt.title(f'Historical Data and Predictions for {exercise}')
-    plt.legend()
-    plt.xticks(rotation=45)
+    ax.plot(forecast['Future Dates'], forecast['Future Predictions'], 'r--', label='Predicted Future Weights')
+    if 'Future Lower' in forecast:
+        ax.fill_between(forecast['Future Dates'], forecast['Future Lower'], forecast['Future Upper'],
+                        color='red', alpha=0.15, label='Prediction Interval')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Weight Lifted (kg)')
+    ax.set_title(f"Historical Data and Predictions for {forecast['Exercise']}")
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
 
+
+def forecastLift(combined_data, exercise, future_sessions=5):
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=FIGSIZES['forecast'])
+    drawForecast(fig, forecastSeries(combined_data, exercise, future_sessions))
     plt.show()
+
+
+@instrument
+def drawPerformance(fig, performance):
+    # scatter of calories against volume with the fitted line from analysis.performanceModel
+    ax = fig.add_subplot()
+    ax.scatter(performance['Calories'], performance['Total Volume'], color='blue', label='Actual data')
+    ax.plot(performance['Calories'], performance['Predictions'], color='red', label='Prediction')
+
+    # give future predictions
+    ax.plot(performance['Future Calories'], performance['Future Predictions'], color='red', linestyle='--', label='Future Predictions')
+    if 'Future Lower' in performance:
+        ax.fill_between(performance['Future Calories'], performance['Future Lower'], performance['Future Upper'],
+                        color='red', alpha=0.15, label='Prediction Interval')
+
+    ax.set_title('Linear Regression to Predict Total Volume from Calories')
+    ax.set_xlabel('Calories')
+    ax.set_ylabel('Total Volume')
+    ax.legend()
+    ax.grid(True)
+    return fig